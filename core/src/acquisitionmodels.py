@@ -15,13 +15,16 @@ from . import var
 from .datatypes import Map, Tod, combine_sliced_shape, flatten_sliced_shape, validate_sliced_shape
 from .numpyutils import _my_isscalar
 from .processing import interpolate_linear
+from .profiling import _record_allocation
 from .quantity import Quantity, UnitError, _divide_unit, _multiply_unit
+from .stringutils import strenum
 from .utils import diff, diffT, diffTdiff, shift
 
 __all__ = [
     'AcquisitionModel',
     'AcquisitionModelLinear',
     'AllReduce',
+    'BlockDiagonal',
     'CircularShift',
     'CompressionAverage',
     'Convolution',
@@ -37,6 +40,7 @@ __all__ = [
     'Masking',
     'Padding',
     'Projection',
+    'ProjectionNormal',
     'Reshaping',
     'ResponseTruncatedExponential',
     'Scalar',
@@ -123,6 +127,21 @@ class AcquisitionModel(object):
     def direct(self, input, inplace, cachein, cacheout):
         raise NotImplementedError()
 
+    def direct_batch(self, input):
+        """
+        Apply the acquisition model to a stack of inputs along the first
+        dimension, such as (nmaps, ny, nx), and return the stack of outputs.
+        By default, the inputs are processed one at a time. The models which
+        can process the whole stack in a single pass override this method.
+        """
+        return _apply_batch(self.direct, input)
+
+    def simplify(self):
+        """
+        Return an equivalent acquisition model, which is cheaper to apply.
+        """
+        return self
+
     @property
     def shape(self):
         shape = (np.product(flatten_sliced_shape(self.shapeout)),
@@ -236,8 +255,9 @@ class AcquisitionModel(object):
                       str(input.dtype.itemsize * input.size / 2.**20) + \
                       ' MiB in ' + self.description + '.')
             input = input.copy()
+            _record_allocation(input.nbytes)
 
-        for k,v in self.attrin:
+        for k,v in self.attrin.items():
             setattr(input, k, v)
 
         return input
@@ -304,6 +324,7 @@ class AcquisitionModel(object):
                 output = np.empty(shapeout_flat, self.dtype)
             else:
                 output = typeout.empty(shapeout, dtype=self.dtype)
+            _record_allocation(output.nbytes)
 
             # validate output
             if type(shapeout[-1]) is tuple:
@@ -407,6 +428,13 @@ class AcquisitionModelLinear(AcquisitionModel, LinearOperator):
     def transpose(self, input, inplace, cachein, cacheout):
         raise NotImplementedError()
 
+    def transpose_batch(self, input):
+        """
+        Apply the transpose of the acquisition model to a stack of inputs
+        along the first dimension, such as (ntods, ndetectors, nsamples).
+        """
+        return _apply_batch(self.transpose, input)
+
     def matvec(self, v):
         v = v.reshape(flatten_sliced_shape(self.shapein))
         return self.direct(v, False, False, False).ravel()
@@ -471,6 +499,12 @@ class AcquisitionModelTranspose(AcquisitionModelLinear):
     def T(self):
         return self.model
 
+    def direct_batch(self, input):
+        return self.model.transpose_batch(input)
+
+    def transpose_batch(self, input):
+        return self.model.direct_batch(input)
+
     def validate_shapein(self, shapein):
         return self.model.validate_shapeout(shapein)
 
@@ -501,6 +535,7 @@ class Composite(AcquisitionModel):
                 self.blocks.append(model)
 
         AcquisitionModel.__init__(self, description=description)
+        self._plan = None
 
         if all([hasattr(m, 'matvec') for m in self.blocks]):
             self.matvec = lambda v: \
@@ -570,6 +605,15 @@ class Composite(AcquisitionModel):
     def unitout(self, value):
         pass
 
+    def _get_plan(self):
+        """
+        Return the execution plan of the composite, which is computed at the
+        first application and re-used afterwards.
+        """
+        if getattr(self, '_plan', None) is None:
+            self._plan = _ExecutionPlan(self)
+        return self._plan
+
     def validate_input(self, input, shape):
         input = np.array(input, ndmin=1, subok=True, copy=False)
         if shape is not None and type(shape[-1]) is tuple:
@@ -598,23 +642,60 @@ class Addition(Composite):
     """
 
     def direct(self, input, inplace, cachein, cacheout):
-        input = self.validate_input(input, self.shapein)
-        output = self.blocks[0].direct(input, False, False, False)
-        for i, model in enumerate(self.blocks[1:]):
-            last = i == len(self.blocks) - 2
+        plan = self._get_plan()
+        input = self.validate_input(input, plan.shapein)
+
+        # the non-blocking operands are started first, so that their
+        # completion overlaps with the application of the other operands
+        requests = [m.direct_start(input, False, False, False)
+                    for m in plan.nonblocking]
+        blocks = plan.blocking
+
+        if len(blocks) > 0:
+            output = plan.apply_first(blocks[0], blocks[0].direct, input,
+                                      cacheout, 'output')
+        else:
+            output = requests.pop(0).wait()
+        for i, model in enumerate(blocks[1:]):
+            last = i == len(blocks) - 2
             tmf.add_inplace(np.array(output, ndmin=1, copy=False).T,
-                            np.array(model.direct(input, inplace and last,
-                            cachein, cacheout), ndmin=1, copy=False).T)
+                            np.array(plan.apply(model, model.direct, input,
+                            inplace and last, cachein, cacheout, 'work'),
+                            ndmin=1, copy=False).T)
+        for request in requests:
+            tmf.add_inplace(np.array(output, ndmin=1, copy=False).T,
+                            np.array(request.wait(), ndmin=1, copy=False).T)
         return output
 
     def transpose(self, input, inplace, cachein, cacheout):
-        input = self.validate_input(input, self.shapeout)
-        output = self.blocks[0].transpose(input, False, False, False)
+        plan = self._get_plan()
+        input = self.validate_input(input, plan.shapeout)
+        output = plan.apply_first(self.blocks[0], self.blocks[0].transpose,
+                                  input, cacheout, 'output.T')
         for i, model in enumerate(self.blocks[1:]):
             last = i == len(self.blocks) - 2
             tmf.add_inplace(np.array(output, ndmin=1, copy=False).T,
-                            np.array(model.transpose(input, inplace and last,
-                            cachein, cacheout), ndmin=1, copy=False).T)
+                            np.array(plan.apply(model, model.transpose, input,
+                            inplace and last, cachein, cacheout, 'work.T'),
+                            ndmin=1, copy=False).T)
+        return output
+
+    def direct_batch(self, input):
+        input = self.validate_input(input, self.shapein)
+        output = self.blocks[0].direct_batch(input)
+        for model in self.blocks[1:]:
+            tmf.add_inplace(np.array(output, ndmin=1, copy=False).T,
+                            np.array(model.direct_batch(input), ndmin=1,
+                                     copy=False).T)
+        return output
+
+    def transpose_batch(self, input):
+        input = self.validate_input(input, self.shapeout)
+        output = self.blocks[0].transpose_batch(input)
+        for model in self.blocks[1:]:
+            tmf.add_inplace(np.array(output, ndmin=1, copy=False).T,
+                            np.array(model.transpose_batch(input), ndmin=1,
+                                     copy=False).T)
         return output
 
     @property
@@ -660,8 +741,32 @@ class Addition(Composite):
     def T(self):
         return Addition([model.T for model in self.blocks])
 
+    def simplify(self):
+        """
+        Return an equivalent acquisition model, in which the identities, the
+        scalars and the diagonal operators are summed into a single diagonal
+        operator. The addition itself is not modified.
+        """
+        blocks = _simplify_blocks(self.blocks, Addition)
+        diagonals = [b for b in blocks if _is_diagonal(b)]
+        if len(diagonals) > 1:
+            diagonal = diagonals[0]
+            for d in diagonals[1:]:
+                diagonal = _merge_diagonals(diagonal, d, np.add)
+                if diagonal is None:
+                    break
+            if diagonal is not None:
+                blocks[blocks.index(diagonals[0])] = diagonal
+                blocks = [b for b in blocks if b not in diagonals[1:]]
+                _log_simplification(self, str(len(diagonals)) + ' diagonal o'\
+                                    'perators summed')
+        if len(blocks) == 1:
+            return blocks[0]
+        return Addition(blocks, description=self.description)
+
     def __iadd__(self, other):
         oldblocks = self.blocks
+        self._plan = None
         if isinstance(other, Addition):
             self.blocks.extend(other.blocks)
         else:
@@ -691,29 +796,58 @@ class Composition(Composite):
     """
 
     def direct(self, input, inplace, cachein, cacheout):
-        input = self.validate_input(input, self.shapein)
-        caches = [m.cache for m in self.blocks]
-        if any(caches):
-            first_cache = caches.index(True)
-            last_cache = len(self.blocks) - caches.index(True) - 1
-        else:
-            first_cache = len(self.blocks)
-            last_cache = -1
+        return self._direct(input, inplace, cachein, cacheout, False)
+
+    def direct_start(self, input, inplace, cachein, cacheout):
+        """
+        Apply the composition, but only start the leftmost operator, which
+        must be non-blocking. The returned request's wait method completes
+        the operation and returns the output.
+        """
+        return self._direct(input, inplace, cachein, cacheout, True)
+
+    def _direct(self, input, inplace, cachein, cacheout, start):
+        plan = self._get_plan()
+        input = self.validate_input(input, plan.shapein)
+        n = len(self.blocks)
         for i, model in enumerate(reversed(self.blocks)):
-            input = model.direct(input, inplace or i != 0,
-                                 cachein or i > first_cache,
-                                 cacheout or i < last_cache)
+            direct = model.direct_start if start and i == n - 1 else \
+                     model.direct
+            if i == 0:
+                input = plan.apply(model, direct, input, inplace,
+                                   cachein or i > plan.first_cache,
+                                   cacheout or i < plan.last_cache, 'input')
+            else:
+                input = direct(input, True, cachein or i > plan.first_cache,
+                               cacheout or i < plan.last_cache)
         return input
 
     def transpose(self, input, inplace, cachein, cacheout):
-        input = self.validate_input(input, self.shapeout)
-        caches = [m.cache for m in self.blocks]
-        first_cache = len(self.blocks) - caches.index(True) - 1
-        last_cache = caches.index(True)
+        plan = self._get_plan()
+        input = self.validate_input(input, plan.shapeout)
+        n = len(self.blocks)
         for i, model in enumerate(self.blocks):
-            input = model.transpose(input, inplace or i != 0,
-                                    cachein or i > first_cache,
-                                    cacheout or i < last_cache)
+            if i == 0:
+                input = plan.apply(model, model.transpose, input, inplace,
+                                   cachein or i > plan.first_cache_transpose,
+                                   cacheout or i < plan.last_cache_transpose,
+                                   'input.T')
+            else:
+                input = model.transpose(input, True,
+                    cachein or i > plan.first_cache_transpose,
+                    cacheout or i < plan.last_cache_transpose)
+        return input
+
+    def direct_batch(self, input):
+        input = self.validate_input(input, self.shapein)
+        for model in reversed(self.blocks):
+            input = model.direct_batch(input)
+        return input
+
+    def transpose_batch(self, input):
+        input = self.validate_input(input, self.shapeout)
+        for model in self.blocks:
+            input = model.transpose_batch(input)
         return input
 
     @property
@@ -738,12 +872,68 @@ class Composition(Composite):
     def shapeout(self, value):
         pass
 
+    @property
+    def nonblocking(self):
+        return _is_nonblocking(self.blocks[0])
+
     @property
     def T(self):
         return Composition([model.T for model in reversed(self.blocks)])
 
+    def simplify(self):
+        """
+        Return an equivalent acquisition model, in which the identities are
+        removed, the scalars are folded into a diagonal operator and the
+        adjacent diagonal operators, maskings and reshapings are merged. The
+        composition itself is not modified.
+        """
+        blocks = _simplify_blocks(self.blocks, Composition)
+
+        n = len(blocks)
+        blocks = [b for b in blocks if not _is_identity(b)]
+        if len(blocks) < n:
+            _log_simplification(self, str(n - len(blocks)) + ' identities re'\
+                                'moved')
+
+        # scalars commute with linear operators: they are moved next to a
+        # diagonal operator, in which they can be folded
+        scalars = [b for b in blocks if type(b) is Scalar and b.shapein is None]
+        if len(scalars) > 0 and all([_is_linear(b) for b in blocks]):
+            others = [b for b in blocks if b not in scalars]
+            diagonals = [b for b in others if _is_diagonal(b)]
+            if len(diagonals) > 0:
+                index = others.index(diagonals[0])
+            else:
+                index = blocks.index(scalars[0])
+            blocks = others[0:index] + scalars + others[index:]
+
+        i = 0
+        while i < len(blocks) - 1:
+            merged = _merge_composition_pair(blocks[i], blocks[i+1])
+            if merged is None:
+                i += 1
+                continue
+            _log_simplification(self, blocks[i].description + ' and ' + \
+                                blocks[i+1].description + ' merged')
+            blocks[i:i+2] = merged
+            i = max(i - 1, 0)
+
+        if len(blocks) == 0:
+            blocks = [Identity(shapein=self.shapein)]
+        if len(blocks) == 1:
+            result = blocks[0]
+        else:
+            result = Composition(blocks, description=self.description)
+
+        # the removed operators may have constrained the composition's shapes
+        if result.shapein != self.shapein or result.shapeout != self.shapeout:
+            _log_simplification(self, 'cancelled, the shapes are not preserved')
+            return self
+        return result
+
     def __imul__(self, other):
         oldblocks = self.blocks
+        self._plan = None
         self.blocks.append(asacquisitionmodel(other))
         try:
             shapein = self.shapein
@@ -783,6 +973,9 @@ class Symmetric(Square):
     def transpose(self, input, inplace, cachein, cacheout):
         return self.direct(input, inplace, cachein, cacheout)
 
+    def transpose_batch(self, input):
+        return self.direct_batch(input)
+
     @property
     def T(self):
         return self
@@ -825,6 +1018,40 @@ class Diagonal(Symmetric):
 #-------------------------------------------------------------------------------
 
 
+class BlockDiagonal(Symmetric):
+    """
+    Block diagonal operator.
+
+    The input is flattened and the element index[i,j] is associated to the
+    row j of the dense block i. Negative indices are padding slots.
+    """
+
+    def __init__(self, blocks, index, shapein=None, description=None):
+        blocks = np.asarray(blocks, dtype=var.get_default_dtype(blocks))
+        index = np.asarray(index)
+        if blocks.ndim != 3 or blocks.shape[1] != blocks.shape[2] or \
+           index.shape != blocks.shape[0:2]:
+            raise ValueError('The blocks and index have incompatible shapes.')
+        Symmetric.__init__(self, dtype=blocks.dtype, description=description,
+                           shapein=shapein)
+        self.blocks = blocks
+        self.index = index
+        self._valid = index >= 0
+        self._index = index[self._valid]
+
+    def direct(self, input, inplace, cachein, cacheout):
+        output = self.validate_input_inplace(input, inplace)
+        x = output.reshape(-1)
+        xb = np.zeros(self.index.shape, x.dtype)
+        xb[self._valid] = x[self._index]
+        xb = np.sum(self.blocks * xb[:,np.newaxis,:], axis=-1)
+        x[self._index] = xb[self._valid]
+        return output
+
+
+#-------------------------------------------------------------------------------
+
+
 class DiscreteDifference(Square):
     """Calculate the nth order discrete difference along given axis."""
 
@@ -884,18 +1111,51 @@ class Projection(AcquisitionModelLinear):
         - _pmatrix: opaque representation of the pointing matrix
         - npixels_per_sample: maximum number of sky map pixels that can be
           intercepted by a detector
+    If cachedir is specified, the pointing matrix is stored in this directory
+    and subsequent instantiations with the same observation and parameters
+    reload it instead of recomputing it.
+    The storage keyword specifies how the pointing matrix is held in memory:
+        - 'full': padded array of (weight, pixel) pairs (default)
+        - 'compressed': unpadded rows, weights quantized as 16-bit unsigned
+          integers and pixel indices encoded as 16-bit differences. The
+          pmatrix and _pmatrix attributes are then not available.
+        - 'onthefly': the pointing matrix is never stored. It is recomputed
+          by blocks of pointings each time the model is applied, which trades
+          computing time for memory.
+    The methods direct_batch and transpose_batch apply the model to a stack
+    of maps or timelines in a single pass over the pointing matrix, except
+    for the 'compressed' storage, for which the stack is processed one
+    element at a time.
     """
 
-    def __init__(self, observation, method=None, header=None, resolution=None,
-                 npixels_per_sample=0, oversampling=True, description=None):
+    # number of pointings times number of detectors in an on-the-fly block
+    ONTHEFLY_BLOCKSIZE = 2**17
 
+    def __init__(self, observation, method=None, header=None, resolution=None,
+                 npixels_per_sample=0, oversampling=True, cachedir=None,
+                 storage='full', description=None):
+
+        choices = ('full', 'compressed', 'onthefly')
+        if storage not in choices:
+            raise ValueError("Invalid storage '" + str(storage) + "'. Expected"\
+                             " values are " + strenum(choices, 'or') + '.')
+        self.storage = storage
+
+        if storage == 'onthefly':
+            self._observation = observation
+            self._method = method
+            self._oversampling = oversampling
+            result = self._init_onthefly(header, resolution,
+                                         npixels_per_sample)
+        else:
+            result = observation.get_pointing_matrix(header,
+                                                     resolution,
+                                                     npixels_per_sample,
+                                                     method=method,
+                                                     oversampling=oversampling,
+                                                     cachedir=cachedir)
         self._pmatrix, self.header, ndetectors, nsamples, \
-        self.npixels_per_sample, (unitout, unitin), (duout, duin) = \
-            observation.get_pointing_matrix(header,
-                                            resolution,
-                                            npixels_per_sample,
-                                            method=method,
-                                            oversampling=oversampling)
+        self.npixels_per_sample, (unitout, unitin), (duout, duin) = result
 
         attrin = {'header' : self.header}
         if duin is not None:
@@ -918,29 +1178,307 @@ class Projection(AcquisitionModelLinear):
                                         unitin=unitin,
                                         unitout=unitout)
 
+        if storage == 'onthefly':
+            return
+
         self.pmatrix = self._pmatrix.view([('weight', 'f4'), ('pixel', 'i4')]) \
                            .view(np.recarray)
         self.pmatrix.resize((ndetectors, np.sum(nsamples),
                              self.npixels_per_sample))
 
+        if storage == 'compressed':
+            self._counts, self._weights, self._scale, self._pixels, \
+            self._offsets = _compress_pmatrix(self.pmatrix)
+            del self.pmatrix, self._pmatrix
+
+    def _init_onthefly(self, header, resolution, npixels_per_sample):
+        """
+        Compute the pointing matrix by blocks of pointings, to determine the
+        map header, the number of samples of each block and the number of
+        pixels per sample. The pointing matrix itself is discarded.
+        """
+        observation = self._observation
+        ndetectors = observation.get_ndetectors()
+        npointings = observation.pointing.size
+        nblock = max(self.ONTHEFLY_BLOCKSIZE // ndetectors, 1)
+        self._blocks = []
+        nsamples = 0
+        npixels_per_sample_max = npixels_per_sample
+        for start in range(0, max(npointings, 1), nblock):
+            pointings = slice(start, start + nblock)
+            pmatrix, header, ndetectors, nsamples_block, npixels_per_sample_,\
+            units, derived_units = observation.get_pointing_matrix(header,
+                resolution, npixels_per_sample, method=self._method,
+                oversampling=self._oversampling, pointings=pointings)
+            del pmatrix
+            nsamples = nsamples + np.array(nsamples_block)
+            self._blocks.append((pointings, int(np.sum(nsamples_block))))
+            npixels_per_sample_max = max(npixels_per_sample_max,
+                                         npixels_per_sample_)
+        nsamples = tuple([int(n) for n in nsamples])
+        return None, header, ndetectors, nsamples, npixels_per_sample_max, \
+               units, derived_units
+
+    def _get_pmatrix_block(self, pointings):
+        return self._observation.get_pointing_matrix(self.header, None,
+            self.npixels_per_sample, method=self._method,
+            oversampling=self._oversampling, pointings=pointings)[0]
+
     def direct(self, input, inplace, cachein, cacheout):
         input, output = self.validate_input_direct(input, cachein, cacheout)
+        if self.storage == 'onthefly':
+            signal = output.view(np.ndarray)
+            dest = 0
+            for pointings, n in self._blocks:
+                if n == 0:
+                    continue
+                block = np.empty((signal.shape[0], n), signal.dtype)
+                pmatrix = self._get_pmatrix_block(pointings)
+                tmf.pointing_matrix_direct(pmatrix, input.T, block.T,
+                                           self.npixels_per_sample)
+                signal[:,dest:dest+n] = block
+                dest += n
+            return output
+        if self.storage == 'compressed':
+            tmf.pointing_matrix_compressed_direct(self._counts.view(np.int8).T,
+                self._weights.view(np.int16), self._scale, self._pixels,
+                self._offsets.T, input.T, output.T)
+            return output
         tmf.pointing_matrix_direct(self._pmatrix, input.T, output.T,
                                    self.npixels_per_sample)
         return output
 
     def transpose(self, input, inplace, cachein, cacheout):
         input, output = self.validate_input_transpose(input, cachein, cacheout)
+        if self.storage == 'onthefly':
+            signal = input.view(np.ndarray)
+            map = output.view(np.ndarray)
+            map[...] = 0
+            block_map = np.empty(map.shape, map.dtype)
+            dest = 0
+            for pointings, n in self._blocks:
+                if n == 0:
+                    continue
+                block = np.ascontiguousarray(signal[:,dest:dest+n])
+                pmatrix = self._get_pmatrix_block(pointings)
+                tmf.pointing_matrix_transpose(pmatrix, block.T, block_map.T,
+                                              self.npixels_per_sample)
+                map += block_map
+                dest += n
+            return output
+        if self.storage == 'compressed':
+            tmf.pointing_matrix_compressed_transpose(
+                self._counts.view(np.int8).T, self._weights.view(np.int16),
+                self._scale, self._pixels, self._offsets.T, input.T, output.T)
+            return output
         tmf.pointing_matrix_transpose(self._pmatrix, input.T, output.T, 
                                       self.npixels_per_sample)
         return output
 
-    def get_ptp(self):
+    def direct_batch(self, input):
+        if self.storage == 'compressed':
+            return AcquisitionModelLinear.direct_batch(self, input)
+        input = np.array(input, var.FLOAT_DTYPE, ndmin=2, copy=False)
+        self.validate_shapein(input.shape[1:])
+        nbatch = input.shape[0]
+
+        # the maps are interleaved, so that the values of a pixel are
+        # contiguous in memory
+        map2d = np.asfortranarray(input.reshape((nbatch, -1)))
+        output = Tod.empty((nbatch,) + flatten_sliced_shape(self.shapeout),
+                           nsamples=self.shapeout[-1], dtype=var.FLOAT_DTYPE)
+        _record_allocation(output.nbytes)
+        output._unit = self.unitout
+        for k,v in self.attrout.items():
+            setattr(output, k, v)
+
+        if self.storage == 'onthefly':
+            signal = output.view(np.ndarray)
+            dest = 0
+            for pointings, n in self._blocks:
+                if n == 0:
+                    continue
+                block = np.empty(signal.shape[0:2] + (n,), signal.dtype)
+                pmatrix = self._get_pmatrix_block(pointings)
+                tmf.pointing_matrix_direct_batch(pmatrix, map2d, block.T,
+                                                 self.npixels_per_sample)
+                signal[...,dest:dest+n] = block
+                dest += n
+            return output
+        tmf.pointing_matrix_direct_batch(self._pmatrix, map2d, output.T,
+                                         self.npixels_per_sample)
+        return output
+
+    def transpose_batch(self, input):
+        if self.storage == 'compressed':
+            return AcquisitionModelLinear.transpose_batch(self, input)
+        input = np.array(input, var.FLOAT_DTYPE, ndmin=3, copy=False)
+        self.validate_shapeout(input.shape[1:])
+        nbatch = input.shape[0]
+
+        map2d = np.empty((nbatch, np.product(self.shapein)), var.FLOAT_DTYPE,
+                         order='F')
+        if self.storage == 'onthefly':
+            signal = input.view(np.ndarray)
+            map2d[...] = 0
+            block_map2d = np.empty(map2d.shape, map2d.dtype, order='F')
+            dest = 0
+            for pointings, n in self._blocks:
+                if n == 0:
+                    continue
+                block = np.ascontiguousarray(signal[...,dest:dest+n])
+                pmatrix = self._get_pmatrix_block(pointings)
+                tmf.pointing_matrix_transpose_batch(pmatrix, block.T,
+                    block_map2d, self.npixels_per_sample)
+                map2d += block_map2d
+                dest += n
+        else:
+            tmf.pointing_matrix_transpose_batch(self._pmatrix,
+                np.ascontiguousarray(input).T, map2d, self.npixels_per_sample)
+
+        output = np.ascontiguousarray(map2d).reshape((nbatch,) + self.shapein)
+        output = output.view(Map)
+        _record_allocation(output.nbytes)
+        output._unit = self.unitin
+        for k,v in self.attrin.items():
+            setattr(output, k, v)
+        return output
+
+    def get_ptp(self, weight=None, sparse=False):
+        """
+        Return the matrix P^T W P, where W is an optional diagonal weight of
+        the same shape as the timeline. If sparse is True, the matrix is
+        returned in scipy's CSR format.
+        """
+        self.validate_storage('full')
         ndetectors = self.shapeout[0]
         nsamples = np.sum(self.shapeout[1])
         npixels = np.product(self.shapein)
-        return tmf.pointing_matrix_ptp(self._pmatrix, self.npixels_per_sample,
-                                       nsamples, ndetectors, npixels).T
+        if weight is None and not sparse:
+            return tmf.pointing_matrix_ptp(self._pmatrix,
+                self.npixels_per_sample, nsamples, ndetectors, npixels).T
+
+        if weight is not None:
+            weight = np.asarray(weight, var.FLOAT_DTYPE)
+            weight = weight.reshape(weight.shape + (1,) * (2 - weight.ndim))
+        nblock = max(2**20 // max(nsamples * self.npixels_per_sample, 1), 1)
+        ptp = scipy.sparse.csr_matrix((npixels, npixels), dtype=var.FLOAT_DTYPE)
+        for d in range(0, ndetectors, nblock):
+            block = self.pmatrix[d:d+nblock]
+            nrows = block.shape[0] * nsamples
+            valid = block.pixel != -1
+            rows = np.nonzero(valid.reshape((nrows, -1)))[0]
+            pixel = block.pixel[valid]
+            value = block.weight[valid].astype(var.FLOAT_DTYPE)
+            p = scipy.sparse.csr_matrix((value, (rows, pixel)),
+                                        shape=(nrows, npixels))
+            if weight is not None:
+                w = np.ones((block.shape[0], nsamples)) * weight[d:d+nblock]
+                value = value * w.ravel()[rows]
+                pw = scipy.sparse.csr_matrix((value, (rows, pixel)),
+                                             shape=(nrows, npixels))
+            else:
+                pw = p
+            ptp = ptp + (p.T * pw).tocsr()
+
+        if sparse:
+            return ptp
+        return ptp.toarray()
+
+    def get_preconditioner(self, weight=None, tile=4):
+        """
+        Return the block-Jacobi preconditioner of P^T W P, i.e. the inverse
+        of its diagonal blocks, each of which couples the map pixels inside a
+        square of tile x tile pixels. The blocks are summed over the MPI
+        processes before inversion. The rows of unobserved map pixels are set
+        to identity.
+        """
+        ptp = self.get_ptp(weight=weight, sparse=True).tocoo()
+        shape = self.shapein
+        if len(shape) == 1:
+            shape = (1,) + shape
+            tiley = 1
+        else:
+            tiley = tile
+        ny, nx = shape[-2], int(np.product(shape[-1:]))
+        ntilesx = (nx + tile - 1) // tile
+        ntiles = ((ny + tiley - 1) // tiley) * ntilesx
+        blocksize = tile * tiley
+        def get_tile(i):
+            iy, ix = i // nx, i % nx
+            return (iy // tiley) * ntilesx + ix // tile, \
+                   (iy % tiley) * tile + ix % tile
+
+        blocks = np.zeros((ntiles, blocksize, blocksize))
+        ti, li = get_tile(ptp.row)
+        tj, lj = get_tile(ptp.col)
+        keep = ti == tj
+        blocks[ti[keep], li[keep], lj[keep]] = ptp.data[keep]
+        if var.mpi_comm.Get_size() > 1:
+            var.mpi_comm.Allreduce(MPI.IN_PLACE, [blocks, MPI.DOUBLE],
+                                   op=MPI.SUM)
+
+        diag = np.arange(blocksize)
+        blocks[:,diag,diag] += blocks[:,diag,diag] == 0
+        for i in range(ntiles):
+            try:
+                blocks[i] = np.linalg.inv(blocks[i])
+            except np.linalg.LinAlgError:
+                blocks[i] = np.linalg.pinv(blocks[i])
+
+        index = -np.ones((ntiles, blocksize), int)
+        pixels = np.arange(ny * nx)
+        index[get_tile(pixels)] = pixels
+        return BlockDiagonal(blocks, index, shapein=self.shapein,
+                             description='Block-Jacobi preconditioner')
+
+    def validate_storage(self, *storages):
+        """
+        Raise a ValueError if the pointing matrix storage is not one of
+        the specified ones.
+        """
+        if self.storage not in storages:
+            raise ValueError("This operation is not implemented for the '" + \
+                             self.storage + "' pointing matrix storage.")
+
+
+#-------------------------------------------------------------------------------
+
+
+class ProjectionNormal(Symmetric):
+    """
+    Normal operator H^T W H, where the acquisition model H is a projection,
+    optionally followed by an average compression, and W is a diagonal
+    weight in the compressed timeline space, which includes the masks.
+
+    The operator is applied in a single pass over the pointing matrix, so
+    that no intermediate timeline is stored.
+
+    The weight can be stored in single precision (weight_dtype=np.float32),
+    which halves its memory footprint and the memory traffic of each
+    application. The timeline values and the output map are still
+    accumulated in the precision of var.FLOAT_DTYPE.
+    """
+
+    def __init__(self, projection, weight, factor=1, weight_dtype=None,
+                 description=None):
+        projection.validate_storage('full')
+        weight_dtype = _validate_weight_dtype(weight_dtype)
+        Symmetric.__init__(self, cache=True, description=description,
+                           shapein=projection.shapein)
+        self.projection = projection
+        self.weight = np.asarray(weight, dtype=weight_dtype)
+        self.factor = int(factor)
+
+    def direct(self, input, inplace, cachein, cacheout):
+        input, output = self.validate_input_direct(input, cachein, cacheout)
+        if self.weight.dtype == var.FLOAT_DTYPE:
+            ptwp = tmf.pointing_matrix_ptwp
+        else:
+            ptwp = tmf.pointing_matrix_ptwp_sp
+        ptwp(self.projection._pmatrix, self.weight.T, self.factor, input.T,
+             output.T, self.projection.npixels_per_sample)
+        return output
 
 
 #-------------------------------------------------------------------------------
@@ -1518,6 +2056,9 @@ class InvNtt(Diagonal):
 
 
 class InterpolationLinear(Square):
+    """
+    Linear interpolation of the masked samples of the timelines.
+    """
 
     def __init__(self, mask, shapein=None, description=None):
         Square.__init__(self, attrin={'mask' : mask}, shapein=shapein,
@@ -1525,7 +2066,8 @@ class InterpolationLinear(Square):
         self.mask = mask
 
     def direct(self, input, inplace, cachein, cacheout):
-        return interpolate_linear(output)
+        output = self.validate_input_inplace(input, inplace)
+        return interpolate_linear(output, self.mask)
 
     def transpose(self, input, inplace, cachein, cacheout):
         raise NotImplementedError()
@@ -1535,18 +2077,125 @@ class InterpolationLinear(Square):
 
 
 class AllReduce(Square):
+    """
+    Reduction of the input over the processors of the communicator.
+
+    The reduction is performed in place, by chunks of chunksize elements.
+    Each chunk is reduced by a non-blocking call, so that the reductions of
+    the chunks are pipelined. Through the direct_start method, a Composition
+    or an Addition can start the reduction as soon as its input is available
+    and wait for it only when the output is needed.
+
+    If support is specified, it is a boolean array of the input shape, which
+    is true for the elements that may be non-zero on the local processor.
+    The union of the supports is computed once, and only the elements in
+    this union are exchanged: the union is split into one range per
+    processor, each range is reduced on its owner (reduce-scatter) and the
+    reduced ranges are gathered by all processors.
+    """
+
+    CHUNKSIZE = 2**20
 
-    def __init__(self, operator=MPI.SUM, shapein=None, description=None):
-        Square.__init__(self, shapein=shapein, description=None)
+    nonblocking = True
+
+    def __init__(self, operator=MPI.SUM, shapein=None, chunksize=None,
+                 support=None, description=None):
+        Square.__init__(self, shapein=shapein, description=description)
         self.operator = operator
+        self.chunksize = chunksize or self.CHUNKSIZE
+        self.index = None
+        if support is not None:
+            self._init_support(support)
+
+    def _init_support(self, support):
+        """
+        Compute the union of the supports and split it into one range of
+        elements per processor.
+        """
+        support = np.array(support, dtype=bool).astype(np.uint8).ravel()
+        self.support_size = support.size
+        if MPI.COMM_WORLD.Get_size() > 1:
+            var.mpi_comm.Allreduce(MPI.IN_PLACE, [support, MPI.UNSIGNED_CHAR],
+                                   op=MPI.MAX)
+        self.index = np.flatnonzero(support)
+        nprocs = var.mpi_comm.Get_size()
+        n = self.index.size
+        self._counts = [n // nprocs + (1 if r < n % nprocs else 0)
+                        for r in range(nprocs)]
+        self._displs = [int(d) for d in np.cumsum([0] + self._counts[:-1])]
 
     def direct(self, input, inplace, cachein, cacheout):
+        return self.direct_start(input, inplace, cachein, cacheout).wait()
+
+    def direct_start(self, input, inplace, cachein, cacheout):
+        """
+        Start the reduction and return a request, whose wait method completes
+        the reduction and returns the output.
+        """
         output = self.validate_input_inplace(input, inplace)
-        if MPI.COMM_WORLD.Get_size() > 1:
-            var.mpi_comm.Allreduce(MPI.IN_PLACE, [output, MPI.DOUBLE],
+        if MPI.COMM_WORLD.Get_size() == 1:
+            return _Request(output, [])
+        if self.index is not None:
+            self.allgather(self.reduce_scatter(output), output)
+            return _Request(output, [])
+        datatype = _get_mpi_datatype(output.dtype)
+        if not output.flags.contiguous:
+            var.mpi_comm.Allreduce(MPI.IN_PLACE, [output, datatype],
                                    op=self.operator)
+            return _Request(output, [])
+        buf = output.ravel()
+        requests = [var.mpi_comm.Iallreduce(MPI.IN_PLACE,
+                    [buf[i:i+self.chunksize], datatype], op=self.operator)
+                    for i in xrange(0, buf.size, self.chunksize)]
+        return _Request(output, requests)
+
+    def get_owned(self, input):
+        """
+        Return the range of the elements of the union of the supports which
+        is owned by the local processor.
+        """
+        self._validate_support_size(input)
+        rank = var.mpi_comm.Get_rank()
+        start = self._displs[rank]
+        return input.flat[self.index[start:start+self._counts[rank]]]
+
+    def reduce_scatter(self, input, output=None):
+        """
+        Reduce the elements of the union of the supports over the processors
+        and return the range owned by the local processor.
+        """
+        self._validate_support_size(input)
+        comm = var.mpi_comm
+        values = input.flat[self.index]
+        datatype = _get_mpi_datatype(values.dtype)
+        if output is None:
+            output = np.empty(self._counts[comm.Get_rank()], values.dtype)
+        comm.Reduce_scatter([values, datatype], [output, datatype],
+                            recvcounts=self._counts, op=self.operator)
         return output
 
+    def allgather(self, input, output):
+        """
+        Gather the owned ranges of the processors into the elements of the
+        union of the supports of the output.
+        """
+        self._validate_support_size(output)
+        values = np.empty(self.index.size, output.dtype)
+        datatype = _get_mpi_datatype(output.dtype)
+        var.mpi_comm.Allgatherv([np.asarray(input, output.dtype), datatype],
+                                [values, (self._counts, self._displs),datatype])
+        output.flat[self.index] = values
+        return output
+
+    def _validate_support_size(self, input):
+        if self.index is None:
+            raise ValueError("The reduction '" + self.description + "' has n" \
+                             'o support.')
+        if input.size != self.support_size:
+            raise ValidationError("The input of '" + self.description + "' h" \
+                "as a size '" + str(input.size) + "' incompatible with that " \
+                "of the support '" + str(self.support_size) + "'.")
+
     def transpose(self, input, inplace, cachein, cacheout):
         output = self.validate_input_inplace(input, inplace)
         return output
@@ -1555,6 +2204,136 @@ class AllReduce(Square):
 #-------------------------------------------------------------------------------
 
 
+class _Distributed(Symmetric):
+    """
+    Operator acting on the range of the union of the supports of an AllReduce
+    which is owned by the local processor. The owned ranges are gathered into
+    the input of the model. If reduce is True, the outputs of the model are
+    reduced over the processors and scattered. Otherwise, the output of the
+    model is the same on all the processors and only its owned range is kept.
+    """
+    def __init__(self, model, allreduce, reduce=True, description=None):
+        if description is None:
+            description = 'Distributed(' + model.description + ')'
+        Symmetric.__init__(self, cache=True, description=description,
+            shapein=allreduce._counts[var.mpi_comm.Get_rank()])
+        self.model = model
+        self.allreduce = allreduce
+        self.reduce = reduce
+        shape = flatten_sliced_shape(model.shapein) or \
+                (allreduce.support_size,)
+        self._input = np.zeros(shape, var.FLOAT_DTYPE)
+
+    def direct(self, input, inplace, cachein, cacheout):
+        input, output = self.validate_input_direct(input, cachein, cacheout)
+        self.allreduce.allgather(input, self._input)
+        result = self.model.direct(self._input, False, False, True)
+        if self.reduce:
+            self.allreduce.reduce_scatter(result, output)
+        else:
+            output[...] = self.allreduce.get_owned(result)
+        return output
+
+
+#-------------------------------------------------------------------------------
+
+
+class _Request(object):
+    """
+    Pending operation of a non-blocking acquisition model.
+    """
+    def __init__(self, output, requests):
+        self.output = output
+        self.requests = requests
+
+    def wait(self):
+        if len(self.requests) > 0:
+            MPI.Request.Waitall(self.requests)
+            self.requests = []
+        return self.output
+
+
+#-------------------------------------------------------------------------------
+
+
+class _ExecutionPlan(object):
+    """
+    Execution plan of a composite: the shapes, the blocks which can operate
+    in-place and the range of the cached blocks are resolved once, instead of
+    at each call. The plan also holds the work buffers of the in-place
+    blocks which are applied on the input of the composite. When the output
+    is cached, the input is copied into these buffers, which are allocated
+    at the first call, so that the subsequent calls do not allocate memory.
+    """
+    def __init__(self, composite):
+        self.description = composite.description
+        self.shapein = composite.shapein
+        self.shapeout = composite.shapeout
+        self.blocking = [m for m in composite.blocks if not _is_nonblocking(m)]
+        self.nonblocking = [m for m in composite.blocks if _is_nonblocking(m)]
+        self.inplace = dict((id(m), _is_inplace(m)) for m in composite.blocks)
+        caches = [m.cache for m in composite.blocks]
+        n = len(caches)
+        if any(caches):
+            self.first_cache = caches.index(True)
+            self.last_cache = n - caches.index(True) - 1
+            self.first_cache_transpose = n - caches.index(True) - 1
+            self.last_cache_transpose = caches.index(True)
+        else:
+            self.first_cache = self.first_cache_transpose = n
+            self.last_cache = self.last_cache_transpose = -1
+        self.buffers = {}
+
+    def apply(self, model, function, input, inplace, cachein, cacheout, key):
+        """
+        Apply the direct or transpose method of a block. If the output is
+        cached and if the block operates in-place, it is applied on a copy
+        of the input stored in the work buffer 'key'.
+        """
+        if not inplace and cacheout and self.inplace[id(model)]:
+            input = self.get_buffer(input, key)
+            inplace = True
+        return function(input, inplace, cachein, cacheout)
+
+    def apply_first(self, model, function, input, cacheout, key):
+        """
+        Apply the first operand of an addition, whose output accumulates the
+        other operands. If the output is cached, it is held in the work
+        buffer 'key', and not in the cache of the block, which may be
+        overwritten by another operand ending with the same model.
+        """
+        output = self.apply(model, function, input, False, False, cacheout,
+                            key)
+        if cacheout and not self.inplace[id(model)]:
+            output = self.get_buffer(output, key)
+        return output
+
+    def get_buffer(self, input, key):
+        """
+        Return the work buffer 'key', holding a copy of the input. The buffer
+        is only allocated if it does not exist or if it does not match the
+        input.
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None or buffer.shape != input.shape or \
+           buffer.dtype != input.dtype or type(buffer) is not type(input):
+            if var.verbose:
+                print('Info: Allocating ' + input.dtype.type.__name__ + \
+                      str(input.shape).replace(' ','') +  ' = ' + \
+                      str(input.dtype.itemsize * input.size / 2.**20) + \
+                      ' MiB in ' + self.description + ' (work buffer).')
+            buffer = input.copy()
+            _record_allocation(buffer.nbytes)
+            self.buffers[key] = buffer
+            return buffer
+        buffer.view(np.ndarray)[...] = input.view(np.ndarray)
+        _propagate_attributes(input, buffer)
+        return buffer
+
+
+#-------------------------------------------------------------------------------
+
+
 def asacquisitionmodel(operator, description=None):
     if isinstance(operator, AcquisitionModel):
         return operator
@@ -1579,6 +2358,205 @@ def asacquisitionmodel(operator, description=None):
 #-------------------------------------------------------------------------------
 
 
+def _simplify_blocks(blocks, cls):
+    """
+    Simplify the blocks of a composite of class cls, and flatten the composites
+    of the same class.
+    """
+    result = []
+    for block in blocks:
+        block = block.simplify()
+        if isinstance(block, cls):
+            result.extend(block.blocks)
+        else:
+            result.append(block)
+    return result
+
+
+#-------------------------------------------------------------------------------
+
+
+def _log_simplification(model, message):
+    if var.verbose:
+        print('Info: Simplification of ' + model.description + ': ' + message +\
+              '.')
+
+
+#-------------------------------------------------------------------------------
+
+
+def _is_identity(model):
+    """
+    Return true if the model is an identity which does not constrain the shape
+    of its input.
+    """
+    if model.shapein is not None:
+        return False
+    if type(model) is Identity:
+        return True
+    if type(model) is Masking:
+        return model.mask is None
+    if type(model) is Scalar:
+        return model.diagonal == 1
+    return False
+
+
+#-------------------------------------------------------------------------------
+
+
+def _is_diagonal(model):
+    """
+    Return true if the model is a plain diagonal operator, whose diagonal can
+    be combined with others.
+    """
+    return type(model) in (Diagonal, Identity, Scalar)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _is_linear(model):
+    if isinstance(model, AcquisitionModelLinear):
+        return True
+    if isinstance(model, Composite):
+        return all([_is_linear(b) for b in model.blocks])
+    return False
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_diagonal(model):
+    if type(model) is Identity:
+        return np.array(1., var.FLOAT_DTYPE)
+    return model.diagonal
+
+
+#-------------------------------------------------------------------------------
+
+
+def _merge_shapein(model1, model2):
+    """
+    Return the input shape of the merge of two square operators, or raise a
+    ValidationError if the shapes are incompatible.
+    """
+    if model1.shapein is None:
+        return model2.shapein
+    if model2.shapein is None or type(model1.shapein[-1]) is tuple:
+        shapein = model1.shapein
+    else:
+        shapein = model2.shapein
+    if model2.shapein is not None and flatten_sliced_shape(model1.shapein) != \
+       flatten_sliced_shape(model2.shapein):
+        raise ValidationError('Incompatible shapes.')
+    return shapein
+
+
+#-------------------------------------------------------------------------------
+
+
+def _merge_diagonals(model1, model2, operation):
+    """
+    Return the diagonal operator whose diagonal is operation(diagonal1,
+    diagonal2), or None if the diagonals cannot be combined. Since the diagonal
+    elements are replicated along the fast dimensions of the input, one of
+    the diagonal shapes must be the leading part of the other.
+    """
+    try:
+        shapein = _merge_shapein(model1, model2)
+    except ValidationError:
+        return None
+    d1 = _get_diagonal(model1)
+    d2 = _get_diagonal(model2)
+    if d1.ndim > d2.ndim:
+        d1, d2 = d2, d1
+    if d2.shape[0:d1.ndim] != d1.shape:
+        return None
+    diagonal = operation(d1.reshape(d1.shape + (1,) * (d2.ndim - d1.ndim)), d2)
+    if diagonal.ndim == 0:
+        return Scalar(diagonal, shapein=shapein)
+    return Diagonal(diagonal, shapein=shapein)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _merge_maskings(model1, model2):
+    """
+    Return the masking equivalent to two successive maskings, or None if they
+    cannot be merged.
+    """
+    try:
+        shapein = _merge_shapein(model1, model2)
+    except ValidationError:
+        return None
+    m1 = model1.mask
+    m2 = model2.mask
+    if m1 is None or m2 is None or m1.shape != m2.shape:
+        return None
+    if m1.dtype.itemsize == 1 and m2.dtype.itemsize == 1:
+        mask = (m1.view(np.int8) != 0) | (m2.view(np.int8) != 0)
+    elif m1.dtype.itemsize == 1:
+        mask = (m1.view(np.int8) == 0) * m2
+    elif m2.dtype.itemsize == 1:
+        mask = m1 * (m2.view(np.int8) == 0)
+    else:
+        mask = m1 * m2
+    return Masking(mask, shapein=shapein)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_reshaping_shapes(model):
+    """
+    Return the input and output shapes if the model is a reshaping or the
+    transpose of a reshaping, None otherwise.
+    """
+    if type(model) is Reshaping or \
+       isinstance(model, AcquisitionModelTranspose) and \
+       type(model.model) is Reshaping:
+        return model.shapein, model.shapeout
+    return None
+
+
+#-------------------------------------------------------------------------------
+
+
+def _merge_composition_pair(left, right):
+    """
+    Return the list of operators equivalent to the composition left * right,
+    or None if it cannot be simplified.
+    """
+    for identity, other in ((left, right), (right, left)):
+        if type(identity) is Identity and other.shapein is not None and \
+           other.shapeout == other.shapein and \
+           flatten_sliced_shape(other.shapein) == \
+           flatten_sliced_shape(identity.shapein):
+            return [other]
+
+    if _is_diagonal(left) and _is_diagonal(right):
+        merged = _merge_diagonals(left, right, np.multiply)
+        return None if merged is None else [merged]
+
+    if type(left) is Masking and type(right) is Masking:
+        merged = _merge_maskings(left, right)
+        return None if merged is None else [merged]
+
+    shapes_left = _get_reshaping_shapes(left)
+    shapes_right = _get_reshaping_shapes(right)
+    if shapes_left is not None and shapes_right is not None:
+        shapein, shapeout = shapes_right[0], shapes_left[1]
+        if shapein == shapeout:
+            return [Identity(shapein=shapein)]
+        return [Reshaping(shapein, shapeout)]
+
+    return None
+
+
+#-------------------------------------------------------------------------------
+
+
 def _toacquisitionmodel(model, cls, description=None):
     import copy
     if model.__class__ == cls:
@@ -1606,6 +2584,58 @@ def _get_dtype(type1, type2):
 #-------------------------------------------------------------------------------
 
 
+def _get_mpi_datatype(dtype):
+    """Return the MPI datatype matching a numpy data type"""
+    dtype = np.dtype(dtype)
+    types = {
+        'f4' : MPI.FLOAT,
+        'f8' : MPI.DOUBLE,
+        'f16': MPI.LONG_DOUBLE,
+        'c8' : MPI.C_FLOAT_COMPLEX,
+        'c16': MPI.C_DOUBLE_COMPLEX,
+        'c32': MPI.C_LONG_DOUBLE_COMPLEX,
+        'i1' : MPI.SIGNED_CHAR,
+        'i2' : MPI.SHORT,
+        'i4' : MPI.INT,
+        'i8' : MPI.LONG_LONG,
+        'u1' : MPI.UNSIGNED_CHAR,
+        'u2' : MPI.UNSIGNED_SHORT,
+        'u4' : MPI.UNSIGNED,
+        'u8' : MPI.UNSIGNED_LONG_LONG,
+    }
+    key = dtype.kind + str(dtype.itemsize)
+    if not dtype.isnative or key not in types:
+        raise TypeError("The data type '" + str(dtype) + "' has no MPI equivale"\
+                        'nt.')
+    return types[key]
+
+
+#-------------------------------------------------------------------------------
+
+
+def _is_inplace(model):
+    """
+    Return true if the model can operate in-place on its input.
+    """
+    if isinstance(model, AcquisitionModelTranspose):
+        model = model.model
+    return not model.cache and isinstance(model, (Square, Reshaping))
+
+
+#-------------------------------------------------------------------------------
+
+
+def _is_nonblocking(model):
+    """
+    Return true if the model can be started by direct_start without waiting
+    for its completion
+    """
+    return getattr(model, 'nonblocking', False)
+
+
+#-------------------------------------------------------------------------------
+
+
 def _is_scientific_dtype(dtype):
     """Return true if the data type is """
     return issubclass(dtype.type, np.number) or dtype.type == np.bool8
@@ -1614,6 +2644,31 @@ def _is_scientific_dtype(dtype):
 #-------------------------------------------------------------------------------
 
 
+def _apply_batch(function, input):
+    """
+    Apply the direct or transpose method of an acquisition model to each
+    element of a stack of inputs, and return the stack of outputs.
+    """
+    input = np.array(input, ndmin=1, subok=True, copy=False)
+    if input.shape[0] == 0:
+        raise ValueError('The input batch is empty.')
+    output = None
+    for i in range(input.shape[0]):
+        item = np.asanyarray(function(input[i], False, False, False))
+        if output is None:
+            output = np.empty((input.shape[0],) + item.shape, item.dtype)
+            _record_allocation(output.nbytes)
+            output = output.view(type(item))
+            _propagate_attributes(item, output)
+            if isinstance(item, Tod):
+                output.nsamples = item.nsamples
+        output[i] = item
+    return output
+
+
+#-------------------------------------------------------------------------------
+
+
 def _propagate_attributes(input, output):
     """Copy over attributes form input to output"""
 
@@ -1678,3 +2733,144 @@ def _validate_output_unit(input, output, unitin, unitout):
         return
     output._unit = _divide_unit(output._unit, unitin)
     output._unit = _multiply_unit(output._unit, unitout)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _compress_pmatrix(pmatrix):
+    """
+    Return the compressed representation (counts, weights, scale, pixels,
+    offsets) of a pointing matrix of shape (ndetectors, nsamples,
+    npixels_per_sample). See module_pointingmatrix for the format description.
+    The encoding is performed by blocks of detectors.
+    """
+    ndetectors, nsamples, npixels_per_sample = pmatrix.shape
+    if npixels_per_sample > 255:
+        raise ValueError('The number of pixels per sample is too large for th'\
+                         'e compressed storage.')
+    nblock = max(2**22 // max(nsamples * npixels_per_sample, 1), 1)
+
+    weight_max = 0
+    for d in range(0, ndetectors, nblock):
+        weight = pmatrix.weight[d:d+nblock]
+        if weight.size > 0:
+            weight_max = max(weight_max, float(np.max(weight)))
+    scale = weight_max / 65535 if weight_max > 0 else 1.
+
+    counts = np.empty((ndetectors, nsamples), np.uint8)
+    offsets = np.empty((ndetectors, 2), np.int64)
+    weights = []
+    pixels = []
+    nelements = 0
+    nwords = 0
+    for d in range(0, ndetectors, nblock):
+        block = pmatrix[d:d+nblock]
+        valid = block.pixel != -1
+        count = np.sum(valid, axis=-1)
+        counts[d:d+nblock] = count
+        pixel = block.pixel[valid].astype(np.int64)
+        weights.append(np.round(block.weight[valid] / scale).astype(np.uint16))
+
+        # pixel differences, which are absolute for the first detector element
+        ncounts = np.sum(count, axis=-1)
+        first = np.cumsum(ncounts) - ncounts
+        delta = pixel.copy()
+        delta[1:] -= pixel[:-1]
+        first_ = first[ncounts > 0]
+        delta[first_] = pixel[first_]
+
+        escape = (delta < -32767) | (delta > 32767)
+        nw = 1 + 2 * escape
+        iwords = np.cumsum(nw)
+        word = np.empty(iwords[-1] if iwords.size > 0 else 0, np.int16)
+        iwords -= nw
+        word[iwords[~escape]] = delta[~escape]
+        word[iwords[escape]] = -32768
+        word[iwords[escape]+1] = (pixel[escape] & 0xffff).astype(np.uint16) \
+                                 .view(np.int16)
+        word[iwords[escape]+2] = pixel[escape] >> 16
+        pixels.append(word)
+
+        offsets[d:d+nblock,0] = nelements + first
+        offsets[d:d+nblock,1] = nwords + np.concatenate([iwords, [word.size]])\
+                                [first]
+        nelements += pixel.size
+        nwords += word.size
+
+    return counts, np.concatenate(weights), scale, np.concatenate(pixels), \
+           offsets
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_projection_normal(model, weight, weight_dtype=None):
+    """
+    Return the fused normal operator model.T * weight * model, if the model is
+    a composition of masks, diagonal operators, an average compression and a
+    projection, and if the weight is diagonal. Otherwise, return None. The
+    combined weight is stored with the data type weight_dtype.
+    """
+    weight_dtype = _validate_weight_dtype(weight_dtype)
+    blocks = model.blocks if isinstance(model, Composition) else [model]
+    blocks = [b for b in blocks if not isinstance(b, Identity)]
+    if len(blocks) == 0 or not isinstance(blocks[-1], Projection) or \
+       blocks[-1].storage != 'full':
+        return None
+    projection = blocks.pop()
+
+    factor = 1
+    if len(blocks) > 0 and isinstance(blocks[-1], CompressionAverage):
+        factors = np.unique(np.resize(blocks[-1].factor,
+                                      len(projection.shapeout[-1])))
+        if factors.size != 1:
+            return None
+        factor = int(factors[0])
+        blocks.pop()
+
+    shape = flatten_sliced_shape(projection.shapeout)
+    shape = shape[:-1] + (shape[-1] // factor,)
+    diagonal = np.ones(shape, weight_dtype)
+    def multiply(d):
+        d = np.asarray(d)
+        diagonal[...] *= d.reshape(d.shape + (1,) * (diagonal.ndim - d.ndim))
+
+    for b, squared in [(b, True) for b in blocks] + [(weight, False)]:
+        if isinstance(b, Identity):
+            continue
+        if isinstance(b, Masking):
+            if b.mask is None:
+                continue
+            if b.mask.dtype.itemsize == 1:
+                multiply(b.mask.view(np.int8) == 0)
+            else:
+                multiply(b.mask**2 if squared else b.mask)
+        elif isinstance(b, Diagonal):
+            if np.iscomplexobj(b.diagonal):
+                return None
+            multiply(b.diagonal**2 if squared else b.diagonal)
+        else:
+            return None
+
+    return ProjectionNormal(projection, diagonal, factor,
+                            weight_dtype=weight_dtype,
+                            description='Normal operator')
+
+
+#-------------------------------------------------------------------------------
+
+
+def _validate_weight_dtype(dtype):
+    """
+    Return the data type of the weight of a fused normal operator, which is
+    either that of the working precision or single precision.
+    """
+    if dtype is None:
+        return var.FLOAT_DTYPE
+    dtype = np.dtype(dtype)
+    if dtype not in (var.FLOAT_DTYPE, np.dtype(np.float32)):
+        raise TypeError("Invalid weight data type '" + str(dtype) + "'. Expe" \
+                        "cted values are '" + str(var.FLOAT_DTYPE) + "' or 'f" \
+                        "loat32'.")
+    return dtype
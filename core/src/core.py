@@ -9,6 +9,8 @@ from .datatypes import *
 from .utils import *
 from .processing import *
 from .acquisitionmodels import *
+from .profiling import *
+from .solvers import *
 from .mappers import *
 from .observations import MaskPolicy, Pointing
 
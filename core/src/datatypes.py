@@ -1,7 +1,9 @@
+import json
 import kapteyn.maputils
 import matplotlib
 import matplotlib.pyplot as pyplot
 import numpy as np
+import os
 import pickle
 import pyfits
 import StringIO
@@ -23,14 +25,25 @@ __all__ = [ 'FitsArray', 'Map', 'Tod' ]
 
 
 class FitsArray(Quantity):
+    """
+    Represent an array, complemented with unit and FITS header.
+
+    If data is a FITS filename and mmap is True or 'copyonwrite', the array
+    is a copy-on-write memory-mapped view of the file, which is never
+    modified. If mmap is 'readonly', the view is read-only. In both cases,
+    the data are only read when they are accessed and they keep the file's
+    data type, unless dtype is specified. The same applies to the Map's
+    coverage and error and to the Tod's mask.
+    """
 
     __slots__ = ('_header',)
     def __new__(cls, data, header=None, unit=None, derived_units=None,
-                dtype=None, copy=True, order='C', subok=False, ndmin=0):
+                dtype=None, copy=True, order='C', subok=False, ndmin=0,
+                mmap=False):
 
         if type(data) is str:
             ihdu = 0
-            fits = pyfits.open(data)
+            fits = _open_fits(data, mmap)
             while True:
                 try:
                     hdu = fits[ihdu]
@@ -44,6 +57,8 @@ class FitsArray(Quantity):
             data = hdu.data
             header = hdu.header
             copy = False
+            if mmap and dtype is None:
+                dtype = data.dtype
             if unit is None:
                 if 'BUNIT' in header:
                     unit = header['BUNIT']
@@ -347,11 +362,11 @@ class Map(FitsArray):
     """
     def __new__(cls, data,  header=None, unit=None, derived_units=None,
                 coverage=None, error=None, origin=None, dtype=None, copy=True,
-                order='C', subok=False, ndmin=0):
+                order='C', subok=False, ndmin=0, mmap=False):
 
         # get a new Map instance (or a subclass if subok is True)
         result = FitsArray.__new__(cls, data, header, unit, derived_units,
-                                   dtype, copy, order, True, ndmin)
+                                   dtype, copy, order, True, ndmin, mmap)
         if not subok and result.__class__ is not cls:
             result = result.view(cls)
 
@@ -361,11 +376,12 @@ class Map(FitsArray):
                     origin = result.header['DISPORIG']
                 del result.header['DISPORIG']
             try:
-                if error is None: error = pyfits.open(data)['Error'].data
+                if error is None: error = _open_fits(data, mmap)['Error'].data
             except:
                 pass
             try:
-                if coverage is None: coverage = pyfits.open(data)['Coverage'].data
+                if coverage is None:
+                    coverage = _open_fits(data, mmap)['Coverage'].data
             except:
                 pass
 
@@ -496,11 +512,11 @@ class Tod(FitsArray):
 
     def __new__(cls, data, mask=None, nsamples=None, header=None, unit=None,
                 derived_units=None, dtype=None, copy=True, order='C',
-                subok=False, ndmin=0):
+                subok=False, ndmin=0, mmap=False):
 
         # get a new Tod instance (or a subclass if subok is True)
         result = FitsArray.__new__(cls, data, header, unit, derived_units,
-                                   dtype, copy, order, True, ndmin)
+                                   dtype, copy, order, True, ndmin, mmap)
         if not subok and result.__class__ is not cls:
             result = result.view(cls)
         
@@ -510,7 +526,7 @@ class Tod(FitsArray):
 
         if mask is None and isinstance(data, str):
             try:
-                mask = pyfits.open(data)['Mask'].data.view(np.bool8)
+                mask = _open_fits(data, mmap)['Mask'].data.view(np.bool8)
                 copy = False
             except:
                 pass
@@ -686,6 +702,39 @@ class Tod(FitsArray):
         pyfits.append(filename, self.mask.view(np.uint8), header)
         _save_derived_units(filename, self.derived_units)
 
+    def save_native(self, dirname, append=False):
+        """
+        Save the Tod in the native tamasis format.
+
+        The container is a directory holding, for each slice, the signal as a
+        little-endian .npy file and the mask as a bit-packed .npy file, and a
+        JSON file 'tod.json' describing the slices and the unit. If append is
+        True, the slices are appended to those of an existing container.
+        """
+        _save_tod_native(dirname, self, append)
+
+    @staticmethod
+    def load_native(dirname, detectors=None, samples=None, mmap=True):
+        """
+        Load a Tod saved in the native tamasis format.
+
+        Parameters
+        ----------
+        dirname : str
+            The container directory.
+        detectors : slice or tuple of slices
+            Window on the detector dimensions. Default is all the detectors.
+        samples : slice
+            Window on the samples, counted over all the slices. Default is all
+            the samples.
+        mmap : boolean or str
+            If True or 'copyonwrite', the data are a copy-on-write
+            memory-mapped view of the files. If 'readonly', the view is
+            read-only. If False, the data are read in memory. A window which
+            spans several slices is always copied.
+        """
+        return _load_tod_native(dirname, detectors, samples, mmap)
+
 
 #-------------------------------------------------------------------------------
 
@@ -777,6 +826,142 @@ def validate_sliced_shape(shape, nsamples=None):
 #-------------------------------------------------------------------------------
 
 
+def _open_fits(filename, mmap):
+    """
+    Open a FITS file, whose data are memory-mapped if mmap is True,
+    'copyonwrite' or 'readonly'.
+    """
+    if not mmap:
+        return pyfits.open(filename)
+    if mmap is True:
+        mmap = 'copyonwrite'
+    if mmap not in ('copyonwrite', 'readonly'):
+        raise ValueError("Invalid mmap mode '" + str(mmap) + "'. Expected va" \
+                         "lues are True, 'copyonwrite' or 'readonly'.")
+    return pyfits.open(filename, memmap=True, mode=mmap)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _save_tod_native(dirname, tod, append):
+    infofile = os.path.join(dirname, 'tod.json')
+    dtype = np.dtype(tod.dtype).newbyteorder('<')
+    if append and os.path.exists(infofile):
+        info = json.load(open(infofile))
+        if tuple(info['shape']) != tod.shape[:-1] or \
+           info['dtype'] != dtype.str or info['unit'] != tod.unit:
+            raise ValueError("The Tod is incompatible with the container '" + \
+                             dirname + "'.")
+    else:
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        info = {'version':1, 'shape':list(tod.shape[:-1]), 'dtype':dtype.str,
+                'unit':tod.unit, 'slices':[]}
+
+    signal = tod.view(np.ndarray)
+    dest = 0
+    for n in tod.nsamples:
+        islice = len(info['slices'])
+        signalfile = 'signal_%05d.npy' % islice
+        np.save(os.path.join(dirname, signalfile),
+                np.ascontiguousarray(signal[...,dest:dest+n], dtype))
+        if tod.mask is not None:
+            maskfile = 'mask_%05d.npy' % islice
+            np.save(os.path.join(dirname, maskfile),
+                    np.packbits(tod.mask[...,dest:dest+n], axis=-1))
+        else:
+            maskfile = None
+        info['slices'].append({'nsamples':int(n), 'signal':signalfile,
+                               'mask':maskfile})
+        dest += n
+
+    if tod.derived_units:
+        pickle.dump(tod.derived_units, open(os.path.join(dirname,
+                    'derived_units.pickle'), 'wb'), pickle.HIGHEST_PROTOCOL)
+
+    # the description is updated last, so that an interrupted append leaves
+    # the container in its previous state
+    json.dump(info, open(infofile + '.tmp', 'w'), indent=1)
+    os.rename(infofile + '.tmp', infofile)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _load_tod_native(dirname, detectors, samples, mmap):
+    info = json.load(open(os.path.join(dirname, 'tod.json')))
+    if not mmap:
+        mmap_mode = None
+    elif mmap is True or mmap == 'copyonwrite':
+        mmap_mode = 'c'
+    elif mmap == 'readonly':
+        mmap_mode = 'r'
+    else:
+        raise ValueError("Invalid mmap mode '" + str(mmap) + "'. Expected va" \
+                         "lues are True, False, 'copyonwrite' or 'readonly'.")
+
+    if detectors is None:
+        detectors = ()
+    elif not isinstance(detectors, tuple):
+        detectors = (detectors,)
+    nsamples_tot = sum([s['nsamples'] for s in info['slices']])
+    if samples is None:
+        samples = slice(None)
+    start, stop, step = samples.indices(nsamples_tot)
+    if step != 1:
+        raise ValueError('The sample window must be contiguous.')
+
+    signals = []
+    masks = []
+    nsamples = []
+    offset = 0
+    for s in info['slices']:
+        first = max(start - offset, 0)
+        last = min(stop - offset, s['nsamples'])
+        offset += s['nsamples']
+        if first >= last:
+            continue
+        signal = np.load(os.path.join(dirname, s['signal']), mmap_mode)
+        signals.append(signal[detectors + (Ellipsis, slice(first, last))])
+        if s['mask'] is not None:
+            mask = np.load(os.path.join(dirname, s['mask']), mmap_mode)
+            mask = mask[detectors + (Ellipsis, slice(first // 8,
+                                                   (last + 7) // 8))]
+            mask = np.unpackbits(mask, axis=-1)
+            first_ = first - first // 8 * 8
+            masks.append(mask[...,first_:first_+last-first].view(np.bool8))
+        else:
+            masks.append(None)
+        nsamples.append(last - first)
+
+    if len(signals) == 0:
+        raise ValueError('The sample window is empty.')
+    if len(signals) == 1:
+        signal = signals[0]
+    else:
+        signal = np.concatenate(signals, axis=-1)
+    if all([m is None for m in masks]):
+        mask = None
+    elif len(masks) == 1:
+        mask = masks[0]
+    else:
+        mask = np.concatenate([m if m is not None else np.zeros(s.shape,
+                               np.bool8) for m, s in zip(masks, signals)],
+                              axis=-1)
+
+    derived_units = None
+    filename = os.path.join(dirname, 'derived_units.pickle')
+    if os.path.exists(filename):
+        derived_units = pickle.load(open(filename, 'rb'))
+
+    return Tod(signal, mask=mask, nsamples=nsamples, unit=str(info['unit']),
+               derived_units=derived_units, dtype=signal.dtype, copy=False)
+
+
+#-------------------------------------------------------------------------------
+
+
 def _save_derived_units(filename, du):
     if not du:
         return
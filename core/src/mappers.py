@@ -7,9 +7,12 @@ import time
 from mpi4py import MPI
 from . import var
 from .acquisitionmodels import Diagonal, DdTdd, Identity, Masking,\
-     AllReduce, Reshaping
+     AllReduce, Reshaping, Unpacking, _Distributed, _get_projection_normal
 from .datatypes import Map, Tod, create_fitsheader, flatten_sliced_shape
+from .profiling import Profiler
 from .quantity import Quantity, UnitError
+from .solvers import pcg, pipecg
+from .stringutils import strenum
 
 
 __all__ = [ 'mapper_naive', 'mapper_ls', 'mapper_rls' ]
@@ -47,9 +50,9 @@ def mapper_naive(tod, model, unit=None):
     else:
         copy = True
 
-    model = model * AllReduce().T
     if tod.mask is not None:
         model = Masking(tod.mask) * model
+    model = model.simplify()
 
     # model.T expects a quantity / detector, we hide our units to 
     # prevent a unit validation exception
@@ -61,6 +64,15 @@ def mapper_naive(tod, model, unit=None):
     unity = Tod(tod_, copy=copy)
     unity[:] = 1.
     map_weights = model.T(unity, True, True, True)
+
+    # only the map pixels observed by at least one processor are reduced
+    if var.mpi_comm.Get_size() > 1:
+        allreduce = AllReduce(support=map_weights != 0)
+    else:
+        allreduce = AllReduce()
+    mymap = allreduce(mymap, True)
+    map_weights = allreduce(map_weights, True)
+
     old_settings = np.seterr(divide='ignore', invalid='ignore')
     mymap /= map_weights
     mymap.unit = tod.unit
@@ -99,11 +111,12 @@ def mapper_naive(tod, model, unit=None):
 
 def mapper_ls(tod, model, weight=None, unpacking=None, x0=None, tol=1.e-5,
               maxiter=300, M=None, solver=None, verbose=True, callback=None,
-              profile=None):
+              profile=None, mixed_precision=False):
 
     return mapper_rls(tod, model, weight=weight, unpacking=unpacking, hyper=0,
                       x0=x0, tol=tol, maxiter=maxiter, M=M, solver=solver,
-                      verbose=verbose, callback=callback, profile=profile)
+                      verbose=verbose, callback=callback, profile=profile,
+                      mixed_precision=mixed_precision)
 
 
 #-------------------------------------------------------------------------------
@@ -111,7 +124,7 @@ def mapper_ls(tod, model, weight=None, unpacking=None, x0=None, tol=1.e-5,
 
 def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
                tol=1.e-5, maxiter=300, M=None, solver=None, verbose=True,
-               callback=None, profile=None):
+               callback=None, profile=None, mixed_precision=False):
 
     # make sure that the tod unit is compatible with the model's output unit
     if tod.unit == '':
@@ -126,21 +139,28 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
 
     if solver is None:
         solver = scipy.sparse.linalg.bicgstab
+    elif isinstance(solver, str):
+        solvers = { 'pcg' : pcg, 'pipecg' : pipecg }
+        if solver not in solvers:
+            raise ValueError("Invalid solver '" + solver + "'. Expected val" \
+                "ues are " + strenum(sorted(solvers.keys()), 'or') + '.')
+        solver = solvers[solver]
 
     if weight is None:
         weight = Identity(description='Weight')
 
-    C = model.T * weight * model
-
-    if hyper != 0:
-        ntods = tod.size if tod.mask is None else np.sum(tod.mask == 0)
-        ntods = var.mpi_comm.allreduce(ntods, op=MPI.SUM)
-        nmaps = model.shape[1]
-        if var.mpi_comm.Get_rank() == 0:
-            hyper = np.array(hyper * ntods / nmaps, dtype=var.FLOAT_DTYPE)
-            dxTdx = DdTdd(axis=1, scalar=hyper)
-            dyTdy = DdTdd(axis=0, scalar=hyper)
-            C += dxTdx + dyTdy
+    # in mixed precision, the timeline-sized weight of the fused normal
+    # operator is stored in single precision, while the map, the solver
+    # vectors and the dot products are kept in the working precision
+    model = model.simplify()
+    C = _get_projection_normal(model, weight,
+                               np.float32 if mixed_precision else None)
+    if C is None:
+        if mixed_precision:
+            raise ValueError('Mixed precision requires a model made of masks' \
+                ', diagonal operators, an average compression and a projecti' \
+                "on with 'full' storage, and a diagonal weight.")
+        C = (model.T * weight * model).simplify()
 
     # linear solvers handle vectors. the default unpacking is a reshape
     shapein = flatten_sliced_shape(model.shapein)
@@ -150,12 +170,50 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
 
     if not isinstance(unpacking, Reshaping):
         C = unpacking.T * C * unpacking
-    C = AllReduce() * C
+
+    # only the map pixels observed by at least one processor are reduced
+    support = None
+    if var.mpi_comm.Get_size() > 1:
+        coverage = model.T(np.ones(tod.shape), True, True, True)
+        if isinstance(unpacking, Reshaping):
+            support = coverage != 0
+        elif isinstance(unpacking, (Masking, Unpacking)):
+            support = unpacking.T(coverage) != 0
+    allreduce = AllReduce(support=support)
+    C_local = C
+    C = allreduce * C
+
+    # the map being the same on all processors, the regularisation is applied
+    # after the reduction, while the latter is in progress
+    if hyper != 0:
+        ntods = tod.size if tod.mask is None else np.sum(tod.mask == 0)
+        ntods = var.mpi_comm.allreduce(ntods, op=MPI.SUM)
+        nmaps = model.shape[1]
+        hyper = np.array(hyper * ntods / nmaps, dtype=var.FLOAT_DTYPE)
+        dxTdx = DdTdd(axis=1, scalar=hyper)
+        dyTdy = DdTdd(axis=0, scalar=hyper)
+        if isinstance(unpacking, Reshaping):
+            regularisation = dxTdx + dyTdy
+        else:
+            regularisation = unpacking.T * (dxTdx + dyTdy) * unpacking
+        C = C + regularisation
 
     if unpacking.shapein is None or len(unpacking.shapein) > 1:
         unpacking = unpacking * reshaping
 
-    rhs = (AllReduce() * unpacking.T * model.T * weight)(tod)
+    # the operators applied by the mapper are instrumented by the profiler
+    profiler = profile if isinstance(profile, Profiler) else None
+    if profiler is not None:
+        profile = None
+
+    B = allreduce * unpacking.T * model.T * weight
+    if profiler is not None:
+        profiler.start(B)
+    try:
+        rhs = B(tod)
+    finally:
+        if profiler is not None:
+            profiler.stop()
 
     if not np.all(np.isfinite(rhs)):
         raise ValueError('RHS contains not finite values.')
@@ -183,6 +241,12 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
         def __init__(self):
             self.niterations = 0
             self.residual = 0.
+        def update(self, niterations, residual):
+            self.niterations = niterations
+            self.residual = residual
+            if verbose and var.mpi_comm.Get_rank() == 0: 
+                print('Iteration ' + str(self.niterations) + ': ' + \
+                      str(self.residual))
         def __call__(self, x):
             import inspect
             parent_locals = inspect.stack()[1][0].f_locals
@@ -197,6 +261,32 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
     if callback is None:
         callback = PcgCallback()
 
+    # the pipelined solver overlaps the reduction of its dot products with
+    # the application of the operator, which pays off if the vectors are
+    # distributed: each processor handles the range of the map pixels it
+    # owns in the reduction. The regularisation, which is the same on all
+    # the processors, is added to the local operator of the first processor
+    # only, so that it is counted once in the reduction
+    solver_keywords = {}
+    distribution = None
+    if solver is pipecg and var.mpi_comm.Get_size() > 1:
+        if hyper == 0 and support is not None:
+            distribution = allreduce
+        else:
+            distribution = AllReduce(support=np.ones(C.shape[1], bool))
+        if hyper != 0 and var.mpi_comm.Get_rank() == 0:
+            C_local = C_local + regularisation
+        C = _Distributed(C_local, distribution)
+        rhs = distribution.get_owned(rhs)
+        if x0 is None:
+            x0_full = np.zeros(distribution.support_size, var.FLOAT_DTYPE)
+        else:
+            x0_full = x0.copy()
+            x0 = distribution.get_owned(x0)
+        if M is not None:
+            M = _Distributed(M, distribution, reduce=False)
+        solver_keywords['comm'] = var.mpi_comm
+
     if var.verbose or profile:
         print('')
         print('Model:')
@@ -208,7 +298,8 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
     time0 = time.time()
     if profile is not None:
         def run():
-            solution,info = solver(C, rhs, x0=x0, tol=tol, maxiter=maxiter, M=M)
+            solution,info = solver(C, rhs, x0=x0, tol=tol, maxiter=maxiter, M=M,
+                                   **solver_keywords)
             if info < 0:
                 print('Solver failure: info='+str(info))
         cProfile.runctx('run()', globals(), locals(), profile+'.prof')
@@ -218,8 +309,16 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
         os.system('rm -f ' + profile + '.prof' + ' ' + profile + '.dot')
         return None
     else:
-        solution, info = solver(C, rhs, x0=x0, tol=tol, maxiter=maxiter,
-                                callback=callback, M=M)
+        if profiler is not None:
+            profiler.start(C)
+            if M is not None:
+                profiler.start(M)
+        try:
+            solution, info = solver(C, rhs, x0=x0, tol=tol, maxiter=maxiter,
+                                    callback=callback, M=M, **solver_keywords)
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
     if info < 0:
         raise RuntimeError('Solver failure (code=' + str(info) + ' after ' + \
@@ -229,6 +328,10 @@ def mapper_rls(tod, model, weight=None, unpacking=None, hyper=1.0, x0=None,
         print('Warning: Solver reached maximum number of iterations without r' \
               'eaching tolerance value.')
 
+    # the map pixels outside the distributed range are those of the guess
+    if distribution is not None:
+        solution = distribution.allgather(solution, x0_full)
+
     output = Map(unpacking(solution, True, True, True), copy=False)
     output.unit = tod.unit + ' ' + (1/Quantity(1, model.unitout)).unit + ' ' + \
                   Quantity(1, model.unitin).unit
@@ -1,18 +1,28 @@
 module module_deglitching
 
-    use module_math,           only : moment, mad, sigma_clipping
-    use module_pointingmatrix, only : pointingelement, backprojection_weighted_roi
+    use module_math,           only : mad, sigma_clipping
+    use module_pointingmatrix, only : pointingelement
+    use module_precision,      only : sp
     use module_string,         only : strinteger, strternary
     use module_tamasis,        only : p, info_time
     implicit none
     private
 
     public :: deglitch_l2b
+    public :: deglitch_index_count
+    public :: deglitch_index_fill
+    public :: deglitch_index_l2b
+    public :: deglitch_index_l2b_iterative
+
+    integer, parameter :: MIN_SAMPLE_SIZE = 5
 
 
 contains
 
 
+    ! Second level deglitching. For each time, the detector samples are averaged in the sky map pixels. For each sky map pixel,
+    ! these averages are sigma clipped, using the standard deviation or the MAD. The samples which contribute to a clipped average
+    ! are masked.
     subroutine deglitch_l2b(pmatrix, nx, ny, timeline, mask, nsigma, use_mad, verbose)
 
         type(pointingelement), intent(in) :: pmatrix(:,:,:)
@@ -23,59 +33,36 @@ contains
         logical, intent(in)               :: use_mad
         logical, intent(in), optional     :: verbose
 
-        integer, parameter   :: MIN_SAMPLE_SIZE = 5
-        integer              :: npixels_per_sample, npixels_per_frame
-        integer              :: ndetectors, ntimes
-        integer              :: hitmap(0:nx*ny-1)
-        integer              :: roi(2,2,size(timeline,1))
-        integer              :: i, j, ipixel, itime, idetector, isample, imap, iminimap, iv
-        integer              :: xmin, xmax, ymin, ymax
-        integer              :: nv, nhits_max
-        real(p)              :: mv, stddev
-        real(p), allocatable :: map(:,:)
-        real(p), allocatable :: arrv(:)
-        integer, allocatable :: arrt(:)
-        logical, allocatable :: isglitch(:)
-        integer              :: count_start
-        integer*8            :: nbads
-        logical              :: verbose_
-        
-        verbose_ = .false.
-        if (present(verbose)) verbose_ = verbose
+        integer*8              :: offsets(0:nx*ny)
+        integer, allocatable   :: isamples(:), idetectors(:)
+        real(sp), allocatable  :: weights(:)
 
-        nbads = count(mask)
-        call system_clock(count_start)
+        call deglitch_index_count(pmatrix, nx*ny, offsets)
+        allocate (isamples(0:offsets(nx*ny)-1), idetectors(0:offsets(nx*ny)-1), weights(0:offsets(nx*ny)-1))
+        call deglitch_index_fill(pmatrix, offsets, isamples, idetectors, weights)
+        call deglitch_index_l2b(offsets, isamples, idetectors, weights, timeline, mask, nsigma, use_mad, verbose)
 
-        npixels_per_sample = size(pmatrix,1)
-        ntimes     = size(pmatrix,2)
-        ndetectors = size(pmatrix,3)
-
-        ! compute the largest size of a frame mini-map
-        npixels_per_frame = 0
-        !$omp parallel do reduction(max:npixels_per_frame) private(xmin,xmax,ymin,ymax)
-        do itime=1, ntimes
-            xmin = minval(modulo(pmatrix(:,itime,:)%pixel,nx), pmatrix(:,itime,:)%pixel /= -1) + 1
-            xmax = maxval(modulo(pmatrix(:,itime,:)%pixel,nx), pmatrix(:,itime,:)%pixel /= -1) + 1
-            ymin = minval(pmatrix(:,itime,:)%pixel / nx, pmatrix(:,itime,:)%pixel /= -1) + 1
-            ymax = maxval(pmatrix(:,itime,:)%pixel / nx, pmatrix(:,itime,:)%pixel /= -1) + 1
-            npixels_per_frame = max(npixels_per_frame, (xmax-xmin+1)*(ymax-ymin+1))
-        end do
-        !$omp end parallel do
+    end subroutine deglitch_l2b
 
-        allocate (map(0:npixels_per_frame-1,ntimes))
 
-        !$omp parallel do
-        do itime=1, ntimes
-            call backprojection_weighted_roi(pmatrix, nx, timeline, mask, itime, map(:,itime), roi(:,:,itime))
-        end do
-        !$omp end parallel do
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Compute the offsets of the sky map pixels in the inverse of the pointing matrix, stored in compressed sparse row format
+    subroutine deglitch_index_count(pmatrix, npixels, offsets)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        integer, intent(in)               :: npixels
+        integer*8, intent(out)            :: offsets(0:npixels)
+
+        integer                           :: hitmap(0:npixels-1)
+        integer                           :: ipixel, isample, idetector, i
 
-        ! compute hit map, to determine the maximum number of hits
         hitmap = 0
-        !$omp parallel do reduction(+:hitmap) private(idetector,isample,ipixel)
-        do idetector = 1, ndetectors
-            do isample = 1, ntimes
-                do ipixel = 1, npixels_per_sample
+        !$omp parallel do reduction(+:hitmap) private(isample, ipixel)
+        do idetector = 1, size(pmatrix,3)
+            do isample = 1, size(pmatrix,2)
+                do ipixel = 1, size(pmatrix,1)
                     if (pmatrix(ipixel,isample,idetector)%pixel == -1) exit
                     hitmap(pmatrix(ipixel,isample,idetector)%pixel) = hitmap(pmatrix(ipixel,isample,idetector)%pixel) + 1
                 end do
@@ -83,79 +70,217 @@ contains
         end do
         !$omp end parallel do
 
-        nhits_max = maxval(hitmap)
+        offsets(0) = 0
+        do i = 0, npixels - 1
+            offsets(i+1) = offsets(i) + hitmap(i)
+        end do
+
+    end subroutine deglitch_index_count
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Fill the inverse of the pointing matrix: for each sky map pixel, the sample and detector indices and the weights of the
+    ! pointing matrix elements which contribute to it, ordered by sample
+    subroutine deglitch_index_fill(pmatrix, offsets, isamples, idetectors, weights)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        integer*8, intent(in)             :: offsets(0:)
+        integer, intent(out)              :: isamples(0:offsets(size(offsets)-1)-1)
+        integer, intent(out)              :: idetectors(0:offsets(size(offsets)-1)-1)
+        real(sp), intent(out)             :: weights(0:offsets(size(offsets)-1)-1)
+
+        integer*8                         :: dest(0:size(offsets)-2)
+        integer                           :: ipixel, isample, idetector, imap
+
+        dest = offsets(0:size(offsets)-2)
+        do isample = 1, size(pmatrix,2)
+            do idetector = 1, size(pmatrix,3)
+                do ipixel = 1, size(pmatrix,1)
+                    imap = pmatrix(ipixel,isample,idetector)%pixel
+                    if (imap == -1) exit
+                    isamples(dest(imap)) = isample
+                    idetectors(dest(imap)) = idetector
+                    weights(dest(imap)) = pmatrix(ipixel,isample,idetector)%weight
+                    dest(imap) = dest(imap) + 1
+                end do
+            end do
+        end do
+
+    end subroutine deglitch_index_fill
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Second level deglitching using the inverse of the pointing matrix. The sky map pixels are processed in parallel, and the
+    ! statistics are computed from the mask on input, so that the result does not depend on the processing order. If specified,
+    ! only the sky map pixels flagged in 'active' are processed.
+    subroutine deglitch_index_l2b(offsets, isamples, idetectors, weights, timeline, mask, nsigma, use_mad, verbose, active)
+
+        integer*8, intent(in)          :: offsets(0:)
+        integer, intent(in)            :: isamples(0:)
+        integer, intent(in)            :: idetectors(0:)
+        real(sp), intent(in)           :: weights(0:)
+        real(p), intent(in)            :: timeline(:,:)
+        logical(kind=1), intent(inout) :: mask(:,:)
+        real(p), intent(in)            :: nsigma
+        logical, intent(in)            :: use_mad
+        logical, intent(in), optional  :: verbose
+        logical, intent(in), optional  :: active(0:)
 
-        !$omp parallel private(i,j,itime,imap,iminimap,nv,ipixel,arrv,arrt,isglitch,mv,stddev)
+        integer                        :: npixels, imap, isample, iv, nv, nhits_max
+        integer*8                      :: k, kstart
+        real(p)                        :: value, mv, stddev
+        real(sp)                       :: weight
+        real(p), allocatable           :: arrv(:)
+        integer*8, allocatable         :: arrk(:)
+        logical, allocatable           :: isglitch(:)
+        logical(kind=1), allocatable   :: mask_in(:,:)
+        integer                        :: count_start
+        integer*8                      :: nbads
+        logical                        :: verbose_
+
+        verbose_ = .false.
+        if (present(verbose)) verbose_ = verbose
+
+        nbads = count(mask)
+        call system_clock(count_start)
+
+        npixels = size(offsets) - 1
+        nhits_max = int(maxval(offsets(1:npixels) - offsets(0:npixels-1)))
+        allocate (mask_in(size(mask,1),size(mask,2)))
+        mask_in = mask
+
+        !$omp parallel private(imap, isample, iv, nv, k, kstart, value, weight, mv, stddev, arrv, arrk, isglitch)
         allocate (arrv(nhits_max))
-        allocate (arrt(nhits_max))
+        allocate (arrk(nhits_max))
         allocate (isglitch(nhits_max))
 
-        ! we loop over each sky pixel
         !$omp do schedule(dynamic, 128)
-        do imap = 0, nx*ny-1
-
-            i = mod(imap, nx) + 1
-            j = imap / nx + 1
+        do imap = 0, npixels - 1
 
-            if (hitmap(imap) < MIN_SAMPLE_SIZE) cycle
+            if (offsets(imap+1) - offsets(imap) < MIN_SAMPLE_SIZE) cycle
+            if (present(active)) then
+                if (.not. active(imap)) cycle
+            end if
 
-            ! construct the sample of sky pixels in the minimaps that match the current sky map pixel (i,j)
+            ! construct the sample of the averages of the detector samples which fall in the sky pixel, for each time
             nv = 0
-            do itime=1, ntimes
-
-                ! test if the current sky pixel is in the minimap
-                if (i < roi(1,1,itime) .or. i > roi(1,2,itime) .or. j < roi(2,1,itime) .or. j > roi(2,2,itime)) cycle
-                
-                ! test that the current sky pixel is not NaN in the minimap
-                iminimap = i-roi(1,1,itime) + (roi(1,2,itime)-roi(1,1,itime)+1) * (j-roi(2,1,itime))
-                if (map(iminimap,itime) /= map(iminimap,itime)) cycle
-
-                ! the sky pixel is in the minimap, let's add it to the sample
+            k = offsets(imap)
+            do while (k < offsets(imap+1))
+                kstart = k
+                isample = isamples(k)
+                value = 0
+                weight = 0
+                do while (k < offsets(imap+1))
+                    if (isamples(k) /= isample) exit
+                    if (.not. mask_in(isample,idetectors(k))) then
+                        value = value + timeline(isample,idetectors(k)) * weights(k)
+                        weight = weight + weights(k)
+                    end if
+                    k = k + 1
+                end do
+                if (weight <= 0) cycle
                 nv = nv + 1
-                arrv(nv) = map(iminimap,itime)
-                arrt(nv) = itime
-                
+                arrv(nv) = value / weight
+                arrk(nv) = kstart
             end do
-            
+
             ! check we have enough samples
             if (nv < MIN_SAMPLE_SIZE) cycle
-            
-            ! sigma clip on arrv
+
+            ! sigma clip on arrv. The medians are obtained by selection
             if (use_mad) then
-                stddev = 1.4826_p * mad(arrv(1:nv),mv)
-                isglitch(1:nv) = abs(arrv(1:nv)-mv) >  nsigma * stddev
+                stddev = 1.4826_p * mad(arrv(1:nv), mv)
+                isglitch(1:nv) = abs(arrv(1:nv) - mv) > nsigma * stddev
             else
                 call sigma_clipping(arrv(1:nv), isglitch(1:nv), nsigma)
             end if
-            
-            
+
             ! update mask
-            do iv=1, nv
+            do iv = 1, nv
                 if (.not. isglitch(iv)) cycle
-                do idetector=1, ndetectors
-                    do ipixel=1, npixels_per_sample
-                        if (pmatrix(ipixel,arrt(iv),idetector)%pixel == imap) then
-                            mask(arrt(iv),idetector) = .true.
-                            exit
-                        end if
-                    end do
+                k = arrk(iv)
+                isample = isamples(k)
+                do while (k < offsets(imap+1))
+                    if (isamples(k) /= isample) exit
+                    mask(isample,idetectors(k)) = .true.
+                    k = k + 1
                 end do
             end do
+
         end do
         !$omp end do
         deallocate (arrv)
-        deallocate (arrt)
+        deallocate (arrk)
         deallocate (isglitch)
         !$omp end parallel
 
-        deallocate (map)
-
         if (verbose_) then
             call info_time('Deglitching (' // strternary(use_mad, 'mad','std') // ')', count_start,                                &
                            '(number of flagged samples: ' // strinteger(count(mask)-nbads) // ')')
         end if
 
-    end subroutine deglitch_l2b
+    end subroutine deglitch_index_l2b
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Iterative second level deglitching: the deglitching is repeated until no new glitch is found, or until the maximum number of
+    ! iterations is reached. The statistics of a sky map pixel only change if one of its samples has been masked in the previous
+    ! iteration, so only these sky map pixels are processed again. The result is the same as that of a full deglitching at each
+    ! iteration. On output, counts(i) is the number of samples flagged during the i-th iteration.
+    subroutine deglitch_index_l2b_iterative(offsets, isamples, idetectors, weights, timeline, mask, nsigma, use_mad, counts,       &
+                                            niterations, verbose)
+
+        integer*8, intent(in)          :: offsets(0:)
+        integer, intent(in)            :: isamples(0:)
+        integer, intent(in)            :: idetectors(0:)
+        real(sp), intent(in)           :: weights(0:)
+        real(p), intent(in)            :: timeline(:,:)
+        logical(kind=1), intent(inout) :: mask(:,:)
+        real(p), intent(in)            :: nsigma
+        logical, intent(in)            :: use_mad
+        integer*8, intent(out)         :: counts(:)
+        integer, intent(out)           :: niterations
+        logical, intent(in), optional  :: verbose
+
+        logical                        :: active(0:size(offsets)-2)
+        logical(kind=1), allocatable   :: mask_old(:,:)
+        integer                        :: imap
+        integer*8                      :: k
+
+        allocate (mask_old(size(mask,1),size(mask,2)))
+        counts = 0
+        active = .true.
+        niterations = 0
+        do while (niterations < size(counts))
+
+            mask_old = mask
+            call deglitch_index_l2b(offsets, isamples, idetectors, weights, timeline, mask, nsigma, use_mad, verbose, active)
+            niterations = niterations + 1
+            counts(niterations) = count(mask .neqv. mask_old)
+            if (counts(niterations) == 0) exit
+
+            ! flag the sky map pixels which have a sample masked during this iteration
+            !$omp parallel do schedule(dynamic, 128) private(k)
+            do imap = 0, size(active) - 1
+                active(imap) = .false.
+                do k = offsets(imap), offsets(imap+1) - 1
+                    if (mask(isamples(k),idetectors(k)) .neqv. mask_old(isamples(k),idetectors(k))) then
+                        active(imap) = .true.
+                        exit
+                    end if
+                end do
+            end do
+            !$omp end parallel do
+
+        end do
+
+    end subroutine deglitch_index_l2b_iterative
 
 
 end module module_deglitching
@@ -975,17 +975,13 @@ contains
         character(len=*), intent(in) :: filename
         integer, intent(out)         :: status
 
-        integer                      :: unit
+        integer                      :: unit, status_unit
  
         ft_test_extension = .false.
 
-        ! get an unused logical unit number for the FITS file
-        status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        ! open the fits file and move to the specified extension
-        call ftnopn(unit, filename, CFITSIO_READONLY, status)
+        ! get an unused logical unit number, open the fits file and move to the specified extension
+        call ft_open_unit(filename, 'n', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         ft_test_extension = status == 0
         if (status == 301) then
             status = 0
@@ -1008,14 +1004,11 @@ contains
         integer, intent(out)         :: unit
         integer, intent(out)         :: status
 
-        status = 0
+        integer                      :: status_unit
 
-        ! get an unused logical unit number for the FITS file
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        ! open the fits file and move to the specified extension
-        call ftnopn(unit, filename, CFITSIO_READONLY, status)
+        ! get an unused logical unit number, open the fits file and move to the specified extension
+        call ft_open_unit(filename, 'n', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
     end subroutine ft_open_must_exist
@@ -1031,15 +1024,13 @@ contains
         logical, intent(out)         :: found
         integer, intent(out)         :: status
 
-        found = .false.
-        status = 0
+        integer                      :: status_unit
 
-        ! get an unused logical unit number for the FITS file
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
+        found = .false.
 
-        ! open the fits file and move to the specified extension
-        call ftnopn(unit, filename, CFITSIO_READONLY, status)
+        ! get an unused logical unit number, open the fits file and move to the specified extension
+        call ft_open_unit(filename, 'n', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (status == 301) then
             call ft_close(unit, status)
             return
@@ -1062,18 +1053,13 @@ contains
         integer, allocatable, intent(out) :: imageshape(:)
         integer, intent(out)              :: status
 
-        integer                           :: nfound
+        integer                           :: nfound, status_unit
         integer                           :: imageshape_(8)
 
-        status = 0
-
-        ! get an unused logical unit number for the FITS file
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        ! open the fits file and move to the HDU specified in the filename
+        ! get an unused logical unit number, open the fits file and move to the HDU specified in the filename
         ! otherwise, move to the first image in FITS file
-        call ftiopn(unit, filename, CFITSIO_READONLY, status)
+        call ft_open_unit(filename, 'i', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         !  Determine the size of the image.
@@ -1106,16 +1092,11 @@ contains
         integer, intent(out)         :: status
 
         integer                      :: naxes(8)
-        integer                      :: nfound, ncolumns
+        integer                      :: nfound, ncolumns, status_unit
 
-        status = 0
-
-        ! get an unused logical unit number for the FITS file
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        ! open the fits file and move to the specified extension
-        call fttopn(unit, filename, CFITSIO_READONLY, status)
+        ! get an unused logical unit number, open the fits file and move to the specified extension
+        call ft_open_unit(filename, 't', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         !  Determine the size of the image.
@@ -1148,10 +1129,12 @@ contains
         !  The FITS file must always be closed before exiting the program.
         !  Any unit numbers allocated with FTGIOU must be freed with FTFIOU.
         status = 0
-        call ftclos(unit, status)
-        if (ft_check_error_cfitsio(status)) continue
         status_release = 0
+        !$omp critical (ft_unit)
+        call ftclos(unit, status)
         call ftfiou(unit, status_release)
+        !$omp end critical (ft_unit)
+        if (ft_check_error_cfitsio(status)) continue
         if (ft_check_error_cfitsio(status_release) .and. status == 0) then
             status = status_release
         end if
@@ -1162,6 +1145,43 @@ contains
     !-------------------------------------------------------------------------------------------------------------------------------
 
 
+    ! get an unused logical unit number and open (n: any HDU, i: image, t: table) or create (w) the FITS file.
+    ! The unit table of the CFITSIO Fortran wrapper is not locked, so that the unit allocation and the opening are serialised:
+    ! files may be opened from different threads. status_unit is the status of the unit allocation, status that of the opening.
+    subroutine ft_open_unit(filename, mode, unit, status_unit, status)
+
+        character(len=*), intent(in) :: filename
+        character, intent(in)        :: mode
+        integer, intent(out)         :: unit
+        integer, intent(out)         :: status_unit
+        integer, intent(out)         :: status
+
+        status_unit = 0
+        status = 0
+        !$omp critical (ft_unit)
+        call ftgiou(unit, status_unit)
+        if (status_unit == 0) then
+            select case (mode)
+            case ('n')
+                call ftnopn(unit, filename, CFITSIO_READONLY, status)
+            case ('i')
+                call ftiopn(unit, filename, CFITSIO_READONLY, status)
+            case ('t')
+                call fttopn(unit, filename, CFITSIO_READONLY, status)
+            case ('w')
+                call ftinit(unit, filename, 1, status)
+            end select
+        else
+            status = status_unit
+        end if
+        !$omp end critical (ft_unit)
+
+    end subroutine ft_open_unit
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
     subroutine ft_create_header(naxis1, naxis2, cd, crval1, crval2, crpix1, crpix2, header)
 
         integer, intent(in) :: naxis1, naxis2
@@ -1223,7 +1243,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)            :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(1)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(1)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1233,10 +1253,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1277,7 +1295,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)            :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(2)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(2)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1287,10 +1305,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1331,7 +1347,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)            :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis
+        integer                  :: irec, unit, status_unit, bitpix, naxis
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1341,10 +1357,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1384,7 +1398,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(1)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(1)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1394,10 +1408,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1438,7 +1450,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(1)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(1)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1448,10 +1460,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1512,7 +1522,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(2)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(2)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1522,10 +1532,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1566,7 +1574,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis, naxes(2)
+        integer                  :: irec, unit, status_unit, bitpix, naxis, naxes(2)
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1576,10 +1584,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1640,7 +1646,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis
+        integer                  :: irec, unit, status_unit, bitpix, naxis
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1650,10 +1656,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1693,7 +1697,7 @@ contains
         character(len=*), intent(in), optional :: header
         integer, intent(out)                   :: status
 
-        integer                  :: irec, unit, blocksize, bitpix, naxis
+        integer                  :: irec, unit, status_unit, bitpix, naxis
         logical                  :: simple, extend
         character(len=FLEN_CARD) :: record
 
@@ -1703,10 +1707,8 @@ contains
 
         ! open and initialise the fits file
         status = 0
-        call ftgiou(unit, status)
-        if (ft_check_error_cfitsio(status, filename=filename)) return
-
-        call ftinit(unit, filename, blocksize, status)
+        call ft_open_unit(filename, 'w', unit, status_unit, status)
+        if (ft_check_error_cfitsio(status_unit, filename=filename)) return
         if (ft_check_error_cfitsio(status, unit, filename)) return
 
         simple = .true.
@@ -1770,13 +1772,17 @@ contains
         integer                             :: nkeyrec
 
         status = 0
+        !$omp critical (ft_unit)
         call fits_open_file(fptr, filename // C_NULL_CHAR, CFITSIO_READONLY, status)
+        !$omp end critical (ft_unit)
         if (ft_check_error_cfitsio(status, filename=filename)) return
 
         call fits_hdr2str(fptr, 1, C_NULL_PTR, 0, c_header, nkeyrec, status)
         if (ft_check_error_cfitsio(status, filename=filename)) return
 
+        !$omp critical (ft_unit)
         call fits_close_file(fptr, status)
+        !$omp end critical (ft_unit)
         if (ft_check_error_cfitsio(status, filename=filename)) return
 
         ! check we can hold the header in memory
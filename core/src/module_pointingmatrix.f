@@ -10,7 +10,13 @@ module module_pointingmatrix
     public :: pointingelement
     public :: pmatrix_direct
     public :: pmatrix_transpose
+    public :: pmatrix_direct_batch
+    public :: pmatrix_transpose_batch
     public :: pmatrix_ptp
+    public :: pmatrix_ptwp
+    public :: pmatrix_ptwp_sp
+    public :: pmatrix_compressed_direct
+    public :: pmatrix_compressed_transpose
     public :: xy2roi
     public :: xy2pmatrix
     public :: roi2pmatrix
@@ -89,6 +95,82 @@ contains
     end subroutine pmatrix_transpose
 
 
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Apply the pointing matrix to a batch of maps in a single pass over the pointing matrix. The maps are interleaved, i.e. the
+    ! values of a pixel in the different maps are contiguous in memory.
+    subroutine pmatrix_direct_batch(pmatrix, map, timeline)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        real(p), intent(in)               :: map(:,0:)
+        real(p), intent(inout)            :: timeline(:,:,:)
+        integer                           :: ipixel, isample, idetector, npixels_per_sample, nsamples, ndetectors
+        real(p)                           :: value(size(map,1))
+
+        npixels_per_sample = size(pmatrix,1)
+        nsamples   = size(pmatrix, 2)
+        ndetectors = size(pmatrix, 3)
+
+        !$omp parallel do private(idetector, isample, ipixel, value)
+        do idetector = 1, ndetectors
+            do isample = 1, nsamples
+                value = 0
+                do ipixel = 1, npixels_per_sample
+                    if (pmatrix(ipixel,isample,idetector)%pixel == -1) exit
+                    value = value + map(:,pmatrix(ipixel,isample,idetector)%pixel) * pmatrix(ipixel,isample,idetector)%weight
+                end do
+                timeline(isample,idetector,:) = value
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_direct_batch
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Apply the transpose of the pointing matrix to a batch of timelines in a single pass over the pointing matrix. The output maps
+    ! are interleaved, as in pmatrix_direct_batch.
+    subroutine pmatrix_transpose_batch(pmatrix, timeline, map)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        real(p), intent(in)               :: timeline(:,:,:)
+        real(p), intent(out)              :: map(:,0:)
+        integer                           :: idetector, isample, ipixel, ibatch, npixels, nsamples, ndetectors
+        real(p)                           :: value(size(map,1))
+
+        npixels    = size(pmatrix, 1)
+        nsamples   = size(pmatrix, 2)
+        ndetectors = size(pmatrix, 3)
+
+        map = 0
+#ifdef GFORTRAN
+        !$omp parallel do reduction(+:map) private(idetector, isample, ipixel, ibatch, value)
+#else
+        !$omp parallel do private(idetector, isample, ipixel, ibatch, value)
+#endif
+        do idetector = 1, ndetectors
+            do isample = 1, nsamples
+                value = timeline(isample,idetector,:)
+                do ipixel = 1, npixels
+                    if (pmatrix(ipixel,isample,idetector)%pixel == -1) exit
+                    do ibatch = 1, size(map,1)
+#ifndef GFORTRAN
+                        !$omp atomic
+#endif
+                        map(ibatch,pmatrix(ipixel,isample,idetector)%pixel) = map(ibatch,pmatrix(ipixel,isample,idetector)%pixel) &
+                            + pmatrix(ipixel,isample,idetector)%weight * value(ibatch)
+                    end do
+                end do
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_transpose_batch
+
+
     !-------------------------------------------------------------------------------------------------------------------------------
    
    
@@ -129,6 +211,212 @@ contains
     !-------------------------------------------------------------------------------------------------------------------------------
 
 
+    ! Apply P^T C^T W C P to a map in a single pass over the pointing matrix, where C is the average compression by the
+    ! specified factor and W is a diagonal weight, without storing the intermediate timeline. The samples of null weight
+    ! are skipped.
+    subroutine pmatrix_ptwp(pmatrix, weight, factor, map, ptwp)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        real(p), intent(in)               :: weight(:,:)
+        integer, intent(in)               :: factor
+        real(p), intent(in)               :: map(0:)
+        real(p), intent(out)              :: ptwp(0:)
+        integer                           :: idetector, isample, ifine, ipixel, npixels_per_sample
+        real(p)                           :: value
+
+        npixels_per_sample = size(pmatrix, 1)
+
+        ptwp = 0
+#ifdef GFORTRAN
+        !$omp parallel do reduction(+:ptwp) private(idetector, isample, ifine, ipixel, value)
+#else
+        !$omp parallel do private(idetector, isample, ifine, ipixel, value)
+#endif
+        do idetector = 1, size(weight, 2)
+            do isample = 1, size(weight, 1)
+                if (weight(isample,idetector) == 0) cycle
+                value = 0
+                do ifine = (isample - 1) * factor + 1, isample * factor
+                    do ipixel = 1, npixels_per_sample
+                        if (pmatrix(ipixel,ifine,idetector)%pixel == -1) exit
+                        value = value + map(pmatrix(ipixel,ifine,idetector)%pixel) * pmatrix(ipixel,ifine,idetector)%weight
+                    end do
+                end do
+                value = value * weight(isample,idetector) / factor**2
+                do ifine = (isample - 1) * factor + 1, isample * factor
+                    do ipixel = 1, npixels_per_sample
+                        if (pmatrix(ipixel,ifine,idetector)%pixel == -1) exit
+#ifndef GFORTRAN
+                        !$omp atomic
+#endif
+                        ptwp(pmatrix(ipixel,ifine,idetector)%pixel) = ptwp(pmatrix(ipixel,ifine,idetector)%pixel) +              &
+                            pmatrix(ipixel,ifine,idetector)%weight * value
+                    end do
+                end do
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_ptwp
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Same as pmatrix_ptwp, for a weight stored in single precision. The timeline values and the map are accumulated in the
+    ! working precision.
+    subroutine pmatrix_ptwp_sp(pmatrix, weight, factor, map, ptwp)
+
+        type(pointingelement), intent(in) :: pmatrix(:,:,:)
+        real(sp), intent(in)              :: weight(:,:)
+        integer, intent(in)               :: factor
+        real(p), intent(in)               :: map(0:)
+        real(p), intent(out)              :: ptwp(0:)
+        integer                           :: idetector, isample, ifine, ipixel, npixels_per_sample
+        real(p)                           :: value
+
+        npixels_per_sample = size(pmatrix, 1)
+
+        ptwp = 0
+#ifdef GFORTRAN
+        !$omp parallel do reduction(+:ptwp) private(idetector, isample, ifine, ipixel, value)
+#else
+        !$omp parallel do private(idetector, isample, ifine, ipixel, value)
+#endif
+        do idetector = 1, size(weight, 2)
+            do isample = 1, size(weight, 1)
+                if (weight(isample,idetector) == 0) cycle
+                value = 0
+                do ifine = (isample - 1) * factor + 1, isample * factor
+                    do ipixel = 1, npixels_per_sample
+                        if (pmatrix(ipixel,ifine,idetector)%pixel == -1) exit
+                        value = value + map(pmatrix(ipixel,ifine,idetector)%pixel) * pmatrix(ipixel,ifine,idetector)%weight
+                    end do
+                end do
+                value = value * real(weight(isample,idetector), p) / factor**2
+                do ifine = (isample - 1) * factor + 1, isample * factor
+                    do ipixel = 1, npixels_per_sample
+                        if (pmatrix(ipixel,ifine,idetector)%pixel == -1) exit
+#ifndef GFORTRAN
+                        !$omp atomic
+#endif
+                        ptwp(pmatrix(ipixel,ifine,idetector)%pixel) = ptwp(pmatrix(ipixel,ifine,idetector)%pixel) +              &
+                            pmatrix(ipixel,ifine,idetector)%weight * value
+                    end do
+                end do
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_ptwp_sp
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Compressed storage of the pointing matrix:
+    !     - counts: number of pixels intercepted by a detector for each sample (unsigned 8-bit integer)
+    !     - weights: intersection area, quantized as unsigned 16-bit integers to be multiplied by scale
+    !     - pixels: stream of 16-bit words. Each word is the difference between the current and the previous pixel index of the
+    !       detector. If the difference does not fit, the word is -32768 and the next two words are the lower and upper halves of
+    !       the absolute pixel index.
+    !     - offsets: number of elements and words preceding each detector in the weights and pixels arrays
+    subroutine pmatrix_compressed_direct(counts, weights, scale, pixels, offsets, map, timeline)
+
+        integer*1, intent(in)  :: counts(:,:)
+        integer*2, intent(in)  :: weights(:)
+        real(p), intent(in)    :: scale
+        integer*2, intent(in)  :: pixels(:)
+        integer*8, intent(in)  :: offsets(:,:)
+        real(p), intent(in)    :: map(0:)
+        real(p), intent(inout) :: timeline(:,:)
+        integer                :: ipixel, isample, idetector, pixel
+        integer*8              :: ielement, iword
+
+        !$omp parallel do private(idetector, isample, ipixel, pixel, ielement, iword)
+        do idetector = 1, size(counts,2)
+            ielement = offsets(1,idetector)
+            iword    = offsets(2,idetector)
+            pixel    = 0
+            do isample = 1, size(counts,1)
+                timeline(isample,idetector) = 0
+                do ipixel = 1, iand(int(counts(isample,idetector)), 255)
+                    ielement = ielement + 1
+                    call decode_pixel(pixels, iword, pixel)
+                    timeline(isample,idetector) = timeline(isample,idetector) + map(pixel) *                                       &
+                        (iand(int(weights(ielement)), 65535) * scale)
+                end do
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_compressed_direct
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    subroutine pmatrix_compressed_transpose(counts, weights, scale, pixels, offsets, timeline, map)
+
+        integer*1, intent(in)  :: counts(:,:)
+        integer*2, intent(in)  :: weights(:)
+        real(p), intent(in)    :: scale
+        integer*2, intent(in)  :: pixels(:)
+        integer*8, intent(in)  :: offsets(:,:)
+        real(p), intent(in)    :: timeline(:,:)
+        real(p), intent(out)   :: map(0:)
+        integer                :: ipixel, isample, idetector, pixel
+        integer*8              :: ielement, iword
+
+        map = 0
+#ifdef GFORTRAN
+        !$omp parallel do reduction(+:map) private(idetector, isample, ipixel, pixel, ielement, iword)
+#else
+        !$omp parallel do private(idetector, isample, ipixel, pixel, ielement, iword)
+#endif
+        do idetector = 1, size(counts,2)
+            ielement = offsets(1,idetector)
+            iword    = offsets(2,idetector)
+            pixel    = 0
+            do isample = 1, size(counts,1)
+                do ipixel = 1, iand(int(counts(isample,idetector)), 255)
+                    ielement = ielement + 1
+                    call decode_pixel(pixels, iword, pixel)
+#ifndef GFORTRAN
+                    !$omp atomic
+#endif
+                    map(pixel) = map(pixel) + (iand(int(weights(ielement)), 65535) * scale) * timeline(isample,idetector)
+                end do
+            end do
+        end do
+        !$omp end parallel do
+
+    end subroutine pmatrix_compressed_transpose
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    pure subroutine decode_pixel(pixels, iword, pixel)
+
+        integer*2, intent(in)    :: pixels(:)
+        integer*8, intent(inout) :: iword
+        integer, intent(inout)   :: pixel
+
+        iword = iword + 1
+        if (pixels(iword) == -32767 - 1) then
+            pixel = ior(iand(int(pixels(iword+1)), 65535), ishft(int(pixels(iword+2)), 16))
+            iword = iword + 2
+        else
+            pixel = pixel + pixels(iword)
+        end if
+
+    end subroutine decode_pixel
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
     subroutine backprojection_weighted(pmatrix, timeline, mask, map, weight, threshold)
         type(pointingelement), intent(in)     :: pmatrix(:,:,:)
         real(kind=p), intent(in)              :: timeline(:,:)
@@ -11,6 +11,10 @@ module module_preprocessor
     public :: divide_vectordim2
     public :: interpolate_linear
     public :: median_filtering
+    public :: median_filtering_multi
+    public :: MEDIAN_KERNEL_AUTO
+    public :: MEDIAN_KERNEL_HISTOGRAM
+    public :: MEDIAN_KERNEL_SORTED
     public :: multiply_vectordim2
     public :: remove_nan
     public :: subtract_meandim1
@@ -20,6 +24,14 @@ module module_preprocessor
         module procedure interpolate_linear_equally_spaced_1d_1d, interpolate_linear_equally_spaced_1d_2d
     end interface interpolate_linear
 
+    integer, parameter :: MEDIAN_KERNEL_AUTO = 0
+    integer, parameter :: MEDIAN_KERNEL_HISTOGRAM = 1
+    integer, parameter :: MEDIAN_KERNEL_SORTED = 2
+
+    ! largest window length for which the sorted window kernel is faster than the histogram one. On 2e5-sample timelines, the
+    ! crossover is around 2500 samples, for white noise as well as for drifting timelines
+    integer, parameter :: MEDIAN_KERNEL_SORTED_MAX_LENGTH = 2000
+
     interface median_filtering
         module procedure median_filtering_mask_1d_1d, median_filtering_mask_1d_2d
         module procedure median_filtering_nomask_1d_1d, median_filtering_nomask_1d_2d
@@ -253,30 +265,156 @@ contains
     !-------------------------------------------------------------------------------------------------------------------------------
 
 
-    ! Median filtering in O(1) for the window length
+    ! Median filtering of a timeline, using the kernel most efficient for the window length
+    ! The filtered timeline is the input timeline minus its running median. Masked and NaN values are ignored.
+    subroutine median_filtering_mask_1d_1d(data, mask, length, kernel)
+
+        real(p), intent(inout)        :: data(:)
+        logical*1, intent(in)         :: mask(:)
+        integer, intent(in)           :: length
+        integer, intent(in), optional :: kernel
+
+        real(p) :: filtered(size(data),1)
+
+        call median_filtering_multi(data, mask, [length], filtered, kernel)
+        data = filtered(:,1)
+
+    end subroutine median_filtering_mask_1d_1d
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    subroutine median_filtering_nomask_1d_1d(data, length, kernel)
+
+        real(p), intent(inout)        :: data(:)
+        integer, intent(in)           :: length
+        integer, intent(in), optional :: kernel
+
+        logical*1, parameter          :: l1 = .false.
+        integer                       :: i
+
+        call median_filtering_mask_1d_1d(data, [(l1, i=1, size(data))], length, kernel)
+
+    end subroutine median_filtering_nomask_1d_1d
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    subroutine median_filtering_mask_1d_2d(data, mask, length, kernel)
+
+        real(p), intent(inout)        :: data(:,:)
+        logical*1, intent(in)         :: mask(:,:)
+        integer, intent(in)           :: length
+        integer, intent(in), optional :: kernel
+
+        integer                       :: i
+
+        !$omp parallel do schedule(dynamic)
+        do i = 1, size(data, 2)
+            call median_filtering(data(:,i), mask(:,i), length, kernel)
+        end do
+        !$omp end parallel do
+
+    end subroutine median_filtering_mask_1d_2d
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    subroutine median_filtering_nomask_1d_2d(data, length, kernel)
+
+        real(p), intent(inout)        :: data(:,:)
+        integer, intent(in)           :: length
+        integer, intent(in), optional :: kernel
+
+        integer                       :: i
+
+        !$omp parallel do schedule(dynamic)
+        do i = 1, size(data, 2)
+            call median_filtering(data(:,i), length, kernel)
+        end do
+        !$omp end parallel do
+
+    end subroutine median_filtering_nomask_1d_2d
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Median filtering of a timeline for several window lengths, in a single pass over the data.
+    ! The timeline sorting required by the histogram kernel is shared by the window lengths.
+    subroutine median_filtering_multi(data, mask, lengths, filtered, kernel)
+
+        real(p), intent(in)           :: data(:)
+        logical*1, intent(in)         :: mask(:)
+        integer, intent(in)           :: lengths(:)
+        real(p), intent(out)          :: filtered(size(data),size(lengths))
+        integer, intent(in), optional :: kernel
+
+        integer                       :: ndata, nbins, order(size(data)), ilength, kernel_
+        real(p), allocatable          :: table(:)
+        logical                       :: reordered
+
+        ndata = size(data)
+        reordered = .false.
+
+        do ilength = 1, size(lengths)
+
+            if (ndata <= lengths(ilength)) then
+                filtered(:,ilength) = data - median(data, mask)
+                cycle
+            end if
+
+            kernel_ = MEDIAN_KERNEL_AUTO
+            if (present(kernel)) kernel_ = kernel
+            if (kernel_ == MEDIAN_KERNEL_AUTO) then
+                if (lengths(ilength) <= MEDIAN_KERNEL_SORTED_MAX_LENGTH) then
+                    kernel_ = MEDIAN_KERNEL_SORTED
+                else
+                    kernel_ = MEDIAN_KERNEL_HISTOGRAM
+                end if
+            end if
+
+            if (kernel_ == MEDIAN_KERNEL_SORTED) then
+                call median_filtering_sorted(data, mask, lengths(ilength), filtered(:,ilength))
+            else
+                if (.not. reordered) then
+                    call reorder(data, mask, order, nbins, table, 1000._p*epsilon(data))
+                    reordered = .true.
+                end if
+                call median_filtering_histogram(order, nbins, table, lengths(ilength), filtered(:,ilength))
+            end if
+
+            call interpolate_linear(filtered(:,ilength))
+            filtered(:,ilength) = data - filtered(:,ilength)
+
+        end do
+
+    end subroutine median_filtering_multi
+
+
+    !-------------------------------------------------------------------------------------------------------------------------------
+
+
+    ! Running median in O(1) for the window length
     ! The samples inside the window form an histogram which is updated as the window slides.
     ! Except for the edges, the number of elements in the histogram is length minus the number of NaN value in the window.
-    subroutine median_filtering_mask_1d_1d(data, mask, length)
+    subroutine median_filtering_histogram(order, nbins, table, length, filter)
 
-        real(p), intent(inout) :: data(:)
-        logical*1, intent(in)  :: mask(:)
+        integer, intent(in)    :: order(:)
+        integer, intent(in)    :: nbins
+        real(p), intent(in)    :: table(nbins)
         integer, intent(in)    :: length
+        real(p), intent(out)   :: filter(size(order))
 
-        integer                :: nbins, ndata, nvalids, order(size(data)), i, old, new, half_minus, half_plus, ibin, irank
-        real(p)                :: filter(size(data))
+        integer                :: ndata, nvalids, i, old, new, half_minus, half_plus, ibin, irank
         integer, allocatable   :: hist(:)
-        real(p), allocatable   :: table(:)
         logical                :: even
         integer, parameter     :: iNaN = huge(order)
 
-        ndata = size(data)
-
-        if (ndata <= length) then
-           data = data - median(data, mask)
-           return
-        end if
-
-        call reorder(data, mask, order, nbins, table, 1000._p*epsilon(data))
+        ndata = size(order)
 
         allocate (hist(nbins))
         half_minus = (length-1) / 2
@@ -401,65 +539,82 @@ contains
 
         end do
 
-        call interpolate_linear(filter)
-        data = data - filter
-
-    end subroutine median_filtering_mask_1d_1d
+    end subroutine median_filtering_histogram
 
 
     !-------------------------------------------------------------------------------------------------------------------------------
 
 
-    subroutine median_filtering_nomask_1d_1d(data, length)
+    ! Running median in O(length) for the window length
+    ! The valid samples inside the window are kept sorted, a new sample being inserted after a binary search. For short windows,
+    ! the data movements are cheaper than the histogram updates and the whole window remains in the L1 cache.
+    subroutine median_filtering_sorted(data, mask, length, filter)
 
-        real(p), intent(inout) :: data(:)
+        real(p), intent(in)    :: data(:)
+        logical*1, intent(in)  :: mask(:)
         integer, intent(in)    :: length
+        real(p), intent(out)   :: filter(size(data))
 
-        logical*1, parameter   :: l1 = .false.
-        integer                :: i
-
-        call median_filtering_mask_1d_1d(data, [(l1, i=1, size(data))], length)
-
-    end subroutine median_filtering_nomask_1d_1d
-
-
-    !-------------------------------------------------------------------------------------------------------------------------------
-
-
-    subroutine median_filtering_mask_1d_2d(data, mask, length)
+        real(p)                :: window(length)
+        integer                :: ndata, nvalids, i, half_minus, half_plus
 
-        real(p), intent(inout) :: data(:,:)
-        logical*1, intent(in)  :: mask(:,:)
-        integer, intent(in)    :: length
-
-        integer                :: i
+        ndata = size(data)
+        half_minus = (length-1) / 2
+        half_plus  = length / 2
+        nvalids = 0
 
-        !$omp parallel do
-        do i = 1, size(data, 2)
-            call median_filtering(data(:,i), mask(:,i), length)
+        do i = 1, min(1 + half_plus, ndata)
+            call insert(i)
         end do
-        !$omp end parallel do
-
-    end subroutine median_filtering_mask_1d_2d
-
-
-    !-------------------------------------------------------------------------------------------------------------------------------
 
-
-    subroutine median_filtering_nomask_1d_2d(data, length)
-
-        real(p), intent(inout) :: data(:,:)
-        integer, intent(in)    :: length
-
-        integer                :: i
-
-        !$omp parallel do
-        do i = 1, size(data, 2)
-            call median_filtering(data(:,i), length)
+        do i = 1, ndata
+            if (i > half_minus + 1) call remove(i-half_minus-1)
+            if (i > 1 .and. i + half_plus <= ndata) call insert(i+half_plus)
+            if (nvalids == 0) then
+                filter(i) = NaN
+            else
+                filter(i) = window((nvalids+1)/2)
+            end if
         end do
-        !$omp end parallel do
 
-    end subroutine median_filtering_nomask_1d_2d
+    contains
+
+        subroutine insert(j)
+            integer, intent(in) :: j
+            integer             :: k
+            if (mask(j) .or. data(j) /= data(j)) return
+            k = search(data(j))
+            window(k+1:nvalids+1) = window(k:nvalids)
+            window(k) = data(j)
+            nvalids = nvalids + 1
+        end subroutine insert
+
+        subroutine remove(j)
+            integer, intent(in) :: j
+            integer             :: k
+            if (mask(j) .or. data(j) /= data(j)) return
+            k = search(data(j))
+            window(k:nvalids-1) = window(k+1:nvalids)
+            nvalids = nvalids - 1
+        end subroutine remove
+
+        ! return the index of the first element of the window which is not less than the value
+        function search(value) result(k)
+            real(p), intent(in) :: value
+            integer             :: k, kmax, kmid
+            k = 1
+            kmax = nvalids + 1
+            do while (k < kmax)
+                kmid = (k + kmax) / 2
+                if (window(kmid) < value) then
+                    k = kmid + 1
+                else
+                    kmax = kmid
+                end if
+            end do
+        end function search
+
+    end subroutine median_filtering_sorted
 
 
     !-------------------------------------------------------------------------------------------------------------------------------
@@ -1,14 +1,31 @@
 import numpy as np
+import re
 import tamasisfortran as tmf
 
+from mpi4py import MPI
+from . import var
+
 __all__ = []
 
-def split_observation(comm, detectors, observations):
+def split_observation(comm, detectors, observations, nsamples=None):
+    """
+    Return the detector mask and the observations handled by the current
+    processor.
+
+    If the number of samples of each observation is specified, the work is
+    balanced by the number of samples with split_work, each observation
+    possibly being split in time across several processors. The returned
+    observations then carry a [first:last] sample range.
+    """
 
     size  = comm.Get_size()
     if size == 1:
         return detectors.copy(), list(observations)
 
+    if nsamples is not None:
+        return _split_observation_balanced(comm, detectors, observations,
+                                           nsamples)
+
     rank = comm.Get_rank()
     nthreads = tmf.info_nthreads()
     ndetectors = np.sum(~detectors)
@@ -59,3 +76,128 @@ def split_observation(comm, detectors, observations):
     observations_ = list(observations)
 
     return detectors_, observations_
+
+
+#-------------------------------------------------------------------------------
+
+
+def split_work(detectors, nsamples, nodes, nthreads=1):
+    """
+    Balance the work of an acquisition over processors.
+
+    The samples of the observations, concatenated in time, are split into one
+    contiguous range per node, proportionally to the number of processors of
+    the node. Inside a node, the valid detectors are split into one block per
+    processor, whose size is a multiple of the number of threads when
+    possible. A long observation can thus be handled by several nodes.
+    A ValueError is raised if a processor would be left without work.
+
+    Parameters
+    ----------
+    detectors : boolean array
+        Detector mask, True for the detectors which are not used.
+    nsamples : sequence of int
+        Number of samples of each observation.
+    nodes : sequence
+        Node identifier of each processor, such as the processor name.
+    nthreads : int
+        Number of threads per processor.
+
+    Returns
+    -------
+    assignments : list
+        For each processor, a tuple (detector slice, segments). The slice
+        applies to the indices of the valid detectors and segments is a list of
+        (observation index, sample slice).
+    loads : ndarray
+        The predicted load of each processor, in number of detector samples.
+    """
+
+    nsamples = np.asarray(nsamples, int)
+    ndetectors = int(np.sum(~np.asarray(detectors)))
+    nprocs = len(nodes)
+
+    # group the processors by node, in order of appearance
+    names = []
+    for node in nodes:
+        if node not in names:
+            names.append(node)
+    ranks = [[r for r in range(nprocs) if nodes[r] == n] for n in names]
+
+    # split the concatenated samples between the nodes
+    nsamples_tot = int(np.sum(nsamples))
+    boundaries = np.cumsum([0] + [len(r) for r in ranks])
+    boundaries = (boundaries * nsamples_tot) // nprocs
+    offsets = np.concatenate([[0], np.cumsum(nsamples)])
+
+    assignments = [None] * nprocs
+    loads = np.zeros(nprocs, int)
+    for inode, node_ranks in enumerate(ranks):
+        start, stop = boundaries[inode], boundaries[inode+1]
+        segments = []
+        for iobs in range(nsamples.size):
+            first = max(start, offsets[iobs])
+            last = min(stop, offsets[iobs+1])
+            if first < last:
+                segments.append((iobs, slice(int(first - offsets[iobs]),
+                                             int(last - offsets[iobs]))))
+
+        # split the detectors between the processors of the node
+        q = len(node_ranks)
+        unit = nthreads if ndetectors >= q * nthreads else 1
+        nunits = (ndetectors + unit - 1) // unit
+        for i, rank in enumerate(node_ranks):
+            first = min((i * nunits) // q * unit, ndetectors)
+            last = min(((i + 1) * nunits) // q * unit, ndetectors)
+            assignments[rank] = (slice(first, last), segments)
+            loads[rank] = (last - first) * (stop - start)
+
+    if np.any(loads == 0):
+        raise ValueError('There are too few valid detectors (' + \
+            str(ndetectors) + ') or samples (' + str(nsamples_tot) + \
+            ') to split the work over ' + str(nprocs) + ' processors.')
+
+    return assignments, loads
+
+
+#-------------------------------------------------------------------------------
+
+
+def _split_observation_balanced(comm, detectors, observations, nsamples):
+    """
+    Split the work with split_work, according to the node layout of the
+    communicator, and return the detector mask and the observations (with a
+    sample range) of the current processor.
+    """
+    # restrict the number of samples to the observations' own sample range
+    regex = re.compile(r'(.*?)(\[([0-9]*)(:?)([0-9]*)\])? *$')
+    matches = [regex.match(o) for o in observations]
+    firsts = []
+    nsamples_ = []
+    for match, n in zip(matches, nsamples):
+        first, last = 1, n
+        if match.group(2):
+            first = max(int(match.group(3) or 1), 1)
+            last = int(match.group(5) or n) if match.group(4) else first
+        firsts.append(first)
+        nsamples_.append(max(last - first + 1, 0))
+
+    nodes = comm.allgather(MPI.Get_processor_name())
+    assignments, loads = split_work(detectors, nsamples_, nodes,
+                                    tmf.info_nthreads())
+    if var.verbose and comm.Get_rank() == 0:
+        print('Predicted load per processor (detector samples): ' + \
+              str(loads.tolist()) + ', imbalance: ' + \
+              str(np.max(loads) / max(np.mean(loads), 1)) + '.')
+
+    idetector, segments = assignments[comm.Get_rank()]
+    detectors_ = detectors.copy()
+    igood = np.where(~detectors_.ravel())[0]
+    detectors_.ravel()[igood[0:idetector.start]] = True
+    detectors_.ravel()[igood[idetector.stop:]] = True
+
+    observations_ = [matches[i].group(1) + '[' + str(firsts[i] + s.start) + \
+                     ':' + str(firsts[i] + s.stop - 1) + ']'
+                     for i, s in segments]
+
+    return detectors_, observations_
@@ -35,9 +35,15 @@ class Observation(object):
         raise NotImplementedError()
 
     def get_pointing_matrix(self, header, resolution, npixels_per_sample,
-                            method=None, oversampling=True):
+                            method=None, oversampling=True, cachedir=None,
+                            pointings=None):
         """
         Return the pointing matrix.
+        If cachedir is not None, the pointing matrix is looked up in and
+        stored into this directory.
+        If pointings is a slice, only the valid pointings within this slice
+        are projected and the returned numbers of samples are those of the
+        selection.
         """
         raise NotImplementedError()
 
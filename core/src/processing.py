@@ -1,16 +1,138 @@
 import numpy as np
 import pyfits
-import scipy
 import tamasisfortran as tmf
+from . import var
 from .datatypes import Tod
+from .stringutils import strenum
 
-__all__ = [ 'deglitch_l2std',
+__all__ = [ 'DeglitchIndex',
+            'deglitch_l2std',
             'deglitch_l2mad',
             'filter_median',
             'filter_polynomial',
             'interpolate_linear',
             'remove_nan' ]
 
+class DeglitchIndex(object):
+    """
+    Inverse of the pointing matrix of a Projection, for the second level
+    deglitching.
+
+    For each sky map pixel, the index stores the sample and detector indices
+    and the weights of the pointing matrix elements which contribute to it,
+    ordered by sample (compressed sparse row format). It is computed once and
+    can then be used to deglitch several timelines, with the standard
+    deviation or the MAD and with any threshold, the sky map pixels being
+    processed in parallel.
+
+    Example
+    -------
+    >>> index = DeglitchIndex(projection)
+    >>> tod.mask = index.deglitch(tod, nsigma=5., method='mad')
+    """
+
+    def __init__(self, projection):
+        projection.validate_storage('full')
+        self.header = projection.header
+        self.shape = projection.pmatrix.shape[0:2]
+        npixels = self.header['naxis1'] * self.header['naxis2']
+        ndetectors, nsamples, npixels_per_sample = projection.pmatrix.shape
+        self.offsets = tmf.deglitch_index_count(projection._pmatrix, npixels,
+            npixels_per_sample, nsamples, ndetectors)
+        nentries = int(self.offsets[-1])
+        self.isamples = np.empty(nentries, np.int32)
+        self.idetectors = np.empty(nentries, np.int32)
+        self.weights = np.empty(nentries, np.float32)
+        tmf.deglitch_index_fill(projection._pmatrix, npixels_per_sample,
+            nsamples, ndetectors, self.offsets, self.isamples,
+            self.idetectors, self.weights)
+
+    def deglitch(self, tod, nsigma=5., method='mad'):
+        """
+        Return the mask of the timelines, updated with the detected glitches.
+
+        Each detector frame is back-projected onto the sky. The values
+        associated with a sky map pixel are sigma clipped, using the standard
+        deviation to the mean or the MAD (median absolute deviation to the
+        median). In case of rejection (i. e. at a given time), each detector
+        sample which contributes to the sky pixel value in the frame is
+        masked.
+
+        Parameters
+        ----------
+        tod : Tod
+            The timelines to be deglitched.
+        nsigma : float
+            The clipping threshold, in units of standard deviation.
+        method : 'std' or 'mad'
+            The estimator of the standard deviation.
+        """
+        self._validate(tod, method)
+        if tod.mask is None:
+            mask = np.zeros(tod.shape, np.bool8)
+        else:
+            mask = tod.mask.copy()
+        tmf.deglitch_index_l2b(self.offsets, self.isamples, self.idetectors,
+            self.weights, np.asarray(tod, var.FLOAT_DTYPE).T,
+            mask.view(np.int8).T, nsigma, method == 'mad')
+        return mask
+
+    def deglitch_iterative(self, tod, nsigma=5., method='mad', maxiter=20):
+        """
+        Iterative second level deglitching.
+
+        The deglitching is repeated with the updated mask, until no new glitch
+        is found or until the maximum number of iterations is reached. Only
+        the sky map pixels in which samples have been masked during the
+        previous iteration are processed again, since the statistics of the
+        other ones are unchanged.
+
+        Parameters
+        ----------
+        tod : Tod
+            The timelines to be deglitched.
+        nsigma : float
+            The clipping threshold, in units of standard deviation.
+        method : 'std' or 'mad'
+            The estimator of the standard deviation.
+        maxiter : int
+            The maximum number of iterations.
+
+        Returns
+        -------
+        mask : ndarray
+            The mask of the timelines, updated with the detected glitches.
+        counts : ndarray
+            The number of samples masked during each iteration. The last
+            element is zero if the iterations have converged.
+        """
+        self._validate(tod, method)
+        if maxiter < 1:
+            raise ValueError('The maximum number of iterations must be strictl'\
+                             'y positive.')
+        if tod.mask is None:
+            mask = np.zeros(tod.shape, np.bool8)
+        else:
+            mask = tod.mask.copy()
+        counts, niterations = tmf.deglitch_index_l2b_iterative(self.offsets,
+            self.isamples, self.idetectors, self.weights,
+            np.asarray(tod, var.FLOAT_DTYPE).T, mask.view(np.int8).T, nsigma,
+            method == 'mad', maxiter)
+        return mask, counts[0:niterations]
+
+    def _validate(self, tod, method):
+        methods = ('std', 'mad')
+        if method not in methods:
+            raise ValueError("Invalid deglitching method '" + str(method) + \
+                "'. Expected values are " + strenum(methods, 'or') + '.')
+        if tod.shape != self.shape:
+            raise ValueError("The input timeline has an incompatible shape '" +\
+                str(tod.shape) + "' instead of '" + str(self.shape) + "'.")
+
+
+#-------------------------------------------------------------------------------
+
+
 def deglitch_l2std(tod, projection, nsigma=5.):
     """
     Second level deglitching (standard deviation).
@@ -19,17 +141,13 @@ def deglitch_l2std(tod, projection, nsigma=5.):
     with a sky map pixel are sigma clipped, using the standard deviation to the
     mean. In case of rejection (i. e. at a given time), each detector sample
     which contributes to the sky pixel value in the frame is masked.
+
+    The projection can also be a DeglitchIndex, which avoids the inversion of
+    the pointing matrix when the timelines are deglitched several times.
     """
-    nx = projection.header['naxis1']
-    ny = projection.header['naxis2']
-    npixels_per_sample = projection.npixels_per_sample
-    if tod.mask is None:
-        mask = np.zeros(tod.shape, np.bool8)
-    else:
-        mask = tod.mask.copy()
-    tmf.deglitch_l2b_std(projection._pmatrix, nx, ny, tod.T,
-                         mask.view(np.int8).T, nsigma, npixels_per_sample)
-    return mask
+    if not isinstance(projection, DeglitchIndex):
+        projection = DeglitchIndex(projection)
+    return projection.deglitch(tod, nsigma, 'std')
 
 
 #-------------------------------------------------------------------------------
@@ -44,63 +162,160 @@ def deglitch_l2mad(tod, projection, nsigma=5.):
     deviation to the median). In case of rejection (i. e. at a given time),
     each detector sample which contributes to the sky pixel value in the frame
     is masked.
+
+    The projection can also be a DeglitchIndex, which avoids the inversion of
+    the pointing matrix when the timelines are deglitched several times.
     """
-    nx = projection.header['naxis1']
-    ny = projection.header['naxis2']
-    npixels_per_sample = projection.npixels_per_sample
-    if tod.mask is None:
-        mask = np.zeros(tod.shape, np.bool8)
-    else:
-        mask = tod.mask.copy()
-    tmf.deglitch_l2b_mad(projection._pmatrix, nx, ny, tod.T,
-                         mask.view(np.int8).T, nsigma, npixels_per_sample)
-    return mask
+    if not isinstance(projection, DeglitchIndex):
+        projection = DeglitchIndex(projection)
+    return projection.deglitch(tod, nsigma, 'mad')
 
 
 #-------------------------------------------------------------------------------
 
 
-def filter_median(tod, length=10, mask=None):
+def filter_median(tod, length=10, mask=None, inplace=False,
+                  kernel='histogram'):
     """
     Median filtering, O(1) in window length
+
+    The running median of each detector timeline is subtracted from it, slice
+    by slice, the masked samples being ignored. The timelines are filtered in
+    parallel.
+
+    Parameters
+    ----------
+    tod : Tod
+        The timelines to be filtered.
+    length : int or sequence of int
+        The window length. If a sequence is specified, the timelines are
+        filtered for each of the lengths in a single pass over the data and
+        the list of the filtered Tods is returned.
+    mask : boolean array
+        The samples to be ignored. By default, the mask of the Tod is used.
+    inplace : boolean
+        If True, the input Tod is overwritten by the filtered timelines. It is
+        ignored if several lengths are specified.
+    kernel : 'histogram', 'sorted' or 'auto'
+        The running median algorithm. The histogram kernel, used by default,
+        is O(1) in window length, the sorted window kernel is O(length) but
+        faster for windows shorter than a few thousand samples. With 'auto',
+        the kernel is chosen according to the window length. The kernels agree
+        to the rounding errors.
     """
-    filtered = Tod(tod)
+    kernels = {'auto':0, 'histogram':1, 'sorted':2}
+    if kernel not in kernels:
+        raise ValueError("Invalid median filtering kernel '" + str(kernel) + \
+            "'. Expected values are " + strenum(sorted(kernels.keys()), 'or') +\
+            '.')
+
     if mask is not None :
         mask = np.ascontiguousarray(mask, np.bool8).view(np.int8)
     elif hasattr(tod, 'mask') and tod.mask is not None and \
          tod.mask is not np.ma.nomask:
-        mask = tod.mask.view(np.int8)
+        mask = np.ascontiguousarray(tod.mask).view(np.int8)
     else:
         mask = np.zeros(tod.shape, np.int8)
 
     nsamples = getattr(tod, 'nsamples', (tod.shape[-1],))
     nsamples_tot = tod.shape[-1]
+
+    if not np.isscalar(length):
+        tod = Tod(tod, copy=False)
+        data = np.ascontiguousarray(tod, var.FLOAT_DTYPE)
+        filtered = np.empty((len(length),) + tod.shape, var.FLOAT_DTYPE)
+        status = tmf.filter_median_multi(data.reshape((-1,nsamples_tot)).T,
+            mask.reshape((-1,nsamples_tot)).T, np.array(length, np.int32),
+            kernels[kernel], np.array(nsamples, np.int32),
+            filtered.reshape((len(length),-1,nsamples_tot)).T)
+        if status != 0:
+            raise RuntimeError()
+        return [Tod(f, mask=tod.mask.copy() if tod.mask is not None else None,
+                    nsamples=nsamples, header=tod.header, unit=tod.unit,
+                    derived_units=tod.derived_units.copy(), copy=False)
+                for f in filtered]
+
+    # the Fortran routine operates in-place on C-contiguous arrays
+    if inplace and isinstance(tod, Tod) and tod.flags.c_contiguous and \
+       tod.dtype == var.FLOAT_DTYPE:
+        filtered = tod
+    else:
+        filtered = Tod(tod, dtype=var.FLOAT_DTYPE)
+
     status = tmf.filter_median(filtered.reshape((-1,nsamples_tot)).T,
-        mask.reshape((-1,nsamples_tot)).T, length, np.array(nsamples, np.int32))
+        mask.reshape((-1,nsamples_tot)).T, length, kernels[kernel],
+        np.array(nsamples, np.int32))
     if status != 0:
         raise RuntimeError()
+
+    if inplace and filtered is not tod:
+        tod[...] = filtered
+        return tod
     return filtered
 
 
 #-------------------------------------------------------------------------------
 
 
-def filter_polynomial(tod, degree):
+def filter_polynomial(tod, degree, mask=None, inplace=False):
     """
     Filter by subtracting a fitted polynomial of arbitrary degree.
+
+    For each slice, the polynomial basis is orthonormalised once and the
+    timelines of all the detectors are fitted by matrix products. If some
+    samples are masked, the weighted normal equations of the detectors are
+    solved together.
+
+    Parameters
+    ----------
+    tod : Tod
+        The timelines to be filtered.
+    degree : int
+        The degree of the fitted polynomial.
+    mask : boolean array
+        The samples to be ignored by the fit. By default, the mask of the Tod
+        is used.
+    inplace : boolean
+        If True, the input Tod is overwritten by the filtered timelines.
     """
-    filtered = tod.copy()
+    filtered = tod if inplace else tod.copy()
+    if mask is None:
+        mask = getattr(tod, 'mask', None)
+    if mask is np.ma.nomask:
+        mask = None
+
+    nsamples = getattr(tod, 'nsamples', (tod.shape[-1],))
     dest = 0
-    for islice in range(len(tod.nsamples)):
-        nsamples = tod.nsamples[islice]
-        x = np.arange(nsamples)
-        slope = scipy.polyfit(x, tod[:,dest:dest+nsamples].T, deg=degree)
+    for n in nsamples:
+        if n == 0:
+            continue
+        y = filtered[...,dest:dest+n].reshape((-1,n))
+
+        # orthonormal basis of the polynomials of degree lower or equal to
+        # the specified one
+        x = np.linspace(-1, 1, n)
+        q = np.linalg.qr(np.vander(x, degree+1))[0]
 
-        for idetector in range(tod.shape[0]):
-            filtered[idetector,dest:dest+nsamples] -= \
-                scipy.polyval(slope[:,idetector], x)
-       
-        dest = dest + nsamples
+        m = mask[...,dest:dest+n].reshape((-1,n)) if mask is not None else \
+            None
+        if m is None or not np.any(m):
+            coeffs = np.dot(y, q)
+        else:
+            w = (~m).astype(q.dtype)
+            a = np.empty((y.shape[0], degree+1, degree+1))
+            for i in range(degree+1):
+                for j in range(i+1):
+                    a[:,i,j] = a[:,j,i] = np.dot(w, q[:,i] * q[:,j])
+            b = np.dot(np.where(m, 0, y), q)
+            # the detectors with too few valid samples are not filtered
+            invalid = np.sum(w, axis=1) <= degree
+            a[invalid] = np.eye(degree+1)
+            b[invalid] = 0
+            coeffs = _solve_spd(a, b)
+
+        filtered[...,dest:dest+n] -= np.dot(coeffs, q.T).reshape(
+            filtered[...,dest:dest+n].shape)
+        dest += n
 
     return filtered
 
@@ -108,24 +323,81 @@ def filter_polynomial(tod, degree):
 #-------------------------------------------------------------------------------
 
 
-def interpolate_linear(tod):
+def interpolate_linear(tod, mask=None, noise=False):
     """
     In-place interpolation of masked values of a Tod
+
+    The masked samples are linearly interpolated between the closest valid
+    samples of the same detector and slice. At the edges of a slice, they are
+    set to the closest valid value. The gaps of all the detectors are filled
+    at once.
+
+    Parameters
+    ----------
+    tod : Tod
+        The timelines to be interpolated in-place.
+    mask : boolean array
+        The samples to be interpolated. By default, the mask of the Tod is
+        used.
+    noise : boolean
+        If True, a Gaussian white noise is added to the interpolated samples,
+        so that the filled gaps have the noise level of the valid samples. For
+        each detector and slice, this level is estimated from the median
+        absolute value of the differences of consecutive valid samples.
+
+    Returns
+    -------
+    tod : Tod
+        The input Tod, with interpolated values.
     """
-    if tod.mask is None:
-        return
+    if mask is None:
+        mask = getattr(tod, 'mask', None)
+    if mask is None or mask is np.ma.nomask:
+        return tod
+
+    nsamples_tot = tod.shape[-1]
+    data = tod.view(np.ndarray).reshape((-1,nsamples_tot))
+    mask = np.asarray(mask, np.bool8).reshape((-1,nsamples_tot))
+    nsamples = getattr(tod, 'nsamples', (nsamples_tot,))
 
     dest = 0
-    for islice in range(len(tod.nsamples)):
-        nsamples = tod.nsamples[islice]
-        x = np.arange(nsamples)
-        for idetector in range(tod.shape[0]):
-            tod_ = tod[idetector,dest:dest+nsamples]
-            invalid = tod.mask[idetector,dest:dest+nsamples]
-            tod_[invalid] = np.interp(x[invalid], x[~invalid], tod_[~invalid])
-        dest = dest + nsamples
-    
-    return
+    for n in nsamples:
+        d = data[:,dest:dest+n]
+        m = mask[:,dest:dest+n]
+        dest += n
+        if not np.any(m):
+            continue
+
+        # indices of the previous and next valid samples
+        index = np.arange(n)
+        valid = ~m
+        iprev = np.maximum.accumulate(np.where(valid, index, -1), axis=1)
+        inext = np.minimum.accumulate(np.where(valid, index, n)[:,::-1],
+                                      axis=1)[:,::-1]
+        idetector, isample = np.nonzero(m)
+        iprev = iprev[idetector,isample]
+        inext = inext[idetector,isample]
+
+        # the timelines without valid samples are not interpolated
+        ok = (iprev >= 0) | (inext < n)
+        idetector, isample, iprev, inext = idetector[ok], isample[ok], \
+                                           iprev[ok], inext[ok]
+        iprev = np.where(iprev < 0, inext, iprev)
+        inext = np.where(inext >= n, iprev, inext)
+        dprev = d[idetector,iprev]
+        dnext = d[idetector,inext]
+        delta = np.maximum(inext - iprev, 1)
+        values = dprev + (dnext - dprev) * (isample - iprev) / delta
+
+        if noise:
+            sigma = _get_noise_level(d, valid)
+            values += sigma[idetector] * \
+                      np.random.standard_normal(idetector.size)
+        d[idetector,isample] = values
+
+    if not np.may_share_memory(data, tod):
+        tod[...] = data.reshape(tod.shape)
+    return tod
 
 
 #-------------------------------------------------------------------------------
@@ -138,3 +410,44 @@ def remove_nan(tod):
     if tod.mask is None:
         tod.mask = np.zeros(tod.shape, np.bool8)
     tmf.remove_nan(tod.T, tod.mask.view(np.int8).T)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _solve_spd(a, b):
+    """
+    Solve the symmetric positive definite systems a[k] x[k] = b[k], by a
+    Gaussian elimination vectorised over the systems.
+    """
+    a = a.copy()
+    b = b.copy()
+    n = b.shape[-1]
+    for i in range(n):
+        for j in range(i+1, n):
+            f = a[:,j,i] / a[:,i,i]
+            a[:,j,i:] -= f[:,np.newaxis] * a[:,i,i:]
+            b[:,j] -= f * b[:,i]
+    x = np.empty_like(b)
+    for i in range(n-1, -1, -1):
+        x[:,i] = (b[:,i] - np.sum(a[:,i,i+1:] * x[:,i+1:], axis=1)) / a[:,i,i]
+    return x
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_noise_level(data, valid):
+    """
+    Return the standard deviation of the white noise of each timeline,
+    estimated from the median absolute value of the differences of
+    consecutive valid samples.
+    """
+    diff = np.abs(np.diff(data, axis=1))
+    ok = valid[:,1:] & valid[:,:-1]
+    diff[~ok] = np.inf
+    diff.sort(axis=1)
+    n = np.sum(ok, axis=1)
+    sigma = diff[np.arange(diff.shape[0]),np.maximum(n-1, 0)//2]
+    sigma[n == 0] = 0
+    return 1.4826 / np.sqrt(2) * sigma
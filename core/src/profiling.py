@@ -0,0 +1,182 @@
+import json
+import time
+
+__all__ = [ 'Profiler' ]
+
+# records of the operator applications in progress, innermost last
+_frames = []
+
+class Profiler(object):
+    """
+    Instrumentation of acquisition models.
+
+    For each node of the instrumented acquisition models, the profiler records
+    the number of calls, the wall time (including and excluding that of the
+    sub-models), the number of bytes allocated by the acquisition model
+    framework and the number of bytes moved (input and output), separately
+    for the direct and transpose operations. The instrumentation only adds a
+    function call and two clock readings per operator application, so it can
+    be left on in production runs.
+
+    Example
+    -------
+    >>> profiler = Profiler()
+    >>> map = mapper_rls(tod, model, profile=profiler)
+    >>> profiler.save('profile.json')
+    """
+
+    def __init__(self, *models):
+        self._records = []
+        self._nodes = {}
+        self._wrapped = []
+        self._instrumented = set()
+        for model in models:
+            self.start(model)
+
+    def start(self, model):
+        """
+        Instrument the nodes of an acquisition model. The nodes which are
+        already instrumented are not modified, and the statistics of a node
+        which has been instrumented before are accumulated in the same record.
+        """
+        for node in _get_nodes(model):
+            if id(node) in self._instrumented:
+                continue
+            self._instrumented.add(id(node))
+            if id(node) in self._nodes:
+                record = self._nodes[id(node)][1]
+            else:
+                record = {'description' : node.description,
+                          'class' : node.__class__.__name__,
+                          'direct' : _new_stats(),
+                          'transpose' : _new_stats()}
+                # the node is referenced, so that its id is not re-used
+                self._nodes[id(node)] = (node, record)
+                self._records.append(record)
+            for name, kind in (('direct', 'direct'),
+                               ('direct_start', 'direct'),
+                               ('transpose', 'transpose')):
+                if not hasattr(node, name):
+                    continue
+                self._wrapped.append((node, name, node.__dict__.get(name)))
+                setattr(node, name, _instrument(node, getattr(node, name),
+                                                record[kind]))
+
+    def stop(self):
+        """
+        Remove the instrumentation of the acquisition models. The records are
+        kept.
+        """
+        for node, name, original in reversed(self._wrapped):
+            if original is None:
+                del node.__dict__[name]
+            else:
+                setattr(node, name, original)
+        self._wrapped = []
+        self._instrumented = set()
+
+    def get_report(self):
+        """
+        Return the records of the instrumented nodes, as a list of
+        dictionaries, with the keys 'description', 'class', 'direct' and
+        'transpose'. The last two are dictionaries with the keys 'ncalls',
+        'time', 'time_self', 'allocated' and 'moved' (the time is in seconds,
+        the memory in bytes). The nodes which have not been applied are
+        omitted.
+        """
+        return [r for r in self._records if r['direct']['ncalls'] > 0 or
+                r['transpose']['ncalls'] > 0]
+
+    def save(self, filename):
+        """
+        Write the report in a JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.get_report(), f, indent=1)
+
+    def __str__(self):
+        lines = ['%-40s %9s %8s %11s %10s %10s' % ('Operator', 'Calls',
+                 'Time', 'Time (self)', 'Alloc. MiB', 'Moved MiB')]
+        for record in self.get_report():
+            for kind in ('direct', 'transpose'):
+                stats = record[kind]
+                if stats['ncalls'] == 0:
+                    continue
+                description = record['description']
+                if kind == 'transpose':
+                    description += '.T'
+                lines.append('%-40s %9i %8.3f %11.3f %10.1f %10.1f' % (
+                    description[0:40], stats['ncalls'], stats['time'],
+                    stats['time_self'], stats['allocated'] / 2.**20,
+                    stats['moved'] / 2.**20))
+        return '\n'.join(lines)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_nodes(model):
+    """
+    Return the nodes of an acquisition model: the model itself, the blocks of
+    the composites and the models of the transposes.
+    """
+    nodes = [model]
+    blocks = getattr(model, 'blocks', None)
+    if isinstance(blocks, list):
+        for block in blocks:
+            nodes.extend(_get_nodes(block))
+    for attr in ('model', 'projection'):
+        child = getattr(model, attr, None)
+        if hasattr(child, 'direct') and hasattr(child, 'description'):
+            nodes.extend(_get_nodes(child))
+    return nodes
+
+
+#-------------------------------------------------------------------------------
+
+
+def _new_stats():
+    return {'ncalls':0, 'time':0., 'time_self':0., 'allocated':0, 'moved':0}
+
+
+#-------------------------------------------------------------------------------
+
+
+def _instrument(node, function, stats):
+    """
+    Return a wrapper of the direct or transpose method of a node, which
+    updates its statistics.
+    """
+    def wrapper(input, *args, **keywords):
+        # a symmetric operator's transpose calls its direct method
+        if len(_frames) > 0 and _frames[-1][0] is node:
+            return function(input, *args, **keywords)
+        frame = [node, stats, 0.]
+        _frames.append(frame)
+        time0 = time.time()
+        try:
+            output = function(input, *args, **keywords)
+        finally:
+            elapsed = time.time() - time0
+            _frames.pop()
+        stats['ncalls'] += 1
+        stats['time'] += elapsed
+        stats['time_self'] += elapsed - frame[2]
+        stats['moved'] += getattr(input, 'nbytes', 0) + \
+                          getattr(output, 'nbytes', 0)
+        if len(_frames) > 0:
+            _frames[-1][2] += elapsed
+        return output
+    return wrapper
+
+
+#-------------------------------------------------------------------------------
+
+
+def _record_allocation(nbytes):
+    """
+    Add an allocation to the statistics of the innermost acquisition model
+    being applied, if it is instrumented.
+    """
+    if len(_frames) > 0:
+        _frames[-1][1]['allocated'] += int(nbytes)
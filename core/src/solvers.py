@@ -0,0 +1,287 @@
+import numpy as np
+import tamasisfortran as tmf
+
+from mpi4py import MPI
+from . import var
+from .acquisitionmodels import AcquisitionModel
+from .datatypes import flatten_sliced_shape
+
+__all__ = [ 'pcg', 'pipecg' ]
+
+
+def pcg(A, b, x0=None, tol=1.e-5, maxiter=300, callback=None, M=None,
+        comm=None):
+    """
+    Solve the system A x = b for a symmetric positive definite operator A
+    using the preconditioned conjugate gradient method.
+
+    The work vectors are allocated once and the vector updates and dot
+    products are performed by the Fortran core, so that no temporary array
+    is created during the iterations.
+
+    Parameters
+    ----------
+    A : AcquisitionModelLinear or LinearOperator
+        The symmetric positive definite operator.
+    b : ndarray
+        The right-hand side of the system.
+    x0 : ndarray
+        Initial guess. Default is zero.
+    tol : float
+        The iterations stop when the relative residual norm ||r|| / ||b|| is
+        lower than this value.
+    maxiter : int
+        Maximum number of iterations.
+    callback : function or object
+        If the callback has an 'update' method, it is called after each
+        iteration as callback.update(niterations, residual). Otherwise, it is
+        called as callback(x).
+    M : AcquisitionModelLinear or LinearOperator
+        Preconditioner, approximating the inverse of A.
+    comm : mpi4py.MPI.Comm
+        If the vectors are distributed among the processors, the communicator
+        used to reduce the dot products. Default is None, i.e. the vectors are
+        not distributed.
+
+    Returns
+    -------
+    x : ndarray
+        The solution.
+    info : int
+        0 if the tolerance has been reached, or the number of iterations
+        otherwise.
+    """
+
+    A = _get_matvec(A)
+    M = _get_matvec(M) if M is not None else None
+
+    b = np.array(b, dtype=var.FLOAT_DTYPE, copy=False).ravel()
+    n = b.size
+    x = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    r = np.empty(n, dtype=var.FLOAT_DTYPE)
+    p = np.empty(n, dtype=var.FLOAT_DTYPE)
+    z = np.empty(n, dtype=var.FLOAT_DTYPE) if M is not None else r
+
+    bnorm = np.sqrt(_dot(b, b, comm))
+    if bnorm == 0:
+        return x, 0
+
+    r[:] = b
+    if x0 is not None:
+        x[:] = np.asarray(x0).ravel()
+        tmf.axpy_inplace(r, -1., A(x))
+
+    if M is not None:
+        z[:] = M(r)
+    p[:] = z
+    rz = _dot(r, z, comm)
+    if x0 is not None and np.sqrt(_dot(r, r, comm)) / bnorm < tol:
+        return x, 0
+
+    info = maxiter
+    for niterations in xrange(1, maxiter+1):
+        q = A(p)
+        alpha = rz / _dot(p, q, comm)
+        tmf.axpy_inplace(x, alpha, p)
+        tmf.axpy_inplace(r, -alpha, q)
+
+        if M is None:
+            rr = _dot(r, r, comm)
+            rz_new = rr
+        else:
+            z[:] = M(r)
+            rr, rz_new = _dot2(r, r, r, z, comm)
+
+        residual = np.sqrt(rr) / bnorm
+        if callback is not None:
+            if hasattr(callback, 'update'):
+                callback.update(niterations, residual)
+            else:
+                callback(x)
+        if residual < tol:
+            info = 0
+            break
+
+        tmf.xpby_inplace(p, z, rz_new / rz)
+        rz = rz_new
+
+    return x, info
+
+
+#-------------------------------------------------------------------------------
+
+
+def pipecg(A, b, x0=None, tol=1.e-5, maxiter=300, callback=None, M=None,
+           comm=None):
+    """
+    Solve the system A x = b for a symmetric positive definite operator A
+    using the pipelined preconditioned conjugate gradient method of Ghysels
+    and Vanroose (2014).
+
+    The three dot products of an iteration are reduced in a single
+    non-blocking call, which is overlapped with the application of the
+    preconditioner and of the operator. The method trades a few more vector
+    updates for a single synchronisation point per iteration, which pays off
+    when the vectors are distributed over many processors and the reduction
+    latency dominates.
+
+    Parameters
+    ----------
+    A : AcquisitionModelLinear or LinearOperator
+        The symmetric positive definite operator.
+    b : ndarray
+        The right-hand side of the system.
+    x0 : ndarray
+        Initial guess. Default is zero.
+    tol : float
+        The iterations stop when the relative residual norm ||r|| / ||b|| is
+        lower than this value.
+    maxiter : int
+        Maximum number of iterations.
+    callback : function or object
+        If the callback has an 'update' method, it is called after each
+        iteration as callback.update(niterations, residual). Otherwise, it is
+        called as callback(x).
+    M : AcquisitionModelLinear or LinearOperator
+        Preconditioner, approximating the inverse of A.
+    comm : mpi4py.MPI.Comm
+        If the vectors are distributed among the processors, the communicator
+        used to reduce the dot products. Default is None, i.e. the vectors are
+        not distributed.
+
+    Returns
+    -------
+    x : ndarray
+        The solution.
+    info : int
+        0 if the tolerance has been reached, or the number of iterations
+        otherwise.
+    """
+
+    A = _get_matvec(A)
+    M = _get_matvec(M) if M is not None else None
+
+    b = np.array(b, dtype=var.FLOAT_DTYPE, copy=False).ravel()
+    n = b.size
+    x = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    r = np.empty(n, dtype=var.FLOAT_DTYPE)
+    w = np.empty(n, dtype=var.FLOAT_DTYPE)
+    p = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    s = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    z = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    if M is not None:
+        u = np.empty(n, dtype=var.FLOAT_DTYPE)
+        m = np.empty(n, dtype=var.FLOAT_DTYPE)
+        q = np.zeros(n, dtype=var.FLOAT_DTYPE)
+    else:
+        # without preconditioner, u = r, m = w and q = s
+        u = r
+        m = w
+
+    bnorm = np.sqrt(_dot(b, b, comm))
+    if bnorm == 0:
+        return x, 0
+
+    r[:] = b
+    if x0 is not None:
+        x[:] = np.asarray(x0).ravel()
+        tmf.axpy_inplace(r, -1., A(x))
+    if M is not None:
+        u[:] = M(r)
+    w[:] = A(u)
+
+    dots = np.empty(3)
+    info = maxiter
+    for niterations in xrange(maxiter+1):
+
+        # the reduction of the dot products is overlapped with M w and A m
+        dots[0] = tmf.dot(r, u)
+        dots[1] = tmf.dot(w, u)
+        dots[2] = tmf.dot(r, r)
+        if comm is not None:
+            request = comm.Iallreduce(MPI.IN_PLACE, [dots, MPI.DOUBLE],
+                                      op=MPI.SUM)
+        if M is not None:
+            m[:] = M(w)
+        an = A(m)
+        if comm is not None:
+            request.Wait()
+        gamma, delta, rr = dots
+
+        residual = np.sqrt(rr) / bnorm
+        if niterations > 0 and callback is not None:
+            if hasattr(callback, 'update'):
+                callback.update(niterations, residual)
+            else:
+                callback(x)
+        if residual < tol:
+            info = 0
+            break
+        if niterations == maxiter:
+            break
+
+        if niterations == 0:
+            beta = 0.
+            alpha = gamma / delta
+        else:
+            beta = gamma / gamma_old
+            alpha = gamma / (delta - beta * gamma / alpha_old)
+        gamma_old = gamma
+        alpha_old = alpha
+
+        tmf.xpby_inplace(z, an, beta)
+        tmf.xpby_inplace(s, w, beta)
+        tmf.xpby_inplace(p, u, beta)
+        tmf.axpy_inplace(x, alpha, p)
+        tmf.axpy_inplace(r, -alpha, s)
+        if M is not None:
+            tmf.xpby_inplace(q, m, beta)
+            tmf.axpy_inplace(u, -alpha, q)
+        tmf.axpy_inplace(w, -alpha, z)
+
+    return x, info
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_matvec(A):
+    """
+    Return a function applying the operator A on a vector. For acquisition
+    models, the output buffer is cached, so that successive applications do
+    not allocate memory. The returned vector is only valid until the next call.
+    """
+    if not isinstance(A, AcquisitionModel):
+        return A.matvec
+    shapein = flatten_sliced_shape(A.shapein)
+    def matvec(v):
+        if shapein is not None:
+            v = v.reshape(shapein)
+        return A.direct(v, False, False, True).ravel()
+    return matvec
+
+
+#-------------------------------------------------------------------------------
+
+
+def _dot(a, b, comm):
+    """
+    Dot product of two vectors, reduced over the communicator if not None.
+    """
+    output = tmf.dot(a, b)
+    if comm is not None:
+        output = comm.allreduce(output, op=MPI.SUM)
+    return output
+
+
+#-------------------------------------------------------------------------------
+
+
+def _dot2(a1, b1, a2, b2, comm):
+    """
+    Two dot products, reduced in a single call over the communicator.
+    """
+    output = np.array([tmf.dot(a1, b1), tmf.dot(a2, b2)])
+    if comm is not None:
+        comm.Allreduce(MPI.IN_PLACE, [output, MPI.DOUBLE], op=MPI.SUM)
+    return output[0], output[1]
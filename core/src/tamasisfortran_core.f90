@@ -72,6 +72,25 @@ end subroutine info_nthreads
 !-----------------------------------------------------------------------------------------------------------------------------------
 
 
+subroutine set_nthreads(nthreads)
+
+    use omp_lib, only : omp_set_num_threads
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)    :: nthreads
+
+    integer, intent(in) :: nthreads
+
+    ! the setting only applies to the calling thread and to the parallel regions it encounters
+    call omp_set_num_threads(nthreads)
+
+end subroutine set_nthreads
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
 subroutine pointing_matrix_direct(pmatrix, map1d, signal, npixels_per_sample, nsamples, ndetectors, npixels)
 
     use module_pointingmatrix, only : PointingElement, pmatrix_direct
@@ -134,6 +153,225 @@ end subroutine pointing_matrix_transpose
 !-----------------------------------------------------------------------------------------------------------------------------------
 
 
+subroutine pointing_matrix_direct_batch(pmatrix, map2d, signal, npixels_per_sample, nsamples, ndetectors, npixels, nbatch)
+
+    use module_pointingmatrix, only : PointingElement, pmatrix_direct_batch
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, dimension(npixels_per_sample*nsamples*ndetectors), intent(inout) :: pmatrix
+    !f2py intent(in)       :: map2d
+    !f2py intent(inout)    :: signal
+    !f2py intent(in)       :: npixels_per_sample
+    !f2py intent(hide)     :: nsamples = shape(signal,0)
+    !f2py intent(hide)     :: ndetectors = shape(signal,1)
+    !f2py intent(hide)     :: npixels = shape(map2d,1)
+    !f2py intent(hide)     :: nbatch = shape(signal,2)
+
+    type(PointingElement), intent(inout) :: pmatrix(npixels_per_sample, nsamples, ndetectors)
+    real(p), intent(in)    :: map2d(nbatch, npixels)
+    real(p), intent(inout) :: signal(nsamples, ndetectors, nbatch)
+    integer, intent(in)    :: npixels_per_sample
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer, intent(in)    :: npixels
+    integer, intent(in)    :: nbatch
+
+    call pmatrix_direct_batch(pmatrix, map2d, signal)
+
+end subroutine pointing_matrix_direct_batch
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine pointing_matrix_transpose_batch(pmatrix, signal, map2d, npixels_per_sample, nsamples, ndetectors, npixels, nbatch)
+
+    use module_pointingmatrix, only : PointingElement, pmatrix_transpose_batch
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, dimension(npixels_per_sample*nsamples*ndetectors), intent(inout) :: pmatrix
+    !f2py intent(in)       :: signal
+    !f2py intent(inout)    :: map2d
+    !f2py intent(in)       :: npixels_per_sample
+    !f2py intent(hide)     :: nsamples = shape(signal,0)
+    !f2py intent(hide)     :: ndetectors = shape(signal,1)
+    !f2py intent(hide)     :: npixels = shape(map2d,1)
+    !f2py intent(hide)     :: nbatch = shape(signal,2)
+
+    type(PointingElement), intent(inout) :: pmatrix(npixels_per_sample, nsamples, ndetectors)
+    real(p), intent(in)    :: signal(nsamples, ndetectors, nbatch)
+    real(p), intent(inout) :: map2d(nbatch, npixels)
+    integer, intent(in)    :: npixels_per_sample
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer, intent(in)    :: npixels
+    integer, intent(in)    :: nbatch
+
+    call pmatrix_transpose_batch(pmatrix, signal, map2d)
+
+end subroutine pointing_matrix_transpose_batch
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine pointing_matrix_ptwp(pmatrix, weight, factor, map1d, ptwp1d, npixels_per_sample, nsamples, ndetectors, npixels)
+
+    use module_pointingmatrix, only : PointingElement, pmatrix_ptwp
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, dimension(npixels_per_sample*nsamples*factor*ndetectors), intent(inout) :: pmatrix
+    !f2py intent(in)       :: weight
+    !f2py intent(in)       :: factor
+    !f2py intent(in)       :: map1d
+    !f2py intent(inout)    :: ptwp1d
+    !f2py intent(in)       :: npixels_per_sample
+    !f2py intent(hide)     :: nsamples = shape(weight,0)
+    !f2py intent(hide)     :: ndetectors = shape(weight,1)
+    !f2py intent(hide)     :: npixels = size(map1d)
+
+    type(PointingElement), intent(inout) :: pmatrix(npixels_per_sample, nsamples*factor, ndetectors)
+    real(p), intent(in)    :: weight(nsamples, ndetectors)
+    integer, intent(in)    :: factor
+    real(p), intent(in)    :: map1d(npixels)
+    real(p), intent(inout) :: ptwp1d(npixels)
+    integer, intent(in)    :: npixels_per_sample
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer, intent(in)    :: npixels
+
+    call pmatrix_ptwp(pmatrix, weight, factor, map1d, ptwp1d)
+
+end subroutine pointing_matrix_ptwp
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine pointing_matrix_ptwp_sp(pmatrix, weight, factor, map1d, ptwp1d, npixels_per_sample, nsamples, ndetectors, npixels)
+
+    use module_pointingmatrix, only : PointingElement, pmatrix_ptwp_sp
+    use module_precision,      only : sp
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, dimension(npixels_per_sample*nsamples*factor*ndetectors), intent(inout) :: pmatrix
+    !f2py intent(in)       :: weight
+    !f2py intent(in)       :: factor
+    !f2py intent(in)       :: map1d
+    !f2py intent(inout)    :: ptwp1d
+    !f2py intent(in)       :: npixels_per_sample
+    !f2py intent(hide)     :: nsamples = shape(weight,0)
+    !f2py intent(hide)     :: ndetectors = shape(weight,1)
+    !f2py intent(hide)     :: npixels = size(map1d)
+
+    type(PointingElement), intent(inout) :: pmatrix(npixels_per_sample, nsamples*factor, ndetectors)
+    real(sp), intent(in)   :: weight(nsamples, ndetectors)
+    integer, intent(in)    :: factor
+    real(p), intent(in)    :: map1d(npixels)
+    real(p), intent(inout) :: ptwp1d(npixels)
+    integer, intent(in)    :: npixels_per_sample
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer, intent(in)    :: npixels
+
+    call pmatrix_ptwp_sp(pmatrix, weight, factor, map1d, ptwp1d)
+
+end subroutine pointing_matrix_ptwp_sp
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine pointing_matrix_compressed_direct(counts, weights, scale, pixels, offsets, map1d, signal, nsamples, ndetectors,     &
+                                             nelements, nwords, npixels)
+
+    use module_pointingmatrix, only : pmatrix_compressed_direct
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)       :: counts
+    !f2py intent(in)       :: weights
+    !f2py intent(in)       :: scale
+    !f2py intent(in)       :: pixels
+    !f2py intent(in)       :: offsets
+    !f2py intent(in)       :: map1d
+    !f2py intent(inout)    :: signal
+    !f2py intent(hide)     :: nsamples = shape(signal,0)
+    !f2py intent(hide)     :: ndetectors = shape(signal,1)
+    !f2py intent(hide)     :: nelements = size(weights)
+    !f2py intent(hide)     :: nwords = size(pixels)
+    !f2py intent(hide)     :: npixels = size(map1d)
+
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer*8, intent(in)  :: nelements, nwords
+    integer, intent(in)    :: npixels
+    integer*1, intent(in)  :: counts(nsamples, ndetectors)
+    integer*2, intent(in)  :: weights(nelements)
+    real(p), intent(in)    :: scale
+    integer*2, intent(in)  :: pixels(nwords)
+    integer*8, intent(in)  :: offsets(2, ndetectors)
+    real(p), intent(in)    :: map1d(npixels)
+    real(p), intent(inout) :: signal(nsamples, ndetectors)
+
+    call pmatrix_compressed_direct(counts, weights, scale, pixels, offsets, map1d, signal)
+
+end subroutine pointing_matrix_compressed_direct
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine pointing_matrix_compressed_transpose(counts, weights, scale, pixels, offsets, signal, map1d, nsamples, ndetectors,  &
+                                                nelements, nwords, npixels)
+
+    use module_pointingmatrix, only : pmatrix_compressed_transpose
+    use module_tamasis,        only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)       :: counts
+    !f2py intent(in)       :: weights
+    !f2py intent(in)       :: scale
+    !f2py intent(in)       :: pixels
+    !f2py intent(in)       :: offsets
+    !f2py intent(in)       :: signal
+    !f2py intent(inout)    :: map1d
+    !f2py intent(hide)     :: nsamples = shape(signal,0)
+    !f2py intent(hide)     :: ndetectors = shape(signal,1)
+    !f2py intent(hide)     :: nelements = size(weights)
+    !f2py intent(hide)     :: nwords = size(pixels)
+    !f2py intent(hide)     :: npixels = size(map1d)
+
+    integer*8, intent(in)  :: nsamples
+    integer, intent(in)    :: ndetectors
+    integer*8, intent(in)  :: nelements, nwords
+    integer, intent(in)    :: npixels
+    integer*1, intent(in)  :: counts(nsamples, ndetectors)
+    integer*2, intent(in)  :: weights(nelements)
+    real(p), intent(in)    :: scale
+    integer*2, intent(in)  :: pixels(nwords)
+    integer*8, intent(in)  :: offsets(2, ndetectors)
+    real(p), intent(in)    :: signal(nsamples, ndetectors)
+    real(p), intent(inout) :: map1d(npixels)
+
+    call pmatrix_compressed_transpose(counts, weights, scale, pixels, offsets, signal, map1d)
+
+end subroutine pointing_matrix_compressed_transpose
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
 subroutine pointing_matrix_ptp(pmatrix, ptp, npixels_per_sample, nsamples, ndetectors, npixels)
 
     use module_pointingmatrix, only : PointingElement, pmatrix_ptp
@@ -366,7 +604,167 @@ end subroutine deglitch_l2b_mad
 !-----------------------------------------------------------------------------------------------------------------------------------
 
 
-subroutine filter_median(data, mask, length, nsamples, nsamples_tot, ndetectors, nslices, status)
+subroutine deglitch_index_count(pmatrix, npixels, npixels_per_sample, nsamples, ndetectors, offsets)
+
+    use module_pointingmatrix, only : PointingElement
+    use module_deglitching,    only : count => deglitch_index_count
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, intent(in)       :: pmatrix(npixels_per_sample*nsamples*ndetectors)
+    !f2py intent(in)                  :: npixels
+    !f2py intent(in)                  :: npixels_per_sample
+    !f2py intent(in)                  :: nsamples
+    !f2py intent(in)                  :: ndetectors
+    !f2py intent(out)                 :: offsets
+
+    type(PointingElement), intent(in) :: pmatrix(npixels_per_sample,nsamples,ndetectors)
+    integer, intent(in)               :: npixels
+    integer, intent(in)               :: npixels_per_sample
+    integer*8, intent(in)             :: nsamples
+    integer, intent(in)               :: ndetectors
+    integer*8, intent(out)            :: offsets(npixels+1)
+
+    call count(pmatrix, npixels, offsets)
+
+end subroutine deglitch_index_count
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine deglitch_index_fill(pmatrix, npixels_per_sample, nsamples, ndetectors, offsets, npixels, isamples, idetectors, weights,&
+                               nentries)
+
+    use module_pointingmatrix, only : PointingElement
+    use module_deglitching,    only : fill => deglitch_index_fill
+    use module_precision,      only : sp
+    implicit none
+
+    !f2py threadsafe
+    !f2py integer*8, intent(in)       :: pmatrix(npixels_per_sample*nsamples*ndetectors)
+    !f2py intent(in)                  :: npixels_per_sample
+    !f2py intent(in)                  :: nsamples
+    !f2py intent(in)                  :: ndetectors
+    !f2py intent(in)                  :: offsets
+    !f2py intent(hide)                :: npixels = size(offsets) - 1
+    !f2py intent(inout)               :: isamples
+    !f2py intent(inout)               :: idetectors
+    !f2py intent(inout)               :: weights
+    !f2py intent(hide)                :: nentries = size(isamples)
+
+    type(PointingElement), intent(in) :: pmatrix(npixels_per_sample,nsamples,ndetectors)
+    integer, intent(in)               :: npixels_per_sample
+    integer*8, intent(in)             :: nsamples
+    integer, intent(in)               :: ndetectors
+    integer*8, intent(in)             :: offsets(npixels+1)
+    integer, intent(in)               :: npixels
+    integer, intent(inout)            :: isamples(nentries)
+    integer, intent(inout)            :: idetectors(nentries)
+    real(sp), intent(inout)           :: weights(nentries)
+    integer*8, intent(in)             :: nentries
+
+    call fill(pmatrix, offsets, isamples, idetectors, weights)
+
+end subroutine deglitch_index_fill
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine deglitch_index_l2b(offsets, npixels, isamples, idetectors, weights, nentries, data, mask, nsigma, use_mad, nsamples,   &
+                              ndetectors)
+
+    use module_deglitching, only : deglitch => deglitch_index_l2b
+    use module_precision,   only : sp
+    use module_tamasis,     only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)                  :: offsets
+    !f2py intent(hide)                :: npixels = size(offsets) - 1
+    !f2py intent(in)                  :: isamples
+    !f2py intent(in)                  :: idetectors
+    !f2py intent(in)                  :: weights
+    !f2py intent(hide)                :: nentries = size(isamples)
+    !f2py intent(in)                  :: data
+    !f2py intent(inout)               :: mask
+    !f2py intent(in)                  :: nsigma
+    !f2py intent(in)                  :: use_mad
+    !f2py intent(hide)                :: nsamples = shape(data,0)
+    !f2py intent(hide)                :: ndetectors = shape(data,1)
+
+    integer*8, intent(in)             :: offsets(npixels+1)
+    integer, intent(in)               :: npixels
+    integer, intent(in)               :: isamples(nentries)
+    integer, intent(in)               :: idetectors(nentries)
+    real(sp), intent(in)              :: weights(nentries)
+    integer*8, intent(in)             :: nentries
+    real(p), intent(in)               :: data(nsamples,ndetectors)
+    logical*1, intent(inout)          :: mask(nsamples,ndetectors)
+    real(p), intent(in)               :: nsigma
+    logical, intent(in)               :: use_mad
+    integer, intent(in)               :: nsamples
+    integer, intent(in)               :: ndetectors
+
+    call deglitch(offsets, isamples, idetectors, weights, data, mask, nsigma, use_mad, verbose=.true.)
+
+end subroutine deglitch_index_l2b
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine deglitch_index_l2b_iterative(offsets, npixels, isamples, idetectors, weights, nentries, data, mask, nsigma, use_mad,    &
+                                        maxiter, nsamples, ndetectors, counts, niterations)
+
+    use module_deglitching, only : deglitch => deglitch_index_l2b_iterative
+    use module_precision,   only : sp
+    use module_tamasis,     only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)                  :: offsets
+    !f2py intent(hide)                :: npixels = size(offsets) - 1
+    !f2py intent(in)                  :: isamples
+    !f2py intent(in)                  :: idetectors
+    !f2py intent(in)                  :: weights
+    !f2py intent(hide)                :: nentries = size(isamples)
+    !f2py intent(in)                  :: data
+    !f2py intent(inout)               :: mask
+    !f2py intent(in)                  :: nsigma
+    !f2py intent(in)                  :: use_mad
+    !f2py intent(in)                  :: maxiter
+    !f2py intent(hide)                :: nsamples = shape(data,0)
+    !f2py intent(hide)                :: ndetectors = shape(data,1)
+    !f2py intent(out)                 :: counts
+    !f2py intent(out)                 :: niterations
+
+    integer*8, intent(in)             :: offsets(npixels+1)
+    integer, intent(in)               :: npixels
+    integer, intent(in)               :: isamples(nentries)
+    integer, intent(in)               :: idetectors(nentries)
+    real(sp), intent(in)              :: weights(nentries)
+    integer*8, intent(in)             :: nentries
+    real(p), intent(in)               :: data(nsamples,ndetectors)
+    logical*1, intent(inout)          :: mask(nsamples,ndetectors)
+    real(p), intent(in)               :: nsigma
+    logical, intent(in)               :: use_mad
+    integer, intent(in)               :: maxiter
+    integer, intent(in)               :: nsamples
+    integer, intent(in)               :: ndetectors
+    integer*8, intent(out)            :: counts(maxiter)
+    integer, intent(out)              :: niterations
+
+    call deglitch(offsets, isamples, idetectors, weights, data, mask, nsigma, use_mad, counts, niterations, verbose=.true.)
+
+end subroutine deglitch_index_l2b_iterative
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine filter_median(data, mask, length, kernel, nsamples, nsamples_tot, ndetectors, nslices, status)
 
     use iso_fortran_env,     only : ERROR_UNIT, OUTPUT_UNIT
     use module_preprocessor, only : median_filtering
@@ -378,6 +776,7 @@ subroutine filter_median(data, mask, length, nsamples, nsamples_tot, ndetectors,
     !f2py intent(in)       :: data
     !f2py intent(in)       :: mask
     !f2py intent(in)       :: length
+    !f2py intent(in)       :: kernel
     !f2py intent(in)       :: nsamples
     !f2py intent(hide)     :: nsamples_tot=shape(data,0)
     !f2py intent(hide)     :: ndetectors=shape(data,1)
@@ -387,13 +786,14 @@ subroutine filter_median(data, mask, length, nsamples, nsamples_tot, ndetectors,
     real(p), intent(inout) :: data(nsamples_tot,ndetectors)
     logical*1, intent(in)  :: mask(nsamples_tot,ndetectors)
     integer, intent(in)    :: length
+    integer, intent(in)    :: kernel
     integer, intent(in)    :: nsamples(nslices)
     integer, intent(in)    :: nsamples_tot
     integer, intent(in)    :: nslices
     integer, intent(in)    :: ndetectors
     integer, intent(out)   :: status
 
-    integer :: islice, idetector, start
+    integer :: islice, idetector, iwork, start(nslices+1)
     integer :: count_start
 
     if (sum(nsamples) /= nsamples_tot) then
@@ -411,12 +811,23 @@ subroutine filter_median(data, mask, length, nsamples, nsamples_tot, ndetectors,
     status = 0
 
     call system_clock(count_start)
-    start = 1
+    start(1) = 1
     do islice = 1, nslices
-        call median_filtering(data(start:start+nsamples(islice)-1,:), mask(start:start+nsamples(islice)-1,:), length)
-        start = start + nsamples(islice)
+        start(islice+1) = start(islice) + nsamples(islice)
     end do
 
+    ! the work is scheduled dynamically over the pairs of slice and detector, since the cost of a timeline depends on its
+    ! number of masked samples
+    !$omp parallel do schedule(dynamic) private(islice, idetector)
+    do iwork = 0, nslices * ndetectors - 1
+        islice = iwork / ndetectors + 1
+        idetector = modulo(iwork, ndetectors) + 1
+        if (nsamples(islice) == 0) cycle
+        call median_filtering(data(start(islice):start(islice+1)-1,idetector), mask(start(islice):start(islice+1)-1,idetector), &
+                              length, kernel)
+    end do
+    !$omp end parallel do
+
     ! the filtered timeline has NaN only if it is completely masked
     do idetector = 1, ndetectors
         if (data(1,idetector) /= data(1,idetector)) then
@@ -432,6 +843,92 @@ end subroutine filter_median
 !-----------------------------------------------------------------------------------------------------------------------------------
 
 
+subroutine filter_median_multi(data, mask, lengths, kernel, nsamples, nsamples_tot, ndetectors, nlengths, nslices, filtered,       &
+                               status)
+
+    use iso_fortran_env,     only : ERROR_UNIT, OUTPUT_UNIT
+    use module_preprocessor, only : median_filtering_multi
+    use module_tamasis,      only : p, info_time
+    use module_string,       only : strinteger
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)       :: data
+    !f2py intent(in)       :: mask
+    !f2py intent(in)       :: lengths
+    !f2py intent(in)       :: kernel
+    !f2py intent(in)       :: nsamples
+    !f2py intent(hide)     :: nsamples_tot=shape(data,0)
+    !f2py intent(hide)     :: ndetectors=shape(data,1)
+    !f2py intent(hide)     :: nlengths=size(lengths)
+    !f2py intent(hide)     :: nslices=size(nsamples)
+    !f2py intent(in)       :: filtered
+    !f2py intent(out)      :: status
+
+    real(p), intent(in)    :: data(nsamples_tot,ndetectors)
+    logical*1, intent(in)  :: mask(nsamples_tot,ndetectors)
+    integer, intent(in)    :: lengths(nlengths)
+    integer, intent(in)    :: kernel
+    integer, intent(in)    :: nsamples(nslices)
+    integer, intent(in)    :: nsamples_tot
+    integer, intent(in)    :: ndetectors
+    integer, intent(in)    :: nlengths
+    integer, intent(in)    :: nslices
+    real(p), intent(inout) :: filtered(nsamples_tot,ndetectors,nlengths)
+    integer, intent(out)   :: status
+
+    integer :: islice, idetector, ilength, iwork, start(nslices+1)
+    integer :: count_start
+
+    if (sum(nsamples) /= nsamples_tot) then
+        status = 1
+        write (ERROR_UNIT,'(a)') 'ERROR: The total number of samples is not the sum of the size of the slices.'
+        return
+    end if
+
+    if (any(lengths <= 0)) then
+        status = 1
+        write (ERROR_UNIT,'(a)') 'ERROR: The filter length must not be negative.'
+        return
+    end if
+
+    status = 0
+
+    call system_clock(count_start)
+    start(1) = 1
+    do islice = 1, nslices
+        start(islice+1) = start(islice) + nsamples(islice)
+    end do
+
+    ! the timeline of a slice is filtered for all the lengths while it is in the cache
+    !$omp parallel do schedule(dynamic) private(islice, idetector)
+    do iwork = 0, nslices * ndetectors - 1
+        islice = iwork / ndetectors + 1
+        idetector = modulo(iwork, ndetectors) + 1
+        if (nsamples(islice) == 0) cycle
+        call median_filtering_multi(data(start(islice):start(islice+1)-1,idetector),                                              &
+                                    mask(start(islice):start(islice+1)-1,idetector), lengths,                                     &
+                                    filtered(start(islice):start(islice+1)-1,idetector,:), kernel)
+    end do
+    !$omp end parallel do
+
+    ! the filtered timeline has NaN only if it is completely masked
+    do ilength = 1, nlengths
+        do idetector = 1, ndetectors
+            if (filtered(1,idetector,ilength) /= filtered(1,idetector,ilength)) then
+                filtered(:,idetector,ilength) = 0
+            end if
+        end do
+    end do
+
+    call info_time('Median filtering (' // strinteger(nlengths) // ' lengths)', count_start)
+
+end subroutine filter_median_multi
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
 subroutine fft_filter_uncorrelated(data, nsamples, nsamples_tot, ncorrelations, ndetectors, nslices, tod_filter, status)
 
     use iso_fortran_env,  only : ERROR_UNIT
@@ -734,6 +1231,94 @@ end subroutine divide_inplace
 !-----------------------------------------------------------------------------------------------------------------------------------
 
 
+subroutine axpy_inplace(y, alpha, x, n)
+
+    use module_tamasis,  only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(inout)    :: y
+    !f2py intent(in)       :: alpha
+    !f2py intent(in)       :: x
+    !f2py intent(hide)     :: n = size(y)
+
+    real(p), intent(inout) :: y(n)
+    real(p), intent(in)    :: alpha
+    real(p), intent(in)    :: x(n)
+    integer, intent(in)    :: n
+    integer                :: i
+
+    !$omp parallel do
+    do i = 1, n
+        y(i) = y(i) + alpha * x(i)
+    end do
+    !$omp end parallel do
+
+end subroutine axpy_inplace
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine xpby_inplace(y, x, beta, n)
+
+    use module_tamasis,  only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(inout)    :: y
+    !f2py intent(in)       :: x
+    !f2py intent(in)       :: beta
+    !f2py intent(hide)     :: n = size(y)
+
+    real(p), intent(inout) :: y(n)
+    real(p), intent(in)    :: x(n)
+    real(p), intent(in)    :: beta
+    integer, intent(in)    :: n
+    integer                :: i
+
+    !$omp parallel do
+    do i = 1, n
+        y(i) = x(i) + beta * y(i)
+    end do
+    !$omp end parallel do
+
+end subroutine xpby_inplace
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
+subroutine dot(a, b, n, output)
+
+    use module_tamasis,  only : p
+    implicit none
+
+    !f2py threadsafe
+    !f2py intent(in)       :: a
+    !f2py intent(in)       :: b
+    !f2py intent(hide)     :: n = size(a)
+    !f2py intent(out)      :: output
+
+    real(p), intent(in)    :: a(n)
+    real(p), intent(in)    :: b(n)
+    integer, intent(in)    :: n
+    real(p), intent(out)   :: output
+    integer                :: i
+
+    output = 0
+    !$omp parallel do reduction(+:output)
+    do i = 1, n
+        output = output + a(i) * b(i)
+    end do
+    !$omp end parallel do
+
+end subroutine dot
+
+
+!-----------------------------------------------------------------------------------------------------------------------------------
+
+
 subroutine diff(array, asize, dim, ashape, arank)
 
     use module_math,    only : diff_fast, diff_slow
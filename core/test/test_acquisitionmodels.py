@@ -297,6 +297,38 @@ for i, t in zip(inputs, otypes):
 
 m = Identity() * a * Identity()
 
+# work buffers of the execution plan
+np.random.seed(0)
+b = np.random.random_sample((3,4))
+b0 = b.copy()
+mask = np.random.random_sample((3,4)) > 0.5
+d = np.arange(3.) + 1
+reshaping = Reshaping(12, (3,4))
+for model in (reshaping.T * Masking(mask) * Diagonal(d) * reshaping,
+              Masking(mask) + Diagonal(d) + Scalar(2.),
+              Masking(mask) * (Diagonal(d) + Scalar(2.)) * Identity()):
+    input = b.ravel() if model.shapein == (12,) else b
+    ref = model(input)
+    o1 = model(input, cacheout=True)
+    o2 = model(input, cacheout=True)
+    if any_neq(o1, ref) or any_neq(o2, ref): raise TestFailure('plan1')
+    if id(o1) != id(o2): raise TestFailure('plan2')
+    if np.any(b != b0): raise TestFailure('plan3')
+    if any_neq(model.T(input), ref): raise TestFailure('plan4')
+
+# operands of an addition sharing a cached model
+tod = Tod(np.random.random_sample((2,4)))
+compression = CompressionAverage(2)
+diagonal = Diagonal([[1.,2.,3.,4.],[5.,6.,7.,8.]])
+model = compression + compression * diagonal
+ref = compression(tod) + compression(diagonal(tod))
+for i in range(2):
+    if any_neq(model(tod, cacheout=True), ref): raise TestFailure('plan5')
+tod2 = Tod(np.random.random_sample((2,2)))
+ref = compression.T(tod2) + diagonal(compression.T(tod2))
+for i in range(2):
+    if any_neq(model.T(tod2, cacheout=True), ref): raise TestFailure('plan6')
+
 #------------------------------
 # ResponseTruncatedExponential
 #------------------------------
@@ -340,3 +372,118 @@ for axis in range(2,4):
 for axis in range(3,4):
     shift = Shift(np.random.random_integers(-2,2,(3,4,5)), axis=axis, shapein=(3,4,5,6))
     if any_neq(shift.dense().T, shift.T.dense()): raise TestFailure()
+
+#----------------
+# Block diagonal
+#----------------
+
+blocks = np.random.random_sample((3,2,2))
+blocks += blocks.swapaxes(1,2)
+index = np.array([[0,3],[1,-1],[2,4]])
+bd = BlockDiagonal(blocks, index, shapein=(5,))
+dense = np.zeros((5,5))
+for b, i in zip(blocks, index):
+    v = i >= 0
+    dense[np.ix_(i[v],i[v])] = b[v][:,v]
+if any_neq(bd.dense(), dense): raise TestFailure()
+if any_neq(bd.T.dense(), bd.dense().T): raise TestFailure()
+
+#----------------
+# Simplification
+#----------------
+
+np.random.seed(0)
+b = np.random.random_sample((3,4))
+mask1 = np.random.random_sample((3,4)) > 0.5
+mask2 = np.random.random_sample((3,4)) > 0.5
+d = np.arange(3.) + 1
+model = Masking(mask1) * Identity() * Scalar(2.) * Masking(mask2) * \
+        Diagonal(d) * Identity() * Scalar(3.) * Reshaping(12,(3,4)) * \
+        Reshaping((3,4),12)
+simplified = model.simplify()
+if any_neq(simplified(b), model(b), 1.e-12): raise TestFailure('simplify1')
+if [type(m) for m in simplified.blocks] != [Masking, Diagonal]:
+    raise TestFailure('simplify2')
+if simplified.shapein != (3,4): raise TestFailure('simplify3')
+if len(model.blocks) != 9: raise TestFailure('simplify4')
+
+for m1, m2 in ((mask1, mask2), (mask1, b), (b, mask2), (b, b)):
+    model = Masking(m1) * Masking(m2)
+    simplified = model.simplify()
+    if type(simplified) is not Masking: raise TestFailure('simplify5')
+    if any_neq(simplified(b), model(b), 1.e-12): raise TestFailure('simplify6')
+
+reshaping = Reshaping(12,(3,4))
+simplified = (reshaping.T * Identity() * reshaping).simplify()
+if type(simplified) is not Identity or simplified.shapein != (12,):
+    raise TestFailure('simplify7')
+
+model = Identity() + Scalar(2.) + Diagonal(d) + Masking(mask1)
+simplified = model.simplify()
+if len(simplified.blocks) != 2: raise TestFailure('simplify8')
+if any_neq(simplified(b), model(b), 1.e-12): raise TestFailure('simplify9')
+
+model = Diagonal(d) * Diagonal(np.ones(4))
+if len(model.simplify().blocks) != 2: raise TestFailure('simplify10')
+
+
+#-------------------
+# Batch application
+#-------------------
+
+v = np.array([1., 2., 3., 4.])
+batch = np.array([v, 2 * v, v**2])
+model = Diagonal([[1.,2.],[3.,4.]]) * Reshaping(4, (2,2)) + \
+        Scalar(3.) * Reshaping(4, (2,2))
+compression = CompressionAverage(2)
+for m, input in ((model, batch), (model.T, batch.reshape((3,2,2))),
+                 (compression, Tod(batch.reshape((3,2,2)))),
+                 (compression.T, Tod(batch[:,0:2].reshape((3,2,1))))):
+    output = m.direct_batch(input)
+    if output.shape[0] != 3: raise TestFailure('batch1')
+    for i in range(3):
+        if any_neq(output[i], m(input[i]), 1.e-12): raise TestFailure('batch2')
+try:
+    model.direct_batch(np.empty((0,4)))
+except ValueError:
+    pass
+else:
+    raise TestFailure('batch3')
+
+
+#---------------------
+# InterpolationLinear
+#---------------------
+
+mask = np.array([[False,True,True,False],[True,False,True,False]])
+interp = InterpolationLinear(mask)
+tod = Tod([[1.,0,0,4],[0,2,0,4]])
+if any_neq(interp(tod), [[1,2,3,4],[2,2,3,4]]): raise TestFailure()
+if any_neq(tod, [[1,0,0,4],[0,2,0,4]]): raise TestFailure()
+interp(tod, True)
+if any_neq(tod, [[1,2,3,4],[2,2,3,4]]): raise TestFailure()
+
+
+#-----------
+# AllReduce
+#-----------
+
+from tamasis.acquisitionmodels import _get_mpi_datatype
+from mpi4py import MPI
+if _get_mpi_datatype(np.float32) is not MPI.FLOAT: raise TestFailure()
+if _get_mpi_datatype(np.float64) is not MPI.DOUBLE: raise TestFailure()
+try:
+    _get_mpi_datatype(np.dtype(np.float64).newbyteorder())
+except TypeError:
+    pass
+else:
+    raise TestFailure()
+
+size = MPI.COMM_WORLD.Get_size()
+d = Diagonal(np.arange(7, dtype=FTYPE) + 1)
+model = AllReduce(chunksize=3) * d
+if not model.nonblocking: raise TestFailure()
+v = np.ones(7)
+if any_neq(model(v), size * d.diagonal): raise TestFailure()
+model = model + 2 * d
+if any_neq(model(v), (size + 2) * d.diagonal): raise TestFailure()
@@ -2,6 +2,7 @@ import numpy as np
 import glob
 import os
 import pickle
+import shutil
 import tamasis
 from tamasis import *
 from tamasis.numpyutils import get_attributes
@@ -245,8 +246,45 @@ a = Tod(np.random.random_sample((10,2,10)), mask=m, nsamples=(2,8), unit='Jy')
 a.save(filename+'_tod.fits')
 b = Tod(filename+'_tod.fits')
 if np.any(a != b): raise TestFailure()
+for mmap in (True, 'readonly'):
+    b = Tod(filename+'_tod.fits', mmap=mmap)
+    base = b
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    if base is None: raise TestFailure()
+    if np.any(a != b) or np.any(a.mask != b.mask): raise TestFailure()
+    if b.nsamples != a.nsamples: raise TestFailure()
+b = Tod(filename+'_tod.fits', mmap=True)
+b[0,0,0] += 1
+if Tod(filename+'_tod.fits')[0,0,0] != a[0,0,0]: raise TestFailure()
+b = Tod(filename+'_tod.fits', mmap='readonly')
+try:
+    b[0,0,0] += 1
+except (RuntimeError, ValueError):
+    pass
+else:
+    raise TestFailure()
 # or np.any(a.mask != b.mask) or a.nsamples != b.nsamples: raise TestFailure()
 
+# native container
+a.save_native(filename+'_native')
+b = Tod.load_native(filename+'_native')
+if any_neq(a, b) or np.any(a.mask != b.mask): raise TestFailure()
+if b.nsamples != a.nsamples or b.unit != a.unit: raise TestFailure()
+a.save_native(filename+'_native', append=True)
+b = Tod.load_native(filename+'_native', mmap=False)
+if b.nsamples != a.nsamples * 2: raise TestFailure()
+if any_neq(b[...,10:], a) or np.any(b.mask[...,10:] != a.mask):
+    raise TestFailure()
+b = Tod.load_native(filename+'_native', detectors=slice(2,5),
+                    samples=slice(1,7))
+if b.nsamples != (1,5): raise TestFailure()
+if any_neq(b, a[2:5,:,1:7]) or np.any(b.mask != a.mask[2:5,:,1:7]):
+    raise TestFailure()
+b = Tod.load_native(filename+'_native', samples=slice(3,8))
+if not isinstance(b.base, np.memmap): raise TestFailure()
+shutil.rmtree(filename+'_native')
+
 class MAP(Map):
     def __init__(self, data):
         self.info = 'info'
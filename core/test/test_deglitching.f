@@ -4,6 +4,7 @@ program test_deglitching
     use module_deglitching
     use module_math,           only : linspace
     use module_pointingmatrix, only : pointingelement, pmatrix_direct, xy2roi, roi2pmatrix
+    use module_precision,      only : sp
     use module_tamasis,        only : p
     implicit none
 
@@ -13,6 +14,11 @@ program test_deglitching
     integer                           :: ntimes, ndetectors, npixels_per_sample
     integer                           :: nrepeats
     integer                           :: nx, ny
+    integer*8, allocatable            :: offsets(:), counts(:)
+    integer, allocatable              :: isamples(:), idetectors(:)
+    real(sp), allocatable             :: weights(:)
+    logical(kind=1), allocatable      :: mask_ref(:,:)
+    integer                           :: niterations
     real(p), allocatable              :: xc(:), yc(:)
     real(p), allocatable              :: map(:), signal(:,:)
     logical(kind=1), allocatable      :: mask(:,:)
@@ -177,6 +183,37 @@ program test_deglitching
         any(.not. mask([1,3,4,8,9,10,15,16,17],2)) .or. &
         any(.not. mask([3,8,9,10,15,16],3))) call failure('deglitch_l2b 3')
 
+
+    !-------------------------------------
+    ! test 4: iterative deglitching
+    !-------------------------------------
+
+    allocate (offsets(0:nx*ny), counts(10), mask_ref(ntimes,ndetectors))
+    call deglitch_index_count(pmatrix, nx*ny, offsets)
+    allocate (isamples(0:offsets(nx*ny)-1), idetectors(0:offsets(nx*ny)-1), weights(0:offsets(nx*ny)-1))
+    call deglitch_index_fill(pmatrix, offsets, isamples, idetectors, weights)
+
+    signal(12,1) = 20._p
+    signal(5,2) = 4._p
+    signal(7,3) = 4._p
+    mask_ref = .false.
+    niterations = 0
+    do
+        mask = mask_ref
+        call deglitch_l2b(pmatrix, nx, ny, signal, mask_ref, 2._p, .false.)
+        niterations = niterations + 1
+        if (all(mask .eqv. mask_ref)) exit
+    end do
+
+    mask = .false.
+    call deglitch_index_l2b_iterative(offsets, isamples, idetectors, weights, signal, mask, 2._p, .false., counts, i)
+    if (niterations < 3) call failure('deglitch_index_l2b_iterative 0')
+    if (i /= niterations .or. any(mask .neqv. mask_ref) .or. counts(i) /= 0 .or. sum(counts) /= count(mask) .or.           &
+        any(counts(i+1:) /= 0)) call failure('deglitch_index_l2b_iterative 1')
+
+    call deglitch_index_l2b_iterative(offsets, isamples, idetectors, weights, signal, mask, 2._p, .false., counts(1:1), i)
+    if (i /= 1 .or. counts(1) /= 0 .or. any(mask .neqv. mask_ref)) call failure('deglitch_index_l2b_iterative 2')
+
 !!$    do idetector = 1, ndetectors
 !!$        write (*,'(a,i0,a)') 'Detector ', idetector, ': '
 !!$        do itime=1, ntimes
@@ -12,3 +12,52 @@ class TestFailure(Exception):
         raise Exception()
 
 if var.mpi_comm.Get_rank() != MPI.COMM_WORLD.Get_rank(): raise TestFailure()
+
+# chunked non-blocking reduction
+from tamasis import AllReduce
+for chunksize in (3, None):
+    x = np.arange(10.) * (rank + 1)
+    y = AllReduce(chunksize=chunksize)(x)
+    if any_neq(y, np.arange(10) * size * (size + 1) // 2): raise TestFailure(y)
+
+# reduction restricted to the union of the supports
+x = np.zeros((4,5))
+x.flat[2*rank:2*rank+3] = rank + 1
+allreduce = AllReduce(support=x != 0)
+if allreduce.index.size != min(2*size+1, x.size): raise TestFailure(allreduce.index)
+expected = np.zeros(x.size)
+for r in range(size):
+    expected[2*r:2*r+3] += r + 1
+y = allreduce(x)
+if any_neq(y.ravel(), expected): raise TestFailure(y)
+
+# balanced partition of detectors and samples
+detectors = np.zeros((16,32), bool)
+detectors[0,:] = True
+assignments, loads = mu.split_work(detectors, [1000, 50000, 3000],
+                                   ['n1']*4 + ['n2']*4, 8)
+if np.any(loads != 480 * 54000 // 8): raise TestFailure(loads)
+if assignments[1] != (slice(120,240), [(0, slice(0,1000)),
+                                       (1, slice(0,26000))]):
+    raise TestFailure(assignments[1])
+if assignments[4] != (slice(0,120), [(1, slice(26000,50000)),
+                                     (2, slice(0,3000))]):
+    raise TestFailure(assignments[4])
+assignments, loads = mu.split_work(detectors, [100000], ['a','b','a'])
+if [a[1][0][1] for a in assignments] != [slice(0,66666), slice(66666,100000),
+                                         slice(0,66666)]:
+    raise TestFailure(assignments)
+if np.max(loads) > 1.001 * np.min(loads): raise TestFailure(loads)
+
+# more processors than valid detectors or than samples
+detectors = np.ones((16,32), bool)
+detectors[0,0:3] = False
+for nsamples, nodes in (([1000], ['a']*4), ([2, 1], ['a','b','c','d'])):
+    try:
+        mu.split_work(detectors, nsamples, nodes)
+    except ValueError:
+        pass
+    else:
+        raise TestFailure(nsamples, nodes)
+assignments, loads = mu.split_work(detectors, [2, 1], ['a','b','c'])
+if np.any(loads != 3): raise TestFailure(loads)
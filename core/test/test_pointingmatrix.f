@@ -3,6 +3,7 @@ program test_pointingmatrix
     use iso_fortran_env,      only : ERROR_UNIT
     use module_math,          only : sum_kahan, neq_real
     use module_pointingmatrix
+    use module_precision,     only : sp
     use module_tamasis,       only : p
     use module_projection,    only : surface_convex_polygon
     implicit none
@@ -15,6 +16,8 @@ program test_pointingmatrix
     integer :: npixels_per_sample, ntimes, ndetectors, nroi, nx, ny, itime
     logical :: out
     type(pointingelement), allocatable :: pmatrix(:,:,:)
+    real(p), allocatable :: map(:,:), timeline(:,:,:), single_timeline(:,:), single_map(:), ptwp(:)
+    real(sp), allocatable :: weight(:,:)
 
     ndetectors = 100
     ntimes = 1000
@@ -51,6 +54,35 @@ program test_pointingmatrix
         call failure('roi2pmatrix2')
     end if
 
+    ! batch of three maps and timelines
+    pmatrix(2,1:ntimes:2,:)%pixel = -1
+    allocate(map(3,0:nx*ny-1))
+    allocate(timeline(ntimes,ndetectors,3))
+    allocate(single_timeline(ntimes,ndetectors))
+    allocate(single_map(0:nx*ny-1))
+    do i = 1, 3
+        map(i,:) = [(real(i * itime, p), itime = 0, nx*ny-1)]
+    end do
+    call pmatrix_direct_batch(pmatrix, map, timeline)
+    do i = 1, 3
+        call pmatrix_direct(pmatrix, map(i,:), single_timeline)
+        if (any(neq_real(timeline(:,:,i), single_timeline, 10._p * epsilon(1.0_p)))) call failure('pmatrix_direct_batch')
+    end do
+    call pmatrix_transpose_batch(pmatrix, timeline, map)
+    do i = 1, 3
+        call pmatrix_transpose(pmatrix, timeline(:,:,i), single_map)
+        if (any(neq_real(map(i,:), single_map, 10._p * epsilon(1.0_p)))) call failure('pmatrix_transpose_batch')
+    end do
+
+    ! single precision weight
+    allocate(weight(ntimes,ndetectors))
+    allocate(ptwp(0:nx*ny-1))
+    weight = 0.5_sp
+    weight(1:ntimes:3,:) = 0
+    call pmatrix_ptwp(pmatrix, real(weight, p), 1, map(1,:), single_map)
+    call pmatrix_ptwp_sp(pmatrix, weight, 1, map(1,:), ptwp)
+    if (any(neq_real(ptwp, single_map, 10._p * epsilon(1.0_p)))) call failure('pmatrix_ptwp_sp')
+
 contains
 
     subroutine failure(errmsg)
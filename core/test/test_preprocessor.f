@@ -25,6 +25,10 @@ program test_preprocessor
     !print(scipy.signalmedfilt(small, kernel_size=3))
     if (any(neq_real(small-filtered,[5._p,3._p,4._p,4._p,4._p,4._p,5._p,10._p,10._p,22._p]))) call failure('medfilt2')
 
+    filtered = small
+    call median_filtering(filtered, 5, MEDIAN_KERNEL_SORTED)
+    if (any(neq_real(small-filtered,[5._p,3._p,4._p,4._p,4._p,4._p,5._p,10._p,10._p,22._p]))) call failure('medfilt3')
+
     deallocate (filtered)
 
     small = [ NaN, NaN, 2._p, NaN, NaN, 5._p, NaN, 5._p, 4.5_p, NaN]
@@ -89,6 +93,10 @@ program test_preprocessor
 
     if (any(neq_real(timeline-reference, filtered, 100._p * epsilon(1._p)))) call failure('median_filtering mask')
 
+    filtered = timeline
+    call median_filtering(filtered, mask, 3, MEDIAN_KERNEL_HISTOGRAM)
+    if (any(neq_real(timeline-reference, filtered, 100._p * epsilon(1._p)))) call failure('median_filtering histogram')
+
 contains
 
     subroutine failure(errmsg)
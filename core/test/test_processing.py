@@ -13,3 +13,54 @@ t = Tod([1,2,5,np.nan,np.nan,8], mask=[False,False,False,True,False,True])
 remove_nan(t)
 if any_neq(t, [1,2,5,0,0,8]): raise TestFailure()
 if any_neq(t.mask, [False,False,False,True,True,True]): raise TestFailure()
+
+# median filtering
+np.random.seed(0)
+t = Tod(np.random.random_sample((3,1000)), mask=np.random.random_sample((3,1000))<0.1, nsamples=(400,600))
+ref = filter_median(t, 21, kernel='histogram')
+if np.any(filter_median(t, 21) != ref): raise TestFailure('default kernel')
+for kernel in ('auto', 'sorted'):
+    if any_neq(filter_median(t, 21, kernel=kernel), ref, 1.e-10, 1.e-10):
+        raise TestFailure(kernel)
+filtered = filter_median(t, (21, 101))
+if len(filtered) != 2 or any_neq(filtered[0], ref): raise TestFailure('multi')
+if any_neq(filtered[1], filter_median(t, 101)): raise TestFailure('multi2')
+if filtered[0].nsamples != t.nsamples: raise TestFailure('multi3')
+t2 = t.copy()
+if filter_median(t2, 21, inplace=True) is not t2: raise TestFailure('inplace')
+if any_neq(t2, ref): raise TestFailure('inplace2')
+try:
+    filter_median(t, 21, kernel='heap')
+except ValueError:
+    pass
+else:
+    raise TestFailure('kernel')
+
+# polynomial filtering
+x = np.arange(300.)
+t = Tod(np.random.random_sample((3,300)) + 1.e-4 * x**2, nsamples=(100,200))
+filtered = filter_polynomial(t, 2)
+for s in (slice(0,100), slice(100,300)):
+    for d in range(3):
+        x = np.arange(s.stop - s.start)
+        p = np.polyfit(x, t[d,s], 2)
+        if any_neq(filtered[d,s], t[d,s] - np.polyval(p, x), 1.e-10, 1.e-10):
+            raise TestFailure('filter_polynomial')
+t.mask = np.random.random_sample(t.shape) < 0.2
+filtered = filter_polynomial(t, 2)
+x = np.arange(100)
+valid = ~t.mask[0,0:100]
+p = np.polyfit(x[valid], t[0,0:100][valid], 2)
+if any_neq(filtered[0,0:100], t[0,0:100] - np.polyval(p, x), 1.e-10, 1.e-10):
+    raise TestFailure('filter_polynomial mask')
+if filter_polynomial(t, 2, inplace=True) is not t: raise TestFailure()
+if any_neq(t, filtered): raise TestFailure('filter_polynomial inplace')
+
+# linear interpolation
+t = Tod([[1,2,0,0,5,6,0,0],[0,1,0,3,0,0,0,0],[0,0,0,0,0,0,0,0]], mask=[[0,0,1,1,0,0,1,1],[1,0,1,0,1,1,1,1],[1,1,1,1,1,1,1,1]], nsamples=(6,2))
+if interpolate_linear(t) is not t: raise TestFailure()
+if any_neq(t, [[1,2,3,4,5,6,0,0],[1,1,2,3,3,3,0,0],[0,0,0,0,0,0,0,0]]): raise TestFailure('interpolate_linear')
+t = Tod(np.random.standard_normal((2,1000)), mask=np.random.random_sample((2,1000)) < 0.2)
+t2 = interpolate_linear(t.copy(), noise=True)
+if any_neq(t2[~t.mask], t[~t.mask]): raise TestFailure('interpolate_linear noise')
+if np.std(t2[t.mask]) < 0.5: raise TestFailure('interpolate_linear noise 2')
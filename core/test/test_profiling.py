@@ -0,0 +1,61 @@
+import json
+import numpy as np
+import os
+import tempfile
+
+from tamasis import *
+
+class TestFailure(Exception): pass
+
+np.random.seed(0)
+b = np.random.random_sample((3,4))
+mask = b > 0.5
+d = np.arange(3.) + 1
+masking = Masking(mask)
+diagonal = Diagonal(d)
+scalar = Scalar(2.)
+model = masking * diagonal + scalar
+ref = model(b)
+
+profiler = Profiler(model)
+for i in range(3):
+    o = model(b, cacheout=True)
+if any_neq(o, ref): raise TestFailure('output')
+junk = Masking(mask).T(b)
+profiler.stop()
+if 'direct' in masking.__dict__ or 'transpose' in diagonal.__dict__:
+    raise TestFailure('stop')
+
+report = profiler.get_report()
+if [r['class'] for r in report] != \
+   ['Addition', 'Composition', 'Masking', 'Diagonal', 'Scalar']:
+    raise TestFailure('nodes')
+for r in report:
+    if r['direct']['ncalls'] != 3 or r['transpose']['ncalls'] != 0:
+        raise TestFailure('ncalls')
+    if r['direct']['time'] < r['direct']['time_self']:
+        raise TestFailure('time')
+    if r['direct']['moved'] != 3 * 2 * b.nbytes: raise TestFailure('moved')
+
+# the work buffers are only allocated at the first call. The addition holds
+# its output and the input of the in-place scalar
+if report[0]['direct']['allocated'] != 2 * b.nbytes or \
+   report[1]['direct']['allocated'] != b.nbytes or \
+   report[2]['direct']['allocated'] != 0: raise TestFailure('allocated')
+
+# the records are accumulated over successive instrumentations
+profiler.start(diagonal)
+junk = diagonal.transpose(b, False, False, False)
+profiler.stop()
+if len(profiler.get_report()) != 5: raise TestFailure('restart1')
+if profiler.get_report()[3]['transpose']['ncalls'] != 1 or \
+   profiler.get_report()[3]['transpose']['allocated'] != b.nbytes:
+    raise TestFailure('restart2')
+
+filename = tempfile.mktemp(suffix='.json')
+try:
+    profiler.save(filename)
+    if json.load(open(filename)) != json.loads(json.dumps(
+       profiler.get_report())): raise TestFailure('save')
+finally:
+    os.remove(filename)
@@ -0,0 +1,75 @@
+import numpy as np
+import scipy.sparse.linalg
+
+from tamasis import *
+from tamasis.var import FLOAT_DTYPE as FTYPE
+
+class TestFailure(Exception): pass
+
+
+#-----
+# pcg
+#-----
+
+np.random.seed(0)
+n = 50
+a = np.random.random_sample((n,n))
+a = np.dot(a.T, a) + n * np.eye(n)
+b = np.random.random_sample(n)
+expected = np.linalg.solve(a, b)
+A = scipy.sparse.linalg.aslinearoperator(a)
+
+class Callback():
+    def __init__(self):
+        self.niterations = 0
+        self.residual = None
+    def update(self, niterations, residual):
+        self.niterations = niterations
+        self.residual = residual
+
+callback = Callback()
+x, info = pcg(A, b, tol=1.e-10, callback=callback)
+if info != 0: raise TestFailure('pcg1')
+if any_neq(x, expected, 1.e-8): raise TestFailure('pcg2')
+if callback.niterations == 0 or callback.residual >= 1.e-10:
+    raise TestFailure('pcg3')
+
+x, info = pcg(A, b, x0=expected, tol=1.e-10)
+if info != 0: raise TestFailure('pcg4')
+if any_neq(x, expected, 1.e-8): raise TestFailure('pcg5')
+
+x, info = pcg(A, b, tol=1.e-10, maxiter=2)
+if info != 2: raise TestFailure('pcg6')
+
+d = np.arange(1, n+1, dtype=FTYPE)
+x, info = pcg(Diagonal(d), b, tol=1.e-10, M=Diagonal(1/d), callback=callback)
+if info != 0: raise TestFailure('pcg7')
+if any_neq(x, b / d, 1.e-10): raise TestFailure('pcg8')
+if callback.niterations != 1: raise TestFailure('pcg9')
+
+x, info = pcg(A, np.zeros(n))
+if info != 0 or np.any(x != 0): raise TestFailure('pcg10')
+
+
+#--------
+# pipecg
+#--------
+
+for M in (None, scipy.sparse.linalg.aslinearoperator(np.diag(1/np.diag(a)))):
+    callback = Callback()
+    x, info = pipecg(A, b, tol=1.e-12, M=M, callback=callback)
+    if info != 0: raise TestFailure('pipecg1')
+    if any_neq(x, expected, 1.e-8): raise TestFailure('pipecg2')
+    if callback.niterations == 0 or callback.residual >= 1.e-10:
+        raise TestFailure('pipecg3')
+
+x, info = pipecg(A, b, x0=expected, tol=1.e-10)
+if info != 0: raise TestFailure('pipecg4')
+if any_neq(x, expected, 1.e-8): raise TestFailure('pipecg5')
+
+x, info = pipecg(A, b, tol=1.e-10, maxiter=2)
+if info != 2: raise TestFailure('pipecg6')
+
+x, info = pipecg(Diagonal(d), b, tol=1.e-10, M=Diagonal(1/d))
+if info != 0: raise TestFailure('pipecg7')
+if any_neq(x, b / d, 1.e-10): raise TestFailure('pipecg8')
@@ -65,10 +65,17 @@ class MadMap1Observation(Observation):
         self.pointing.removed = False
 
     def get_pointing_matrix(self, header, resolution, npixels_per_sample,
-                            method=None, oversampling=False):
+                            method=None, oversampling=False, cachedir=None,
+                            pointings=None):
         """
         Method to get the pointing matrix.
         """
+        if pointings is not None:
+            raise NotImplementedError('The pointing matrix of MADmap1 observ'\
+                                      'ations cannot be computed by blocks.')
+        if cachedir is not None:
+            raise NotImplementedError('The pointing matrix of MADmap1 observ'\
+                                      'ations cannot be cached.')
         if npixels_per_sample not in (0, self.info.npixels_per_sample):
             raise ValueError('The npixels_per_sample value is incompatible wi' \
                              'th the MADMAP1 file.')
@@ -18,6 +18,12 @@ invNtt = InvNtt(len(tod.nsamples)*(1024,), obs.get_filter_uncorrelated())
 fft = FftHalfComplex(len(tod.nsamples)*(1024,))
 padding = Padding(left=invNtt.ncorrelations, right=1024-np.array(tod.nsamples)-invNtt.ncorrelations)
 projection = Projection(obs)
+try:
+    Projection(obs, cachedir='.')
+except NotImplementedError:
+    pass
+else:
+    raise TestFailure('pmatrix cache')
 packing = Unpacking(obs.info.mapmask, field=np.nan).T
 
 map_naive = mapper_naive(tod, projection)
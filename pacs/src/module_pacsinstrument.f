@@ -656,7 +656,7 @@ contains
     !-------------------------------------------------------------------------------------------------------------------------------
 
 
-    subroutine compute_projection(this, method, obs, oversampling, header, nx, ny, pmatrix, npixels_per_sample, status)
+    subroutine compute_projection(this, method, obs, oversampling, header, nx, ny, pmatrix, npixels_per_sample, status, verbose)
 
         class(PacsInstrument), intent(in)  :: this
         integer, intent(in)                :: method
@@ -667,9 +667,16 @@ contains
         type(PointingElement), intent(out) :: pmatrix(:,:,:)
         integer, intent(out)               :: npixels_per_sample
         integer, intent(out)               :: status
+        logical, intent(in), optional      :: verbose
 
         integer :: count_start
-        logical :: out
+        logical :: out, verbose_
+
+        if (present(verbose)) then
+            verbose_ = verbose
+        else
+            verbose_ = .true.
+        end if
 
         call system_clock(count_start)
 
@@ -686,21 +693,23 @@ contains
 
         end select
 
-        if (size(pmatrix,1) > 0) then
-            call info_time('Computing the projector', count_start)
-        else
-            call info_time('Computing the projector size', count_start)
+        if (verbose_) then
+            if (size(pmatrix,1) > 0) then
+                call info_time('Computing the projector', count_start)
+            else
+                call info_time('Computing the projector size', count_start)
+            end if
         end if
 
         if (npixels_per_sample > size(pmatrix,1) .and. size(pmatrix,1) > 0) then
             status = 1
             write (ERROR_UNIT,'(a,i0,a)') 'Error: Please update npixels_per_sample to ', npixels_per_sample, '.'
-        else if (npixels_per_sample < size(pmatrix,1) .or. size(pmatrix,1) == 0) then
+        else if ((npixels_per_sample < size(pmatrix,1) .or. size(pmatrix,1) == 0) .and. verbose_) then
             write (OUTPUT_UNIT,'(a,i0,a)') "Warning: For this observation, you can set the keyword 'npixels_per_sample' to ",      &
                   npixels_per_sample, ' for better performances.'
         end if
 
-        if (out) then
+        if (out .and. verbose_) then
             write (OUTPUT_UNIT,'(a)') 'Warning: Some detectors fall outside the map.'
         end if
 
@@ -1,4 +1,5 @@
 import glob
+import hashlib
 import kapteyn
 import numpy as np
 import os
@@ -7,6 +8,7 @@ import re
 import tempfile
 
 from . import var
+from multiprocessing.pool import ThreadPool
 from matplotlib import pyplot as P
 from mpi4py import MPI
 from tamasis.core import *
@@ -94,7 +96,8 @@ class PacsBase(Observation):
     get_map_header.__doc__ = Observation.get_map_header.__doc__
     
     def get_pointing_matrix(self, header, resolution, npixels_per_sample=0,
-                            method=None, oversampling=True):
+                            method=None, oversampling=True, cachedir=None,
+                            pointings=None):
         if method is None:
             method = 'sharp'
         method = method.lower()
@@ -103,19 +106,44 @@ class PacsBase(Observation):
             raise ValueError("Invalid method '" + method + \
                 "'. Expected values are " + strenum(choices, 'or') + '.')
 
-        nsamples = self.get_nfinesamples() if oversampling else \
-            self.get_nsamples()
         if header is None:
             header = self.get_map_header(resolution, oversampling)
         elif isinstance(header, str):
             header = _str2fitsheader(header)
 
+        if pointings is None:
+            nsamples = self.get_nfinesamples() if oversampling else \
+                self.get_nsamples()
+            index = Ellipsis
+            nsamples_all = self.slice.nsamples_all
+            removed = self.pointing.removed
+        else:
+            nsamples, index, nsamples_all, removed = \
+                self._get_pointing_block(pointings, oversampling)
+            cachedir = None
+        verbose = pointings is None
+
         ndetectors = self.get_ndetectors()
         nvalids = int(np.sum(nsamples))
+
+        if cachedir is not None:
+            key = self._get_pointing_matrix_key(header, npixels_per_sample,
+                                                method, oversampling)
+            cached = _load_pmatrix(cachedir, key)
+            if cached is not None:
+                pmatrix, npixels_per_sample = cached
+                if pmatrix.size != npixels_per_sample * nvalids * ndetectors:
+                    raise ValueError("The cached pointing matrix '" + key + \
+                                     "' has an invalid size.")
+                return pmatrix, header, ndetectors, nsamples, \
+                    npixels_per_sample, ('/detector', '/pixel'), \
+                    self.get_derived_units()
+
         if npixels_per_sample != 0:
             sizeofpmatrix = npixels_per_sample * nvalids * ndetectors
-            print('Info: Allocating '+str(sizeofpmatrix/2.**17)+' MiB for the '
-                  'pointing matrix.')
+            if verbose:
+                print('Info: Allocating '+str(sizeofpmatrix/2.**17)+' MiB for'
+                      ' the pointing matrix.')
         else:
             sizeofpmatrix = 1
         pmatrix = np.empty(sizeofpmatrix, dtype=np.int64)
@@ -123,18 +151,18 @@ class PacsBase(Observation):
         new_npixels_per_sample, status = tmf.pacs_pointing_matrix(
             self.instrument.band,
             nvalids,
-            np.ascontiguousarray(self.slice.nsamples_all, np.int32),
+            np.ascontiguousarray(nsamples_all, np.int32),
             np.ascontiguousarray(self.slice.compression_factor, np.int32),
             np.ascontiguousarray(self.slice.delay),
             self.instrument.fine_sampling_factor,
             oversampling,
-            np.ascontiguousarray(self.pointing.time),
-            np.ascontiguousarray(self.pointing.ra),
-            np.ascontiguousarray(self.pointing.dec),
-            np.ascontiguousarray(self.pointing.pa),
-            np.ascontiguousarray(self.pointing.chop),
-            np.ascontiguousarray(self.pointing.masked, np.int8),
-            np.ascontiguousarray(self.pointing.removed,np.int8),
+            np.ascontiguousarray(self.pointing.time[index]),
+            np.ascontiguousarray(self.pointing.ra[index]),
+            np.ascontiguousarray(self.pointing.dec[index]),
+            np.ascontiguousarray(self.pointing.pa[index]),
+            np.ascontiguousarray(self.pointing.chop[index]),
+            np.ascontiguousarray(self.pointing.masked[index], np.int8),
+            np.ascontiguousarray(removed, np.int8),
             method,
             np.asfortranarray(self.instrument.detector_mask, np.int8),
             self.get_ndetectors(),
@@ -144,18 +172,116 @@ class PacsBase(Observation):
             self.instrument.distortion_yz.base.base.base,
             npixels_per_sample,
             str(header).replace('\n',''),
+            verbose,
             pmatrix)
         if status != 0: raise RuntimeError()
 
         # the number of pixels per sample is now known, do the real computation
         if npixels_per_sample == 0:
-            return self.get_pointing_matrix(header, resolution,
-                new_npixels_per_sample, method, oversampling)
+            result = self.get_pointing_matrix(header, resolution,
+                max(new_npixels_per_sample, 1), method, oversampling,
+                pointings=pointings)
+            pmatrix = result[0]
+            npixels_per_sample = result[4]
+        if cachedir is not None:
+            _save_pmatrix(cachedir, key, pmatrix, npixels_per_sample)
 
         return pmatrix, header, ndetectors, nsamples, npixels_per_sample, \
                ('/detector', '/pixel'), self.get_derived_units()
     get_pointing_matrix.__doc__ = Observation.get_pointing_matrix.__doc__
 
+    def _get_pointing_block(self, pointings, oversampling):
+        """
+        Return the number of samples per slice, the pointing indices, the
+        number of pointings per slice and the removed flags required to
+        compute the pointing matrix of the pointings selected by the slice
+        'pointings'. The non-selected pointings are flagged as removed, and
+        the pointings adjacent to the selection are kept in each slice, so
+        that the interpolated positions are the same as for the full
+        observation.
+        """
+        start, stop, step = pointings.indices(self.pointing.size)
+        if step != 1:
+            raise ValueError('The pointing block must be contiguous.')
+        index = []
+        nsamples_all = []
+        nsamples = []
+        dest = 0
+        for slice in self.slice:
+            first = max(start, dest)
+            last = min(stop, dest + slice.nsamples_all)
+            dest += slice.nsamples_all
+            if first >= last:
+                nsamples_all.append(0)
+                nsamples.append(0)
+                continue
+            i = np.arange(max(first - 1, dest - slice.nsamples_all),
+                          min(last + 1, dest))
+            index.append(i)
+            nsamples_all.append(i.size)
+            n = int(np.sum(~self.pointing.removed[first:last]))
+            if oversampling:
+                n *= slice.compression_factor * \
+                     self.instrument.fine_sampling_factor
+            nsamples.append(n)
+        index = np.concatenate(index) if len(index) > 0 else \
+                np.zeros(0, int)
+        removed = self.pointing.removed[index] | (index < start) | \
+                  (index >= stop)
+        return tuple(nsamples), index, nsamples_all, removed
+
+    def _get_pointing_matrix_key(self, header, npixels_per_sample, method,
+                                 oversampling):
+        """
+        Return the hexadecimal digest identifying the pointing matrix computed
+        from this observation and the specified parameters.
+        """
+        sha = hashlib.sha1()
+        for a in (self.pointing.time, self.pointing.ra, self.pointing.dec,
+                  self.pointing.pa, self.pointing.chop, self.pointing.masked,
+                  self.pointing.removed, self.slice.nsamples_all,
+                  self.slice.compression_factor, self.slice.delay,
+                  self.instrument.detector_mask,
+                  self.instrument.detector_corner,
+                  self.instrument.detector_area,
+                  self.instrument.distortion_yz):
+            a = np.ascontiguousarray(a)
+            sha.update(str(a.dtype) + str(a.shape))
+            sha.update(a.data)
+        sha.update(repr((self.instrument.band, str(header).replace('\n',''),
+                         method, bool(oversampling),
+                         int(self.instrument.fine_sampling_factor),
+                         int(npixels_per_sample))))
+        return sha.hexdigest()
+
+    def get_status(self, names=None, index=Ellipsis):
+        """
+        Return the specified columns of the status, as a recarray.
+
+        Only the requested columns are read, and they are cached, so that
+        subsequent calls do not access the files again.
+
+        Parameters
+        ----------
+        names : str or sequence of str
+            Names of the status columns. By default, all columns are returned.
+        index : slice, integer or boolean array
+            Selection of the status records. By default, all records are
+            returned.
+        """
+        if names is None:
+            names = self._get_status_names()
+        elif isinstance(names, str):
+            names = (names,)
+        columns = [self._get_status_column(n)[index] for n in names]
+        return np.rec.fromarrays(columns, names=list(names))
+
+    def _get_status_names(self):
+        return self.status.dtype.names
+
+    def _get_status_column(self, name):
+        return self.status[name]
+
     def get_random(self, flatfielding=True, subtraction_mean=True):
         """
         Return noise data from a random slice of a real pointed observation.
@@ -520,9 +646,17 @@ class PacsObservation(PacsBase):
         detector_mask = _get_detector_mask(band, detector_bad, policy_detector,
                                            transparent_mode, reject_bad_line)
 
-        # distribute the workload over the processors
+        # distribute the workload over the processors, balanced by the
+        # number of samples of the observations. The number of samples of a
+        # file does not depend on the requested sample range
+        nsamples_all = _read_nsamples(filename)
+        regex = re.compile(r'(.*?)(\[[0-9]*:?[0-9]*\])? *$')
+        nsamples_file = dict((regex.match(f).group(1), n)
+                             for f, n in zip(filename, nsamples_all))
         detector_mask, filename = split_observation(var.mpi_comm, detector_mask,
-                                                    filename)
+                                                    filename, nsamples_all)
+        nsamples_all = np.array([nsamples_file[regex.match(f).group(1)]
+                                 for f in filename], np.int32)
         filename_, nfilenames = _files2tmf(filename)
 
         self.instrument = Instrument('PACS/' + band.capitalize(), detector_mask)
@@ -548,23 +682,23 @@ class PacsObservation(PacsBase):
             [{'red':1, 'green':2, 'blue':3}[band]].data, unit='ms',
             origin='upper')
 
-        # get the observations and detector mask for the current processor
-        nsamples_all, status = tmf.pacs_info_observation_init(filename_,
-            nfilenames)
-        if status != 0: raise RuntimeError()
-
         # frame policy
         policy = MaskPolicy('inscan,turnaround,other,invalid', (policy_inscan,
             policy_turnaround, policy_other, policy_invalid), 'Frame Policy')
 
-        # store observation information
+        # store observation information. The files are read concurrently
+        def read_observation(ifile):
+            result = tmf.pacs_info_observation(filename[ifile], 1,
+                np.array(policy, np.int32), nsamples_all[ifile])
+            if result[-1] != 0: raise RuntimeError()
+            return result[:-1]
+        results = _map_files(read_observation, nfilenames)
         obsid, mode, compression_factor, unit, ra, dec, cam_angle, scan_angle, \
             scan_length, scan_step, scan_nlegs, frame_time, frame_ra, \
             frame_dec, frame_pa, frame_chop, frame_info, frame_masked, \
-            frame_removed, nmasks, mask_name_flat, mask_activated, status = \
-            tmf.pacs_info_observation(filename_, nfilenames,
-                np.array(policy, np.int32),np.sum(nsamples_all))
-        if status != 0: raise RuntimeError()
+            frame_removed, nmasks, mask_name_flat, mask_activated = \
+            [''.join(r) if isinstance(r[0], str) else \
+             np.concatenate(r, axis=-1) for r in zip(*results)]
 
         flen_value = len(unit) // nfilenames
         mode = [mode[i*flen_value:(i+1)*flen_value].strip() \
@@ -615,7 +749,6 @@ class PacsObservation(PacsBase):
                 ('mask_activated', bool, nmasks_max)
                 ])
 
-        regex = re.compile(r'(.*?)(\[[0-9]*:?[0-9]*\])? *$')
         for ifile, file in enumerate(filename):
             match = regex.match(file)
             self.slice[ifile].filename = match.group(1)
@@ -649,8 +782,10 @@ class PacsObservation(PacsBase):
         # store frame policy
         self.policy = policy
 
-        # status
+        # status, which is read column by column when required
         self._status = None
+        self._status_names = None
+        self._status_columns = {}
 
         print(self)
 
@@ -672,6 +807,119 @@ class PacsObservation(PacsBase):
             flatfielding = False
             subtraction_mean = False
 
+        sel_masks = self._get_selected_masks(masks)
+        if len(self.slice) == 1:
+            tod = self._read_tod(self.pointing.removed, flatfielding,
+                                 subtraction_mean, sel_masks,
+                                 self.get_nsamples())
+        else:
+            # the files are read concurrently, each thread copying its slice
+            # in the output timeline
+            nsamples = self.get_nsamples()
+            shape = (self.get_ndetectors(), int(np.sum(nsamples)))
+            tod = Tod.empty(shape, mask=np.empty(shape, np.bool8),
+                            nsamples=nsamples, unit=self.slice[0].unit,
+                            derived_units=self.get_derived_units()[0])
+            blocks = self._get_tod_blocks(None)
+            dest = np.concatenate([[0], np.cumsum(nsamples)])
+            def read_slice(islice):
+                if len(blocks[islice]) == 0:
+                    return
+                index = blocks[islice][0]
+                removed = np.ones(self.pointing.size, np.bool8)
+                removed[index] = False
+                t = self._read_tod(removed, flatfielding, subtraction_mean,
+                                   sel_masks, (index.size,))
+                tod[:,dest[islice]:dest[islice+1]] = t
+                tod.mask[:,dest[islice]:dest[islice+1]] = t.mask
+            _map_files(read_slice, len(self.slice))
+
+        if not raw:
+            tod.inunit(unit)
+
+        return tod
+
+    def iter_tod(self,
+                 chunk_samples=None,
+                 unit='Jy/detector',
+                 flatfielding=True,
+                 subtraction_mean=True,
+                 raw=False,
+                 masks='activated'):
+        """
+        Iterate over the signal and mask timelines by blocks of samples.
+
+        Each block is a Tod of at most chunk_samples samples, which belongs to
+        a single observation. By default, there is one block per observation.
+        The blocks are read one at a time, so that the whole timeline is never
+        held in memory. The keywords are those of get_tod.
+
+        The mean subtraction requires the mean of each detector timeline over
+        the observation. It is computed by a first pass over the blocks, so
+        the data are read twice.
+        """
+
+        if raw:
+            flatfielding = False
+            subtraction_mean = False
+
+        sel_masks = self._get_selected_masks(masks)
+        blocks = self._get_tod_blocks(chunk_samples)
+
+        for slice_blocks in blocks:
+            # the mean of a timeline split in several blocks is computed by a
+            # first pass over the blocks
+            if subtraction_mean and len(slice_blocks) > 1:
+                total = 0
+                n = 0
+                for index in slice_blocks:
+                    tod = self._read_tod_block(index, flatfielding, sel_masks)
+                    total_, n_ = _get_tod_sum(tod)
+                    total += total_
+                    n += n_
+                    del tod
+                mean = total / np.maximum(n, 1)
+            for index in slice_blocks:
+                tod = self._read_tod_block(index, flatfielding, sel_masks)
+                if subtraction_mean:
+                    if len(slice_blocks) == 1:
+                        total, n = _get_tod_sum(tod)
+                        mean = total / np.maximum(n, 1)
+                    tod -= mean[:,np.newaxis]
+                if not raw:
+                    tod.inunit(unit)
+                yield tod
+
+    def _get_tod_blocks(self, chunk_samples):
+        """
+        Return, for each observation, the list of the blocks of at most
+        chunk_samples valid samples, as arrays of pointing indices.
+        """
+        blocks = []
+        dest = 0
+        for slice in self.slice:
+            n = slice.nsamples_all
+            valid = np.where(~self.pointing.removed[dest:dest+n])[0] + dest
+            chunk = chunk_samples or max(valid.size, 1)
+            blocks.append([valid[start:start+chunk]
+                           for start in range(0, valid.size, chunk)])
+            dest += n
+        return blocks
+
+    def _read_tod_block(self, index, flatfielding, sel_masks):
+        """
+        Read the timelines of the pointings of specified indices.
+        """
+        removed = np.ones(self.pointing.size, np.bool8)
+        removed[index] = False
+        return self._read_tod(removed, flatfielding, False, sel_masks,
+                              (index.size,))
+
+    def _get_selected_masks(self, masks):
+        """
+        Return the comma-separated names of the masks to be read.
+        """
+
         act_masks = set([m for slice in self.slice \
                          for i, m in enumerate(slice.mask_name) \
                          if m not in ('','master') and slice.mask_activated[i]])
@@ -709,7 +957,14 @@ class PacsObservation(PacsBase):
             sel_masks -= act_masks
             sel_masks.add('master')
 
-        sel_masks = ','.join(sorted(sel_masks))
+        return ','.join(sorted(sel_masks))
+
+    def _read_tod(self, removed, flatfielding, subtraction_mean, sel_masks,
+                  nsamples):
+        """
+        Read the signal and mask timelines of the pointings which are not
+        removed, in the observation's unit.
+        """
 
         signal, mask, status = tmf.pacs_tod(
             self.instrument.band,
@@ -724,69 +979,57 @@ class PacsObservation(PacsBase):
             np.ascontiguousarray(self.pointing.pa),
             np.ascontiguousarray(self.pointing.chop),
             np.ascontiguousarray(self.pointing.masked, np.int8),
-            np.ascontiguousarray(self.pointing.removed,np.int8),
+            np.ascontiguousarray(removed, np.int8),
             np.asfortranarray(self.instrument.detector_mask, np.int8),
             np.asfortranarray(self.instrument.detector_bad, np.int8),
             np.asfortranarray(self.instrument.flatfield.detector),
             flatfielding,
             subtraction_mean,
-            int(np.sum(self.get_nsamples())),
+            int(np.sum(nsamples)),
             self.get_ndetectors(),
             sel_masks)
         if status != 0: raise RuntimeError()
        
-        tod = Tod(signal.T, 
-                  mask.T,
-                  nsamples=self.get_nsamples(),
-                  unit=self.slice[0].unit,
-                  derived_units=self.get_derived_units()[0],
-                  copy=False)
-
-        if not raw:
-            tod.inunit(unit)
-
-        return tod
+        return Tod(signal.T, 
+                   mask.T,
+                   nsamples=nsamples,
+                   unit=self.slice[0].unit,
+                   derived_units=self.get_derived_units()[0],
+                   copy=False)
 
     @property
     def status(self):
-        if self._status is not None:
-            return self._status
-        
-        status = []
-        for filename in self.slice.filename:
-            hdu = pyfits.open(filename)['STATUS']
-            while True:
-                try:
-                    s = hdu.data
-                    break
-                except IndexError as errmsg:
-                    pass
-            
-            status.append(s.base)
+        if self._status is None:
+            self._status = self.get_status()
+        return self._status
+
+    def _get_status_names(self):
+        if self._status_names is None:
+            self._status_names = _read_status_names(self.slice[0].filename)
+        return self._status_names
+
+    def _get_status_column(self, name):
+        names = self._get_status_names()
+        lnames = [n.lower() for n in names]
+        if name.lower() not in lnames:
+            raise ValueError("The status has no column '" + name + "'. Expec" \
+                             'ted values are ' + strenum(names) + '.')
+        name = names[lnames.index(name.lower())]
+        if name in self._status_columns:
+            return self._status_columns[name]
+
+        columns = _map_files(lambda ifile: _read_status_column(
+            self.slice[ifile].filename, name), len(self.slice))
 
         # check number of records
-        if np.any([len(s) for s in status] != self.slice.nsamples_all):
+        if np.any([len(c) for c in columns] != self.slice.nsamples_all):
             raise ValueError("The status has a number of records '" + \
-                str([len(s) for s in status]) + "' incompatible with that of " \
+                str([len(c) for c in columns]) + "' incompatible with that of "\
                 "the pointings '" + str(self.slice.nsamples_all) + "'.")
 
-        # merge status if necessary
-        if any([status[i].dtype != status[0].dtype \
-                for i in range(1,len(status))]):
-            newdtype = []
-            for d in status[0].dtype.names:
-                newdtype.append((d, max(status, key=lambda s: \
-                                s[d].dtype.itemsize)[d].dtype))
-            self._status = np.recarray(int(np.sum(self.slice.nsamples_all)),
-                                       newdtype)
-            dest = 0
-            for s in status:
-                for n in status[0].dtype.names:
-                    self._status[n][dest:dest+len(s)] = s[n]
-                dest += len(s)
-        else:
-            self._status = np.concatenate(status).view(np.recarray)
-        return self._status
+        column = columns[0] if len(columns) == 1 else np.concatenate(columns)
+        self._status_columns[name] = column
+        return column
 
 
 #-------------------------------------------------------------------------------
@@ -1041,20 +1284,12 @@ def pacs_plot_scan(patterns, title=None, new_figure=True, **kw):
 
     for ifile, file in enumerate(files):
         try:
-            hdu = pyfits.open(file)['STATUS']
+            scans.append((_read_status_column(file, 'RaArray'),
+                           _read_status_column(file, 'DecArray')))
         except Exception as error:
             print("Warning: Cannot extract status from file '" + file + \
                   "': " + str(error))
             continue
-
-        while True:
-            try:
-                status = hdu.data
-                break
-            except IndexError:
-                pass
-
-        scans.append((status.RaArray, status.DecArray))
     
     plot_scan(scans, **kw)
 
@@ -1221,6 +1456,131 @@ def _get_detector_mask(band, detector_bad, policy_detector, transparent,
 #-------------------------------------------------------------------------------
 
 
+def _get_tod_sum(tod):
+    """
+    Return the sum and the number of the unmasked values of each detector
+    timeline.
+    """
+    if tod.mask is None:
+        return np.sum(tod, axis=1).view(np.ndarray), tod.shape[1]
+    valid = tod.mask == 0
+    return np.sum(np.where(valid, tod, 0), axis=1), np.sum(valid, axis=1)
+
+
+#-------------------------------------------------------------------------------
+
+
+def _map_files(function, nfiles):
+    """
+    Return the list of the results of function(ifile), for ifile in
+    range(nfiles). The calls are performed concurrently, in a pool of at most
+    as many threads as the Fortran library uses. The OpenMP threads are shared
+    among the pool threads, so that the total number of threads is not
+    exceeded by the parallel Fortran routines.
+    """
+    nthreads = tmf.info_nthreads()
+    if nfiles <= 1 or nthreads <= 1:
+        return [function(i) for i in range(nfiles)]
+    nworkers = min(nfiles, nthreads)
+    pool = ThreadPool(nworkers, tmf.set_nthreads, (nthreads // nworkers,))
+    try:
+        return pool.map(function, range(nfiles))
+    finally:
+        pool.close()
+        pool.join()
+
+
+#-------------------------------------------------------------------------------
+
+
+def _read_status_names(filename):
+    """
+    Return the column names of the STATUS table of a PACS file.
+    """
+    header = pyfits.getheader(filename, 'STATUS')
+    return tuple(header['TTYPE' + str(i+1)] for i in range(header['TFIELDS']))
+
+
+#-------------------------------------------------------------------------------
+
+
+def _read_status_column(filename, name):
+    """
+    Return a column of the STATUS table of a PACS file. For uncompressed files
+    and unscaled columns of fixed size, the column is memory-mapped instead of
+    being read with the whole table.
+    """
+    fits = pyfits.open(filename)
+    try:
+        iext = fits.index_of('STATUS')
+        header = fits[iext].header
+        names = [header['TTYPE' + str(i+1)] for i in
+                 range(header['TFIELDS'])]
+        icol = names.index(name) + 1
+        dtypes = [_get_status_dtype(header['TFORM' + str(i+1)]) for i in
+                  range(header['TFIELDS'])]
+        if filename.endswith('.gz') or None in dtypes or \
+           'TSCAL' + str(icol) in header or 'TZERO' + str(icol) in header:
+            data = fits[iext].data
+            if data is None:
+                return np.zeros(0, dtypes[icol-1] or float)
+            return np.array(data.field(name))
+        offsets = [0]
+        for d in dtypes[:-1]:
+            offsets.append(offsets[-1] + d.itemsize)
+        dtype = np.dtype({'names':names, 'formats':dtypes, 'offsets':offsets,
+                          'itemsize':header['NAXIS1']})
+        nrecords = header['NAXIS2']
+        if nrecords == 0:
+            return np.zeros(0, dtypes[icol-1])
+        datloc = fits.fileinfo(iext)['datLoc']
+    finally:
+        fits.close()
+    column = np.memmap(filename, dtype, 'r', datloc, nrecords)[name]
+    if header['TFORM' + str(icol)].strip()[-1] == 'L':
+        column = column == 'T'
+    return column
+
+
+#-------------------------------------------------------------------------------
+
+
+def _get_status_dtype(tform):
+    """
+    Return the numpy data type of a FITS binary table column, or None if the
+    column has a variable length.
+    """
+    match = re.match(r' *([0-9]*)([LXBIJKAEDCM])', tform)
+    if match is None:
+        return None
+    repeat = int(match.group(1) or 1)
+    code = match.group(2)
+    if code == 'A':
+        return np.dtype('S' + str(repeat))
+    if code == 'X':
+        return np.dtype(('u1', (repeat + 7) // 8))
+    dtype = {'L':'S1', 'B':'u1', 'I':'>i2', 'J':'>i4', 'K':'>i8', 'E':'>f4',
+             'D':'>f8', 'C':'>c8', 'M':'>c16'}[code]
+    return np.dtype(dtype) if repeat == 1 else np.dtype((dtype, repeat))
+
+
+#-------------------------------------------------------------------------------
+
+
+def _read_nsamples(filename):
+    """
+    Return the number of samples of each of the PACS observation files.
+    """
+    def read(ifile):
+        nsamples, status = tmf.pacs_info_observation_init(filename[ifile], 1)
+        if status != 0: raise RuntimeError()
+        return nsamples[0]
+    return np.array(_map_files(read, len(filename)), np.int32)
+
+
+#-------------------------------------------------------------------------------
+
+
 def _files2tmf(filename):
     nfilenames = len(filename)
     length = max(len(f) for f in filename)
@@ -1233,6 +1593,52 @@ def _files2tmf(filename):
 #-------------------------------------------------------------------------------
 
 
+def _load_pmatrix(cachedir, key):
+    """
+    Return the pointing matrix and its number of pixels per sample stored in
+    the cache directory, or None if it is not cached.
+    The pointing matrix is memory-mapped in copy-on-write mode.
+    """
+    files = glob.glob(os.path.join(cachedir, 'pmatrix_' + key + '_*.npy'))
+    if len(files) == 0:
+        return None
+    filename = files[0]
+    npixels_per_sample = int(os.path.splitext(filename)[0].split('_')[-1])
+    if var.verbose:
+        print("Info: Loading pointing matrix from '" + filename + "'.")
+    return np.load(filename, mmap_mode='c'), npixels_per_sample
+
+def _save_pmatrix(cachedir, key, pmatrix, npixels_per_sample):
+    """
+    Store the pointing matrix in the cache directory. The file is renamed
+    once complete, so that concurrent readers never see partial files.
+    """
+    if not os.path.exists(cachedir):
+        try:
+            os.makedirs(cachedir)
+        except OSError:
+            if not os.path.isdir(cachedir):
+                raise
+    filename = os.path.join(cachedir, 'pmatrix_' + key + '_' + \
+                            str(npixels_per_sample) + '.npy')
+    if os.path.exists(filename):
+        return
+    fd, tmpname = tempfile.mkstemp(suffix='.npy', dir=cachedir)
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            np.save(f, pmatrix)
+        finally:
+            f.close()
+        os.rename(tmpname, filename)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+#-------------------------------------------------------------------------------
+
+
 def _str2fitsheader(string):
     """
     Convert a string into a pyfits.Header object
@@ -1303,7 +1709,7 @@ def _write_status(obs, filename):
         raise ValueError('The pointing and slice attribute are incompatible. ' \
                          'This should not happen.')
 
-    status = obs.status[~obs.pointing.removed]
+    status = obs.get_status(index=~obs.pointing.removed)
 
     fits = pyfits.HDUList()
 
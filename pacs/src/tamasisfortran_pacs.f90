@@ -605,7 +605,7 @@ end subroutine pacs_tod
 subroutine pacs_pointing_matrix(band, nslices, nvalids, npointings, nsamples_tot, compression_factor, delay, fine_sampling_factor, &
                                 oversampling, time, ra, dec, pa, chop, masked, removed, method, detector_mask, nrows, ncolumns,    &
                                 ndetectors, detector_center, detector_corner, detector_area, distortion_yz, npixels_per_sample,    &
-                                header, pmatrix, new_npixels_per_sample, status)
+                                header, verbose, pmatrix, new_npixels_per_sample, status)
 
     use iso_fortran_env,        only : ERROR_UNIT
     use module_fitstools,       only : ft_read_keyword
@@ -643,6 +643,7 @@ subroutine pacs_pointing_matrix(band, nslices, nvalids, npointings, nsamples_tot
     !f2py intent(in)                               :: distortion_yz(2,3,3,3)
     !f2py intent(in)                               :: npixels_per_sample
     !f2py intent(in)                               :: header
+    !f2py intent(in)                               :: verbose
     !f2py integer*8, intent(inout),depend(npixels_per_sample,nvalids,ndetectors) :: pmatrix(npixels_per_sample*nvalids*ndetectors)
     !f2py intent(out)                              :: new_npixels_per_sample
     !f2py intent(out)                              :: status
@@ -669,6 +670,7 @@ subroutine pacs_pointing_matrix(band, nslices, nvalids, npointings, nsamples_tot
     real(p), intent(in)                            :: distortion_yz(2,3,3,3)
     integer, intent(in)                            :: npixels_per_sample
     character(len=*), intent(in)                   :: header
+    logical, intent(in)                            :: verbose
     type(PointingElement), intent(inout)           :: pmatrix(npixels_per_sample,nvalids,ndetectors)
     integer, intent(out)                           :: new_npixels_per_sample
     integer, intent(out)                           :: status
@@ -732,7 +734,7 @@ subroutine pacs_pointing_matrix(band, nslices, nvalids, npointings, nsamples_tot
     end select
 
     ! compute the projector
-    call pacs%compute_projection(method_, obs, oversampling, header, nx, ny, pmatrix, new_npixels_per_sample, status)
+    call pacs%compute_projection(method_, obs, oversampling, header, nx, ny, pmatrix, new_npixels_per_sample, status, verbose)
 
 end subroutine pacs_pointing_matrix
 
@@ -53,3 +53,13 @@ if profile is None:
     print(map_iter2.header['time'])
     if map_iter2.header['NITER'] > 11:
         raise TestFailure()
+
+# block-Jacobi preconditioner
+map_iter3 = mapper_ls(tod, model,
+                      unpacking=Masking(map_mask),
+                      tol=1.e-4,
+                      maxiter=300,
+                      M=projection.get_preconditioner(weight=tod.mask == 0),
+                      callback=Callback())
+if map_iter3.header['NITER'] > map_iter2.header['NITER']:
+    raise TestFailure()
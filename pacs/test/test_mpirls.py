@@ -52,3 +52,16 @@ if profile is None:
         raise TestFailure()
 
 if any_neq(map_ref, map_iter, 1.e-8): raise TestFailure()
+
+# pipelined conjugate gradient, on the map pixels owned by each processor
+map_pcg = mapper_rls(tod, model, hyper=1., tol=1.e-8, callback=Callback(),
+                     solver='pcg')
+map_pipecg = mapper_rls(tod, model, hyper=1., tol=1.e-8, callback=Callback(),
+                        solver='pipecg')
+if any_neq(map_pcg, map_pipecg, 1.e-5): raise TestFailure('pipecg')
+map_pipecg = mapper_rls(tod, model, hyper=0., tol=1.e-8, callback=Callback(),
+                        solver='pipecg', M=1/map_naive.coverage)
+map_pcg = mapper_rls(tod, model, hyper=0., tol=1.e-8, callback=Callback(),
+                     solver='pcg', M=1/map_naive.coverage)
+cov = map_naive.coverage > 0
+if any_neq(map_pcg[cov], map_pipecg[cov], 1.e-5): raise TestFailure('pipecg, M')
@@ -1,7 +1,9 @@
 import numpy as np
 import pyfits
 import os
+import shutil
 import tamasis
+import tempfile
 
 from tamasis import *
 from uuid import uuid1
@@ -35,6 +37,14 @@ for field in obs.status.dtype.names:
 if not np.allclose(tod, tod2): raise TestFailure()
 if not np.all(tod.mask == tod2.mask): raise TestFailure()
 
+# lazy status columns
+obs = PacsObservation(data_dir+'frames_blue.fits')
+status = obs.get_status(('RaArray', 'DecArray'))
+if status.dtype.names != ('RaArray', 'DecArray'): raise TestFailure()
+if len(obs._status_columns) != 2: raise TestFailure()
+if np.any(obs.get_status('raarray', slice(10,20)).raarray != \
+          obs.status.RaArray[10:20]): raise TestFailure()
+
 # all observation
 obs = PacsObservation(data_dir+'frames_blue.fits')
 tod = obs.get_tod()
@@ -56,6 +66,26 @@ for field in obs.status.dtype.names:
 if not np.allclose(tod, tod2): raise TestFailure()
 if not np.all(tod.mask == tod2.mask): raise TestFailure()
 
+# iterate over blocks of samples
+for chunk_samples in (None, 7):
+    blocks = list(obs.iter_tod(chunk_samples=chunk_samples))
+    if chunk_samples is not None and \
+       any([b.shape[1] > chunk_samples for b in blocks]): raise TestFailure()
+    if not np.allclose(np.hstack(blocks), tod): raise TestFailure()
+    if not np.all(np.hstack([b.mask for b in blocks]) == tod.mask):
+        raise TestFailure()
+
+# several files, read concurrently
+obs2 = PacsObservation([data_dir+'frames_blue.fits[1:100]',
+                        data_dir+'frames_blue.fits[101:]'])
+if np.sum(obs2.get_nsamples()) != np.sum(obs.get_nsamples()):
+    raise TestFailure()
+tod2 = obs2.get_tod(subtraction_mean=False)
+tod3 = obs.get_tod(subtraction_mean=False)
+if not np.allclose(tod2, tod3): raise TestFailure()
+if not np.all(tod2.mask == tod3.mask): raise TestFailure()
+if len(obs2.status) != len(obs.status): raise TestFailure()
+
 telescope    = Identity(description='Telescope PSF')
 projection   = Projection(obs, resolution=3.2, oversampling=False, npixels_per_sample=6)
 multiplexing = CompressionAverage(obs.instrument.fine_sampling_factor, description='Multiplexing')
@@ -84,6 +114,53 @@ map_naive2.inunit('Jy/arcsec^2')
 map_naive3 = map_naive2[:,250:header['NAXIS1']+250]
 if any_neq(map_naive, map_naive3, 2.e-7): raise TestFailure('mapper_naive, with custom header')
 
+# pointing matrix cache
+cachedir = tempfile.mkdtemp()
+try:
+    projection_cached = Projection(obs, header=header2, oversampling=False, cachedir=cachedir)
+    if len(os.listdir(cachedir)) != 1: raise TestFailure('pmatrix cache: not stored')
+    projection_cached2 = Projection(obs, header=header2, oversampling=False, cachedir=cachedir)
+    if projection_cached2.npixels_per_sample != projection2.npixels_per_sample: raise TestFailure('pmatrix cache: npixels_per_sample')
+    if np.any(projection_cached2._pmatrix != projection2._pmatrix): raise TestFailure('pmatrix cache: reload')
+    obs.pointing.ra[0] += 1./3600
+    projection_cached3 = Projection(obs, header=header2, oversampling=False, cachedir=cachedir)
+    obs.pointing.ra[0] -= 1./3600
+    if len(os.listdir(cachedir)) != 2: raise TestFailure('pmatrix cache: key')
+finally:
+    shutil.rmtree(cachedir)
+
+# deglitching index
+index = DeglitchIndex(projection2)
+for method, deglitch in (('std', deglitch_l2std), ('mad', deglitch_l2mad)):
+    mask = deglitch(tod, projection2, 3.)
+    if np.any(index.deglitch(tod, 3., method) != mask):
+        raise TestFailure('deglitching index: ' + method)
+    if np.any(deglitch(tod, index, 3.) != mask):
+        raise TestFailure('deglitching index: ' + method + ' function')
+
+tod_glitch = tod.copy()
+tod_glitch.mask = None
+mask = None
+for i in range(20):
+    tod_glitch.mask = mask
+    mask = index.deglitch(tod_glitch, 3.)
+    if tod_glitch.mask is not None and np.all(mask == tod_glitch.mask): break
+mask_iter, counts = index.deglitch_iterative(tod, 3.)
+if np.any(mask_iter != mask) or counts[-1] != 0 or len(counts) != i + 1 or \
+   np.sum(counts) != np.sum(mask) - np.sum(tod.mask):
+    raise TestFailure('deglitching index: iterative')
+
+# compressed pointing matrix
+projection_compressed = Projection(obs, header=header2, oversampling=False, storage='compressed')
+if any_neq(projection_compressed(map_naive2), projection2(map_naive2), 1.e-4): raise TestFailure('compressed pmatrix: direct')
+if any_neq(projection_compressed.T(tod), projection2.T(tod), 1.e-4): raise TestFailure('compressed pmatrix: transpose')
+try:
+    deglitch_l2mad(tod, projection_compressed)
+except ValueError:
+    pass
+else:
+    raise TestFailure('compressed pmatrix: deglitching')
+
 # test compatibility with photproject
 tod = obs.get_tod('Jy/arcsec^2', flatfielding=False, subtraction_mean=False)
 map_naive4 = mapper_naive(tod, projection)
@@ -104,6 +181,26 @@ model = masking * projection
 map_naive = mapper_naive(tod, model)
 if any_neq(map_naive, map_naive_ref, 1.e-11): raise TestFailure()
 
+normal = ProjectionNormal(projection, tod.mask == 0)
+if any_neq(normal(map_naive), (model.T * model)(map_naive), 1.e-11): raise TestFailure('fused normal operator')
+normal_sp = ProjectionNormal(projection, tod.mask == 0, weight_dtype=np.float32)
+if normal_sp.weight.dtype != np.float32: raise TestFailure('fused normal operator: single precision weight')
+if any_neq(normal_sp(map_naive), normal(map_naive), 1.e-11): raise TestFailure('fused normal operator: mixed precision')
+
+projection_onthefly = Projection(obs, header=map_naive_ref.header, oversampling=False, npixels_per_sample=6, storage='onthefly')
+if any_neq(projection_onthefly(map_naive), projection(map_naive), 1.e-11): raise TestFailure('onthefly pmatrix: direct')
+if any_neq(projection_onthefly.T(tod), projection.T(tod), 1.e-11): raise TestFailure('onthefly pmatrix: transpose')
+
+# batch application
+maps = np.array([map_naive, 2 * map_naive, map_naive**2])
+tods = np.array([tod, -tod, 3 * tod])
+for p in (projection, projection_onthefly, model):
+    tods_batch = p.direct_batch(maps)
+    maps_batch = p.T.direct_batch(tods)
+    for i in range(3):
+        if any_neq(tods_batch[i], p(maps[i]), 1.e-11): raise TestFailure('batch: direct')
+        if any_neq(maps_batch[i], p.T(tods[i]), 1.e-11): raise TestFailure('batch: transpose')
+
 obs_rem = PacsObservation(data_dir + 'frames_blue.fits', policy_detector='remove')
 obs_rem.pointing.chop[:] = 0
 projection_rem = Projection(obs_rem, header=map_naive.header, oversampling=False, npixels_per_sample=7)
@@ -1,3 +1,4 @@
+import numpy as np
 import os
 import scipy
 import tamasis
@@ -48,3 +49,21 @@ cov = ref.coverage > 80
 if any_neq(ref[cov], map_iter[cov], 1.e-1): raise TestFailure()
 cov = ref.coverage > 125
 if any_neq(ref[cov], map_iter[cov], 1.e-2): raise TestFailure()
+
+# mixed precision: single precision timelines and weight
+map_iter = mapper_rls(tod.astype(np.float32), model, hyper=1., tol=1.e-4,
+                      callback=Callback(), solver=cgs, mixed_precision=True)
+if map_iter.header['NITER'] > 48: raise TestFailure('mixed precision: niter')
+cov = ref.coverage > 80
+if any_neq(ref[cov], map_iter[cov], 1.e-1): raise TestFailure('mixed precision')
+cov = ref.coverage > 125
+if any_neq(ref[cov], map_iter[cov], 1.e-2): raise TestFailure('mixed precision')
+
+# pipelined conjugate gradient
+map_pcg = mapper_rls(tod, model, hyper=1., tol=1.e-8, callback=Callback(),
+                     solver='pcg')
+map_pipecg = mapper_rls(tod, model, hyper=1., tol=1.e-8, callback=Callback(),
+                        solver='pipecg')
+if map_pipecg.header['SOLVER'] != 'pipecg': raise TestFailure('pipecg: solver')
+cov = ref.coverage > 80
+if any_neq(map_pcg[cov], map_pipecg[cov], 1.e-5): raise TestFailure('pipecg')